@@ -1,9 +1,53 @@
+import os
 import sys
 from clickhouse_migrator.config import ConfigManager
 from clickhouse_migrator.orchestrator import MigrationOrchestrator
 
+def run_history(argv):
+    """history子命令：导入迁移报告并输出吞吐趋势"""
+    from clickhouse_migrator.services.history import HistoryService
+    from clickhouse_migrator.utils.progress import format_bytes
+
+    args = ConfigManager().parse_history_args(argv)
+    history_service = HistoryService(args.history_db)
+    try:
+        if os.path.isdir(args.report_path):
+            history_service.ingest_directory(args.report_path)
+        rows = history_service.query_trends(args.by, host=args.host, db=args.db, table=args.table, limit=args.limit)
+    finally:
+        history_service.close()
+    if not rows:
+        print("暂无历史记录")
+        return
+    print(f"{args.by:<40} {'运行':<48} {'分区数':>8} {'数据量':>12} {'耗时(秒)':>10} {'吞吐':>14}")
+    for row in rows:
+        rate = f"{format_bytes(row['bytes_per_second'])}/s" if row["bytes_per_second"] else "--"
+        print(
+            f"{str(row[args.by]):<40} {row['run_id']:<48} {row['partitions']:>8} "
+            f"{format_bytes(row['bytes'] or 0):>12} {row['seconds']:>10} {rate:>14}"
+        )
+
+def run_serve(argv):
+    """serve子命令：启动迁移守护进程，经本地HTTP接口接收迁移任务"""
+    from clickhouse_migrator.daemon import MigrationDaemon
+
+    config_manager = ConfigManager()
+    args = config_manager.parse_serve_args(argv)
+    config = config_manager.get_final_config(args)
+    daemon = MigrationDaemon(config, args.listen_port, args.listen_host, args.job_concurrency)
+    sys.exit(0 if daemon.serve() else 1)
+
 def main():
     """主入口函数"""
+    # history子命令
+    if len(sys.argv) > 1 and sys.argv[1] == "history":
+        run_history(sys.argv[2:])
+        return
+    # serve子命令（守护进程）
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        run_serve(sys.argv[2:])
+        return
+
     # 解析命令行参数
     config_manager = ConfigManager()
     args = config_manager.parse_args()
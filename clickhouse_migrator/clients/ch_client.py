@@ -1,11 +1,17 @@
 import clickhouse_connect
-from typing import Optional
+from typing import Dict, Optional
 
 class CHClientManager:
     """ClickHouse客户端管理器"""
     
     def __init__(self):
         self.client = None
+        self.extra_clients = []
+        self.connection_params = {}
+        # 负载隔离会话设置（设置配置文件展开后的设置、priority、workload），应用于主连接与迁移连接
+        self.session_settings = {}
+        # 服务端并发查询上限（--max-server-queries），设置后迁移连接的每个查询占用一个槽位
+        self.query_slots = None
     
     def create_client(self, host: str, port: int, user: str, password: str) -> clickhouse_connect.driver.client.Client:
         """创建ClickHouse客户端连接"""
@@ -20,10 +26,113 @@ class CHClientManager:
             # 验证连接
             client.query("SELECT 1")
             self.client = client
+            self.connection_params = {"host": host, "port": port, "user": user, "password": password}
             return client
         except Exception as e:
             raise RuntimeError(f"ClickHouse连接失败：{str(e)}")
     
+    def create_extra_client(self, isolated: bool = True) -> clickhouse_connect.driver.client.Client:
+        """
+        基于主连接参数创建额外的独立连接（独立会话，可与主连接并发执行查询）
+        须先调用create_client
+        :param isolated: 是否应用负载隔离会话设置（监控连接不应用，保证轮询与终止查询不被降级）
+        """
+        if not self.connection_params:
+            raise RuntimeError("尚未创建主连接，无法创建额外连接")
+        params = self.connection_params
+        try:
+            client = clickhouse_connect.get_client(
+                host=params["host"],
+                port=params["port"],
+                username=params["user"],
+                password=params["password"],
+                secure=False,
+                settings=dict(self.session_settings) if isolated and self.session_settings else None
+            )
+            self.extra_clients.append(client)
+            return self.limit_queries(client) if isolated else client
+        except Exception as e:
+            raise RuntimeError(f"ClickHouse连接失败：{str(e)}")
+    
+    def limit_queries(self, client):
+        """未设置服务端并发查询上限时返回原连接，否则返回按查询占用槽位的连接"""
+        if self.query_slots is None:
+            return client
+        from clickhouse_migrator.clients.pool import SlotLimitedClient
+        return SlotLimitedClient(client, self.query_slots)
+
+    def get_profile_settings(self, client, profile: str, visited: Optional[set] = None) -> Dict:
+        """展开设置配置文件（含继承的配置文件）中的设置值，子配置文件覆盖父配置文件"""
+        visited = visited if visited is not None else set()
+        if profile in visited:
+            return {}
+        visited.add(profile)
+        result = client.query(f"""
+            SELECT setting_name, value, inherit_profile
+            FROM system.settings_profile_elements
+            WHERE profile_name = '{profile}'
+            ORDER BY index
+        """)
+        settings = {}
+        for setting_name, value, inherit_profile in result.result_rows:
+            if inherit_profile:
+                settings.update(self.get_profile_settings(client, inherit_profile, visited))
+            elif setting_name and value is not None:
+                settings[setting_name] = value
+        return settings
+
+    def check_workload(self, client: clickhouse_connect.driver.client.Client, config: Dict, logger) -> Optional[Dict]:
+        """
+        检查负载隔离配置（设置配置文件、查询优先级、工作负载）并生成迁移连接的会话设置
+        :return: 会话设置，检查失败返回None
+        """
+        settings = {}
+        try:
+            profile = config.get("settings_profile")
+            if profile:
+                exists = client.query(f"SELECT count() FROM system.settings_profiles WHERE name = '{profile}'")
+                if not exists.result_rows[0][0]:
+                    all_profiles = client.query("SELECT name FROM system.settings_profiles").result_rows
+                    logger.error(f"设置配置文件{profile}不存在！当前可用配置文件：{[p[0] for p in all_profiles]}")
+                    return None
+                settings.update(self.get_profile_settings(client, profile))
+            if config.get("query_priority"):
+                settings["priority"] = int(config["query_priority"])
+            workload = config.get("workload")
+            if workload:
+                try:
+                    exists = client.query(f"SELECT count() FROM system.workloads WHERE name = '{workload}'")
+                except Exception as e:
+                    logger.error(f"当前ClickHouse版本不支持工作负载调度（system.workloads）：{str(e)}")
+                    return None
+                if not exists.result_rows[0][0]:
+                    logger.error(f"工作负载{workload}不存在！请先执行CREATE WORKLOAD创建")
+                    return None
+                settings["workload"] = workload
+
+            # 校验所有设置均为服务端可识别的查询级设置
+            if settings:
+                name_list = ", ".join(f"'{name}'" for name in settings)
+                known = {row[0] for row in client.query(
+                    f"SELECT name FROM system.settings WHERE name IN ({name_list})"
+                ).result_rows}
+                unknown = sorted(set(settings) - known)
+                if unknown:
+                    logger.error(f"负载隔离设置{unknown}不是查询级设置，无法应用到迁移连接")
+                    return None
+            logger.info(f"负载隔离检查通过，迁移查询使用会话设置：{settings}")
+            return settings
+        except Exception as e:
+            logger.error(f"检查负载隔离配置失败：{str(e)}")
+            return None
+
+    def apply_session_settings(self, settings: Dict):
+        """为主连接及之后创建的迁移连接应用负载隔离会话设置"""
+        self.session_settings = dict(settings)
+        if self.client:
+            for name, value in self.session_settings.items():
+                self.client.set_client_setting(name, value)
+
     def check_s3_policy(self, client: clickhouse_connect.driver.client.Client, s3_policy: str, logger) -> bool:
         """检查S3存储策略是否存在且可用"""
         import time
@@ -78,5 +187,11 @@ class CHClientManager:
     
     def close(self):
         """关闭客户端连接"""
+        for client in self.extra_clients:
+            try:
+                client.close()
+            except Exception:
+                pass
+        self.extra_clients = []
         if self.client:
             self.client.close()
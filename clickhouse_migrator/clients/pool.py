@@ -0,0 +1,124 @@
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+# 等待连接池空闲连接的默认超时时间（秒）；连接池按全部并发来源计算大小，正常情况下不会长时间等待
+DEFAULT_ACQUIRE_TIMEOUT = 1800
+
+def get_pool_size(config: Dict) -> int:
+    """
+    按全部并发来源计算连接池大小（协调器建池与运行控制器在线调整共用）：
+    迁移工作线程、OPTIMIZE、预热、并发校验各自需要的连接数，守护进程中每个执行中的任务再占用一个连接；
+    守护进程的任务可以单独开启预热或校验，因此守护进程中始终为二者预留连接
+    --max-server-queries由查询槽位限制，不影响连接池大小
+    """
+    daemon = bool(config.get("job_concurrency"))
+    size = int(config["workers"]) + int(config.get("optimize_concurrency", 1))
+    if config.get("prewarm") or daemon:
+        size += int(config.get("prewarm_concurrency", 0))
+    if config.get("mode") == "verify" or daemon:
+        size += int(config.get("verify_concurrency", 0))
+    return size + int(config.get("job_concurrency", 0))
+
+class QuerySlots:
+    """
+    服务端并发查询上限（--max-server-queries）：只在单个服务端查询执行期间占用槽位，
+    持有连接等待其他任务（如等待OPTIMIZE、预热、子任务）时不占用，因此不会因嵌套租用连接而死锁
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, int(limit))
+        self._semaphore = threading.Semaphore(self.limit)
+
+    @contextmanager
+    def slot(self):
+        """以上下文方式占用一个查询槽位，达到上限时阻塞到有查询结束"""
+        self._semaphore.acquire()
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+class SlotLimitedClient:
+    """为ClickHouse连接的每个服务端查询占用QuerySlots槽位，其余属性与方法直接转发给原连接"""
+
+    def __init__(self, client, query_slots: QuerySlots):
+        self.client = client
+        self.query_slots = query_slots
+
+    def query(self, *args, **kwargs):
+        with self.query_slots.slot():
+            return self.client.query(*args, **kwargs)
+
+    def command(self, *args, **kwargs):
+        with self.query_slots.slot():
+            return self.client.command(*args, **kwargs)
+
+    def insert(self, *args, **kwargs):
+        with self.query_slots.slot():
+            return self.client.insert(*args, **kwargs)
+
+    @contextmanager
+    def query_row_block_stream(self, *args, **kwargs):
+        """流式查询在整个遍历期间占用槽位"""
+        with self.query_slots.slot():
+            with self.client.query_row_block_stream(*args, **kwargs) as stream:
+                yield stream
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+class CHClientPool:
+    """ClickHouse连接池：按需创建独立连接，最多size个，用于并发执行服务端查询"""
+
+    def __init__(self, client_manager, size: int):
+        """
+        :param client_manager: CHClientManager实例（需已创建主连接）
+        :param size: 连接池大小，即本进程并发服务端查询的上限
+        """
+        self.client_manager = client_manager
+        self.size = max(1, int(size))
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def resize(self, size: int):
+        """调整连接池上限（缩小时已创建的连接保留，仅不再新建）"""
+        with self._lock:
+            self.size = max(1, int(size))
+
+    def acquire(self, timeout: float = DEFAULT_ACQUIRE_TIMEOUT):
+        """获取连接，池中无空闲连接且已达上限时等待，超时抛出RuntimeError"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self.client_manager.create_extra_client()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise RuntimeError(
+                f"等待连接池空闲连接超时（{timeout}秒，连接池大小：{self.size}），"
+                f"请检查是否有任务在持有连接的同时等待其他连接"
+            )
+
+    def release(self, client):
+        """归还连接"""
+        self._idle.put(client)
+
+    @contextmanager
+    def lease(self, timeout: float = DEFAULT_ACQUIRE_TIMEOUT):
+        """以上下文方式租用连接"""
+        client = self.acquire(timeout)
+        try:
+            yield client
+        finally:
+            self.release(client)
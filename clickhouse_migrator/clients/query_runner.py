@@ -0,0 +1,198 @@
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from clickhouse_migrator.utils.progress import format_bytes
+
+# 查询ID前缀，便于在system.processes/system.query_log中识别迁移工具发起的查询
+QUERY_ID_PREFIX = "ch_migrator"
+
+class AsyncQueryRunner:
+    """长查询异步执行器：以固定query_id提交，轮询服务端进度，支持断线重连与取消"""
+
+    def __init__(self, monitor_client, poll_interval: float = 5.0, timeout: float = 0):
+        """
+        :param monitor_client: 独立的监控连接（用于轮询system.processes和KILL QUERY）
+        :param poll_interval: 进度轮询间隔（秒）
+        :param timeout: 单个查询的超时时间（秒），0表示不限制
+        """
+        self.monitor_client = monitor_client
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._running = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def build_query_id(*parts) -> str:
+        """
+        根据操作标识生成确定性的query_id（同一操作多次运行得到相同ID，用于断线后重新挂载）
+        :param parts: 操作标识，如('insert', db, table, partition)
+        """
+        digest = hashlib.md5("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+        return f"{QUERY_ID_PREFIX}_{parts[0]}_{digest[:24]}"
+
+    def get_query_status(self, query_id: str) -> Optional[Dict]:
+        """从system.processes获取查询的实时状态，查询已结束时返回None"""
+        with self._lock:
+            result = self.monitor_client.query(f"""
+                SELECT elapsed, read_rows, read_bytes, written_rows, written_bytes, total_rows_approx
+                FROM system.processes
+                WHERE query_id = '{query_id}'
+            """)
+        if not result.result_rows:
+            return None
+        row = result.result_rows[0]
+        return {
+            "elapsed": float(row[0]),
+            "read_rows": int(row[1]),
+            "read_bytes": int(row[2]),
+            "written_rows": int(row[3]),
+            "written_bytes": int(row[4]),
+            "total_rows_approx": int(row[5])
+        }
+
+    def get_server_time(self) -> str:
+        """服务端当前时间（微秒精度），用于限定system.query_log的查找范围"""
+        with self._lock:
+            return str(self.monitor_client.query("SELECT toString(now64(6))").result_rows[0][0])
+
+    def get_finished_status(self, query_id: str, since: Optional[str] = None) -> Optional[Dict]:
+        """
+        从system.query_log获取已结束查询的最终状态，未找到时返回None
+        :param since: 服务端时间（get_server_time），只查找此后结束的记录：按分区裁剪扫描范围，
+                      并排除同一确定性query_id在以往运行或重试中留下的记录
+        """
+        time_filter = ""
+        if since:
+            time_filter = f" AND event_date >= toDate('{since}') AND event_time_microseconds >= toDateTime64('{since}', 6)"
+        with self._lock:
+            try:
+                self.monitor_client.command("SYSTEM FLUSH LOGS")
+            except Exception:
+                # 无SYSTEM FLUSH LOGS权限时直接查询（可能存在数秒延迟）
+                pass
+            result = self.monitor_client.query(f"""
+                SELECT type, exception, query_duration_ms, written_rows, written_bytes
+                FROM system.query_log
+                WHERE query_id = '{query_id}' AND type != 'QueryStart'{time_filter}
+                ORDER BY event_time_microseconds DESC
+                LIMIT 1
+            """)
+        if not result.result_rows:
+            return None
+        row = result.result_rows[0]
+        return {
+            "type": str(row[0]),
+            "exception": row[1],
+            "duration_ms": int(row[2]),
+            "written_rows": int(row[3]),
+            "written_bytes": int(row[4])
+        }
+
+    def kill_query(self, query_id: str, logger):
+        """终止服务端查询（KILL QUERY ... SYNC）"""
+        try:
+            with self._lock:
+                self.monitor_client.command(f"KILL QUERY WHERE query_id = '{query_id}' SYNC")
+            logger.warning(f"已终止服务端查询：{query_id}")
+        except Exception as e:
+            logger.error(f"终止服务端查询{query_id}失败：{str(e)}")
+
+    def cancel_all(self, logger):
+        """终止所有仍在运行的查询（用于进程退出或异常中断）"""
+        with self._lock:
+            running = list(self._running.keys())
+        for query_id in running:
+            self.kill_query(query_id, logger)
+
+    def execute(self, client, sql: str, query_id: str, logger, settings: Optional[Dict] = None, label: str = "",
+                on_progress: Optional[Callable[[Dict], None]] = None):
+        """
+        以指定query_id异步提交SQL并等待完成
+        - 服务端已有相同query_id的查询在运行时，直接挂载等待，不重复提交；
+        - 客户端连接中断（如HTTP超时）但服务端查询仍在运行时，继续轮询直至结束；
+        - 超时、Ctrl-C或进程退出时执行KILL QUERY。
+        :param label: 日志中展示的操作描述
+        :param on_progress: 每次轮询到服务端进度时的回调，参数为get_query_status的返回值
+        """
+        label = label or query_id
+        since = self.get_server_time()
+        if self.get_query_status(query_id) is not None:
+            logger.warning(f"{label}：服务端查询{query_id}仍在运行，重新挂载等待其完成")
+            self._wait(query_id, None, {}, logger, label, on_progress)
+            self._check_finished(query_id, None, logger, label, since)
+            return
+
+        state = {"error": None}
+        query_settings = dict(settings or {})
+        query_settings["query_id"] = query_id
+
+        def submit():
+            try:
+                client.command(sql, settings=query_settings)
+            except Exception as e:
+                state["error"] = e
+
+        worker = threading.Thread(target=submit, name=f"query-{query_id}", daemon=True)
+        worker.start()
+        self._wait(query_id, worker, state, logger, label, on_progress)
+        if state["error"] is not None:
+            self._check_finished(query_id, state["error"], logger, label, since)
+
+    def _wait(self, query_id: str, worker: Optional[threading.Thread], state: Dict, logger, label: str,
+              on_progress: Optional[Callable[[Dict], None]] = None):
+        """轮询等待查询结束，期间输出读写进度和吞吐"""
+        with self._lock:
+            self._running[query_id] = label
+        start_time = time.time()
+        try:
+            while True:
+                if worker is not None:
+                    worker.join(self.poll_interval)
+                status = self.get_query_status(query_id)
+                if status is None:
+                    # 服务端查询已结束（或尚未开始且客户端已返回）
+                    if worker is None or not worker.is_alive():
+                        break
+                elif worker is not None and not worker.is_alive() and state.get("error") is not None:
+                    logger.warning(f"{label}：客户端连接中断（{state['error']}），服务端查询仍在运行，继续等待")
+                    worker = None
+
+                if status is not None:
+                    if on_progress is not None:
+                        on_progress(status)
+                    elapsed = status["elapsed"] or 0.001
+                    logger.info(
+                        f"{label}：已运行{elapsed:.0f}秒，读取{status['read_rows']}/{status['total_rows_approx']}行，"
+                        f"写入{status['written_rows']}行（{format_bytes(status['written_bytes'])}），"
+                        f"写入速率{format_bytes(status['written_bytes'] / elapsed)}/s"
+                    )
+
+                if self.timeout and time.time() - start_time > self.timeout:
+                    self.kill_query(query_id, logger)
+                    raise RuntimeError(f"{label}执行超时（超过{self.timeout}秒），已终止服务端查询{query_id}")
+
+                if worker is None:
+                    time.sleep(self.poll_interval)
+        except (KeyboardInterrupt, SystemExit):
+            logger.warning(f"{label}：收到中断信号，正在终止服务端查询{query_id}")
+            self.kill_query(query_id, logger)
+            raise
+        finally:
+            with self._lock:
+                self._running.pop(query_id, None)
+
+    def _check_finished(self, query_id: str, error: Optional[Exception], logger, label: str,
+                        since: Optional[str] = None):
+        """根据system.query_log确认查询最终结果（只看since之后结束的记录），失败时抛出异常"""
+        finished = self.get_finished_status(query_id, since)
+        if finished is not None and finished["type"] == "QueryFinish":
+            if error is not None:
+                logger.warning(f"{label}：客户端连接中断，但服务端查询{query_id}已成功完成")
+            return
+        if finished is not None and finished["exception"]:
+            raise RuntimeError(f"{label}执行失败：{finished['exception']}")
+        if error is not None:
+            raise RuntimeError(f"{label}执行失败：{str(error)}")
+        raise RuntimeError(f"{label}：无法确认服务端查询{query_id}的执行结果")
@@ -1,7 +1,21 @@
 import argparse
 import os
 import yaml
-from typing import Dict, Optional
+
+from clickhouse_migrator.services.benchmark import (
+    DEFAULT_BENCHMARK_RUNS, DEFAULT_BENCHMARK_QUERIES, DEFAULT_BENCHMARK_LOOKBACK_HOURS, DEFAULT_REGRESSION_RATIO
+)
+from clickhouse_migrator.services.prewarm import (
+    DEFAULT_PREWARM_PARTITIONS, DEFAULT_PREWARM_CONCURRENCY, DEFAULT_PREWARM_LOOKBACK_HOURS
+)
+from clickhouse_migrator.services.heat import DEFAULT_HEAT_LOOKBACK_HOURS
+from clickhouse_migrator.services.partition import DEFAULT_BUSY_PARTITION_MAX_WAIT
+from clickhouse_migrator.services.history import DEFAULT_HISTORY_DB, HISTORY_GROUP_COLUMNS
+from clickhouse_migrator.services.metadata_cache import DEFAULT_METADATA_CACHE
+from clickhouse_migrator.services.verify import DEFAULT_VERIFY_CONCURRENCY, DEFAULT_VERIFY_MAX_THREADS
+from clickhouse_migrator.utils.control import DEFAULT_CONTROL_FILE
+from clickhouse_migrator.utils.job_server import DEFAULT_DAEMON_HOST, DEFAULT_DAEMON_PORT, DEFAULT_JOB_CONCURRENCY
+from typing import Dict, List, Optional
 
 DEFAULT_S3_POLICY = "s3"
 DEFAULT_INSERT_INTERVAL = 1
@@ -11,6 +25,19 @@ DEFAULT_HOST = "127.0.0.1"
 DEFAULT_PORT = 8123
 DEFAULT_USER = "default"
 DEFAULT_PASSWORD = ""
+DEFAULT_QUERY_TIMEOUT = 0
+DEFAULT_POLL_INTERVAL = 5.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BASE_DELAY = 2.0
+DEFAULT_RETRY_MAX_DELAY = 60.0
+DEFAULT_COMPRESS_BLOCK_PROFILE = "none"
+DEFAULT_PART_LAYOUT_PROFILE = "none"
+DEFAULT_OPTIMIZE_MODE = "none"
+DEFAULT_OPTIMIZE_CONCURRENCY = 2
+DEFAULT_MATERIALIZE_CONCURRENCY = 2
+DEFAULT_WORKERS = 1
+DEFAULT_BANDWIDTH_LIMIT = 0
+DEFAULT_STATUS_PORT = 0
 
 class ConfigManager:
     """配置管理器"""
@@ -18,9 +45,13 @@ class ConfigManager:
     def __init__(self):
         self.config = {}
     
-    def parse_args(self) -> argparse.Namespace:
-        """解析命令行参数"""
+    def build_parser(self, serve: bool = False) -> argparse.ArgumentParser:
+        """
+        构建迁移参数解析器
+        :param serve: 用于serve子命令（复用全部迁移参数，迁移模式改由每个任务指定）
+        """
         parser = argparse.ArgumentParser(
+            prog="clickhouse-migrator serve" if serve else None,
             description="ClickHouse表从本地存储策略迁移到S3存储策略脚本",
             formatter_class=argparse.RawDescriptionHelpFormatter,
             epilog="""
@@ -29,8 +60,12 @@ class ConfigManager:
                    python ch_s3_migration.py --mode single --db default --table test_table --host 127.0.0.1 --port 8123 --user default --password 123456 --s3-policy s3_policy --log-path ./logs
                 2. 整库迁移：
                    python ch_s3_migration.py --mode full --db default --host 127.0.0.1 --port 8123 --user default --password 123456 --s3-policy s3_policy --log-path ./logs
+                   跨库迁移：
+                   python ch_s3_migration.py --mode catalog --include-db 'app_*' --exclude-table 're:.*_tmp$' --min-table-size 100 --s3-policy s3_policy
                 3. 断点续传迁移：
                    python ch_s3_migration.py --mode single --db default --table test_table --host 127.0.0.1 --port 8123 --user default --password 123456 --s3-policy s3_policy --log-path ./logs --resume
+                4. 迁移后巡检：
+                   python ch_s3_migration.py --mode verify --include-db 'app_*' --s3-policy s3_policy --verify-concurrency 8
                     """
                 )
         # 配置文件
@@ -38,12 +73,13 @@ class ConfigManager:
         # 迁移模式
         parser.add_argument(
             "--mode",
-            required=True,
-            choices=["single", "full"],
-            help="迁移模式：single（单表）/full（整库）"
+            required=not serve,
+            choices=["single", "full", "catalog", "tier", "verify"],
+            help="迁移模式：single（单表）/full（整库）/catalog（跨库，按过滤条件筛选）/tier（TTL分层，后台搬迁）"
+                 "/verify（迁移后巡检，只读）"
         )
         # 数据库配置
-        parser.add_argument("--db", required=True, help="目标数据库名")
+        parser.add_argument("--db", help="目标数据库名（single/full模式必填）")
         parser.add_argument("--table", help="单表迁移时指定表名")
         parser.add_argument("--host", default=DEFAULT_HOST, help="ClickHouse主机地址")
         parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="ClickHouse HTTP端口")
@@ -55,21 +91,203 @@ class ConfigManager:
         parser.add_argument("--insert-interval", type=float, default=DEFAULT_INSERT_INTERVAL,
                             help="分区插入间隔（秒），控制资源占用")
         parser.add_argument("--resume", action="store_true", help="启用断点续传")
+        parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                            help="整库迁移时并发迁移的表数量")
+        parser.add_argument("--bandwidth-limit", type=float, default=DEFAULT_BANDWIDTH_LIMIT,
+                            help="S3上传带宽预算（MB/s），所有工作线程共享，0表示不限制")
+        # 负载隔离
+        parser.add_argument("--settings-profile", help="迁移查询使用的ClickHouse设置配置文件（SETTINGS PROFILE）")
+        parser.add_argument("--query-priority", type=int, default=0,
+                            help="迁移查询的priority设置（数值越大优先级越低），0表示不设置")
+        parser.add_argument("--workload", help="迁移查询使用的ClickHouse工作负载（CREATE WORKLOAD，需24.10及以上版本）")
+        parser.add_argument("--max-server-queries", type=int, default=0,
+                            help="本次运行同时在服务端执行的迁移查询数上限（按查询占用槽位，不限制连接数），0表示不限制")
+        parser.add_argument("--query-timeout", type=float, default=DEFAULT_QUERY_TIMEOUT,
+                            help="单个分区复制查询的超时时间（秒），超时后终止服务端查询，0表示不限制")
+        parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                            help="长查询进度轮询间隔（秒）")
+        parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES,
+                            help="单个分区操作遇到瞬时故障时的最大尝试次数")
+        parser.add_argument("--retry-base-delay", type=float, default=DEFAULT_RETRY_BASE_DELAY,
+                            help="重试基础等待时间（秒），按指数退避并加随机抖动")
+        parser.add_argument("--retry-max-delay", type=float, default=DEFAULT_RETRY_MAX_DELAY,
+                            help="单次重试等待时间上限（秒）")
+        # 维护窗口与运行控制
+        parser.add_argument("--window", action="append", default=[],
+                            help="维护时间窗口，可多次指定，如'mon-fri 22:00-06:00'；窗口外完成当前分区后等待")
+        parser.add_argument("--control-file", default=DEFAULT_CONTROL_FILE,
+                            help="运行控制文件（JSON），用于暂停/恢复/排空及在线调整并发、带宽和插入间隔")
+        parser.add_argument("--status-port", type=int, default=DEFAULT_STATUS_PORT,
+                            help="本地进度状态接口端口（GET /status 返回JSON），0表示不启动")
+        # 压缩编码
+        parser.add_argument("--default-codec", help="备份表全表默认压缩编码，如ZSTD(3)；按列配置请使用配置文件compression.codecs")
+        parser.add_argument("--compress-block-profile", choices=["none", "s3"], default=DEFAULT_COMPRESS_BLOCK_PROFILE,
+                            help="备份表压缩块大小配置：none（保持默认）/s3（更大的压缩块）")
+        parser.add_argument("--compression-preview", action="store_true",
+                            help="仅在样本分区上预估新压缩编码的效果，不执行迁移")
+        # 数据块布局与合并
+        parser.add_argument("--part-layout-profile", choices=["none", "s3"], default=DEFAULT_PART_LAYOUT_PROFILE,
+                            help="备份表数据块布局配置：none（保持默认）/s3（中小数据块保持Compact格式）")
+        parser.add_argument("--optimize-mode", choices=["none", "optimize", "wait"], default=DEFAULT_OPTIMIZE_MODE,
+                            help="分区复制后的合并方式：none（不处理）/optimize（OPTIMIZE ... FINAL）/wait（等待后台合并）")
+        parser.add_argument("--optimize-concurrency", type=int, default=DEFAULT_OPTIMIZE_CONCURRENCY,
+                            help="并发执行OPTIMIZE的上限")
+        # 迁移前快照与回滚
+        parser.add_argument("--snapshot", action="store_true",
+                            help="复制前将源表全部分区硬链接到快照表，失败时--rollback可直接以快照替换源表")
+        parser.add_argument("--rollback", action="store_true",
+                            help="回滚未完成的迁移：以快照替换源表，或将备份表分区ATTACH回源表（不重新复制数据）")
+        parser.add_argument("--rollback-policy", help="回滚后源表使用的存储策略（默认源表当前策略）")
+        parser.add_argument("--merge-aware", action="store_true",
+                            help="源分区正在合并或变更时延后迁移，优先迁移空闲分区")
+        parser.add_argument("--busy-partition-max-wait", type=float, default=DEFAULT_BUSY_PARTITION_MAX_WAIT,
+                            help="剩余分区均在合并或变更时的最长等待时间（秒），超时后仍按顺序迁移")
+        # 索引与投影延迟物化
+        parser.add_argument("--defer-indexes", action="store_true",
+                            help="备份表先不带数据跳过索引与投影复制数据，复制完成后按分区物化")
+        parser.add_argument("--materialize-concurrency", type=int, default=DEFAULT_MATERIALIZE_CONCURRENCY,
+                            help="每张表同时执行的索引/投影物化变更数上限")
+        # 复制策略自动调优
+        parser.add_argument("--autotune", action="store_true",
+                            help="迁移每张表前在样本分区上试跑候选复制策略，剩余分区使用最优策略")
+        parser.add_argument("--autotune-refresh", action="store_true",
+                            help="忽略历史调优结果，重新试跑候选策略")
+        parser.add_argument("--autotune-sample-size", type=float, default=1024,
+                            help="调优样本分区大小上限（MB）")
+        # 迁移前后查询基准
+        parser.add_argument("--benchmark", action="store_true",
+                            help="迁移前与切换后分别执行代表性查询，对比延迟分位数、读取字节与S3 GET请求数")
+        parser.add_argument("--benchmark-runs", type=int, default=DEFAULT_BENCHMARK_RUNS, help="每条基准查询的执行次数")
+        parser.add_argument("--benchmark-query-count", type=int, default=DEFAULT_BENCHMARK_QUERIES,
+                            help="未配置基准查询时，从system.query_log回放的最常见查询数")
+        parser.add_argument("--benchmark-lookback", type=int, default=DEFAULT_BENCHMARK_LOOKBACK_HOURS,
+                            help="回放查询的回溯时长（小时）")
+        parser.add_argument("--benchmark-regression", type=float, default=DEFAULT_REGRESSION_RATIO,
+                            help="迁移后p95延迟超过迁移前该倍数时标记为性能回退")
+        # 切换后缓存预热
+        parser.add_argument("--prewarm", action="store_true",
+                            help="切换后将最近的热点分区读入S3磁盘的文件系统缓存")
+        parser.add_argument("--prewarm-partitions", type=int, default=DEFAULT_PREWARM_PARTITIONS,
+                            help="预热的最近分区数")
+        parser.add_argument("--prewarm-concurrency", type=int, default=DEFAULT_PREWARM_CONCURRENCY,
+                            help="并发预热的分区数上限")
+        parser.add_argument("--prewarm-hot-columns", action="store_true",
+                            help="仅预热system.query_log中最常被读取的列（默认预热全部列）")
+        parser.add_argument("--prewarm-lookback", type=int, default=DEFAULT_PREWARM_LOOKBACK_HOURS,
+                            help="统计热点列的回溯时长（小时）")
+        parser.add_argument("--cache-on-write", action="store_true",
+                            help="配合--prewarm，热点分区复制时同时写入文件系统缓存")
+        # 迁移后巡检
+        parser.add_argument("--checksum", action="store_true",
+                            help="迁移时按分区计算内容校验和（需读取全部列），记录为迁移前指纹供verify模式核对")
+        parser.add_argument("--verify-concurrency", type=int, default=DEFAULT_VERIFY_CONCURRENCY,
+                            help="verify模式并发巡检的表数")
+        parser.add_argument("--verify-checksums", action="store_true",
+                            help="verify模式对记录了校验和的分区重算内容校验和（默认仅核对行数）")
+        parser.add_argument("--verify-max-threads", type=int, default=DEFAULT_VERIFY_MAX_THREADS,
+                            help="重算校验和时每个查询的读取线程数上限")
+        parser.add_argument("--verify-read-bandwidth", type=float, default=0,
+                            help="重算校验和时每个查询的读取带宽上限（MB/s），0表示不限制")
+        # TTL分层
+        parser.add_argument("--tier-policy", help="TTL分层模式的分层存储策略（须包含表当前策略的全部磁盘及S3卷）")
+        parser.add_argument("--tier-ttl", help="搬迁TTL表达式，如'event_date + INTERVAL 30 DAY'")
+        parser.add_argument("--tier-volume", help="搬迁目标卷（TO VOLUME）")
+        parser.add_argument("--tier-disk", help="搬迁目标磁盘（TO DISK），与--tier-volume二选一")
+        parser.add_argument("--ttl-batch-size", type=int, default=0,
+                            help="按分区分批物化TTL的每批分区数，0表示修改TTL时立即物化（materialize_ttl_after_modify）")
+        parser.add_argument("--tier-timeout", type=float, default=0,
+                            help="搬迁监控超时（秒），超时后停止监控，后台搬迁继续，0表示不限制")
+        # 跨库迁移过滤条件（通配符，或're:'前缀的正则表达式）
+        parser.add_argument("--include-db", action="append", default=[], help="跨库迁移包含的数据库，可多次指定")
+        parser.add_argument("--exclude-db", action="append", default=[], help="跨库迁移排除的数据库，可多次指定")
+        parser.add_argument("--include-table", action="append", default=[], help="包含的表名，可多次指定")
+        parser.add_argument("--exclude-table", action="append", default=[], help="排除的表名，可多次指定")
+        parser.add_argument("--engine", action="append", default=[],
+                            help="允许迁移的表引擎，可多次指定，默认仅MergeTree系列（整库模式额外包含Distributed）")
+        parser.add_argument("--order-by-heat", action="store_true",
+                            help="整库/跨库迁移按system.query_log访问热度升序迁移（冷表先迁移，热表最后迁移）")
+        parser.add_argument("--heat-lookback", type=int, default=DEFAULT_HEAT_LOOKBACK_HOURS,
+                            help="统计访问热度的回溯时长（小时）")
+        parser.add_argument("--min-table-size", type=float, default=0, help="表最小磁盘占用（MB），0表示不限制")
+        parser.add_argument("--max-table-size", type=float, default=0, help="表最大磁盘占用（MB），0表示不限制")
         # 日志和报告
         parser.add_argument("--log-path", default=DEFAULT_LOG_PATH, help="日志存储路径")
         parser.add_argument("--report-path", default=DEFAULT_REPORT_PATH, help="迁移报告存储路径")
+        parser.add_argument("--history-db", default=DEFAULT_HISTORY_DB,
+                            help="运行历史库（SQLite）路径，设为空字符串表示不记录历史")
+        parser.add_argument("--metadata-cache", default=DEFAULT_METADATA_CACHE,
+                            help="元数据快照文件路径，跨运行复用未变化表的建表语句与分区统计，设为空字符串表示不使用")
+        # 客户端性能剖析
+        parser.add_argument("--profile", action="store_true",
+                            help="记录迁移工具各阶段的墙钟/CPU耗时，输出阶段汇总与火焰图折叠栈到报告目录")
+        parser.add_argument("--profile-cprofile", action="store_true", help="配合--profile启用cProfile函数级剖析")
+        parser.add_argument("--profile-memory", action="store_true", help="配合--profile启用tracemalloc内存剖析")
+        parser.add_argument("--trace", help="时间线输出文件路径（Chrome Trace Event格式，可用Perfetto打开）")
+
+        return parser
 
+    def validate_mode_options(self, options: Dict) -> Optional[str]:
+        """
+        校验迁移模式相关参数（命令行参数与守护进程任务共用）
+        :param options: 命令行参数字典或运行配置
+        :return: 错误信息，校验通过返回None
+        """
+        mode = options.get("mode")
+        if mode in ("single", "full") and not options.get("db"):
+            return "单表/整库迁移模式必须指定--db参数"
+        if mode == "tier" and not (options.get("tier_policy") and options.get("tier_ttl")
+                                   and (options.get("tier_volume") or options.get("tier_disk"))):
+            return "TTL分层模式必须指定--tier-policy、--tier-ttl以及--tier-volume或--tier-disk"
+        if options.get("table") and not options.get("db"):
+            return "指定--table时必须指定--db参数"
+        if mode == "single" and not options.get("table"):
+            return "单表迁移模式必须指定--table参数"
+        if options.get("rollback") and mode not in ("single", "full"):
+            return "--rollback仅支持single（回滚--table）与full（回滚--db下所有未完成迁移的表）模式"
+        return None
+
+    def parse_args(self) -> argparse.Namespace:
+        """解析命令行参数"""
+        parser = self.build_parser()
         args = parser.parse_args()
 
         # 参数校验
-        if args.mode == "single" and not args.table:
-            parser.error("单表迁移模式必须指定--table参数")
+        error = self.validate_mode_options(vars(args))
+        if error:
+            parser.error(error)
 
         # 创建日志和报告目录
         os.makedirs(args.log_path, exist_ok=True)
         os.makedirs(args.report_path, exist_ok=True)
 
         return args
+
+    def parse_serve_args(self, argv: List[str]) -> argparse.Namespace:
+        """解析serve子命令参数：迁移参数作为任务默认配置，另加任务接口参数"""
+        parser = self.build_parser(serve=True)
+        parser.add_argument("--listen-host", default=DEFAULT_DAEMON_HOST, help="任务接口监听地址（默认仅本机）")
+        parser.add_argument("--listen-port", type=int, default=DEFAULT_DAEMON_PORT, help="任务接口监听端口")
+        parser.add_argument("--job-concurrency", type=int, default=DEFAULT_JOB_CONCURRENCY,
+                            help="同时执行的迁移任务数（任务内的表并发仍由--workers控制）")
+        args = parser.parse_args(argv)
+        os.makedirs(args.log_path, exist_ok=True)
+        os.makedirs(args.report_path, exist_ok=True)
+        return args
+    
+    def parse_history_args(self, argv: List[str]) -> argparse.Namespace:
+        """解析history子命令参数"""
+        parser = argparse.ArgumentParser(
+            prog="clickhouse-migrator history",
+            description="查询历史迁移的吞吐趋势（按表、服务器或复制策略统计）"
+        )
+        parser.add_argument("--by", choices=list(HISTORY_GROUP_COLUMNS.keys()), default="table", help="统计维度")
+        parser.add_argument("--host", help="按ClickHouse服务器过滤")
+        parser.add_argument("--db", help="按数据库过滤")
+        parser.add_argument("--table", help="按表名过滤")
+        parser.add_argument("--limit", type=int, default=50, help="最多输出的行数")
+        parser.add_argument("--history-db", default=DEFAULT_HISTORY_DB, help="运行历史库（SQLite）路径")
+        parser.add_argument("--report-path", default=DEFAULT_REPORT_PATH, help="查询前导入该目录下尚未导入的迁移报告")
+        return parser.parse_args(argv)
     
     def load_config(self, config_path: Optional[str] = None) -> Dict:
         """加载配置文件"""
@@ -92,7 +310,15 @@ class ConfigManager:
             },
             "migration": {
                 "insert_interval": float(os.getenv("MIGRATION_INSERT_INTERVAL", DEFAULT_INSERT_INTERVAL)),
-                "resume": os.getenv("MIGRATION_RESUME", "false").lower() == "true"
+                "resume": os.getenv("MIGRATION_RESUME", "false").lower() == "true",
+                "query_timeout": float(os.getenv("MIGRATION_QUERY_TIMEOUT", DEFAULT_QUERY_TIMEOUT)),
+                "poll_interval": float(os.getenv("MIGRATION_POLL_INTERVAL", DEFAULT_POLL_INTERVAL)),
+                "max_retries": int(os.getenv("MIGRATION_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+                "retry_base_delay": float(os.getenv("MIGRATION_RETRY_BASE_DELAY", DEFAULT_RETRY_BASE_DELAY)),
+                "retry_max_delay": float(os.getenv("MIGRATION_RETRY_MAX_DELAY", DEFAULT_RETRY_MAX_DELAY)),
+                "workers": int(os.getenv("MIGRATION_WORKERS", DEFAULT_WORKERS)),
+                "bandwidth_limit": float(os.getenv("MIGRATION_BANDWIDTH_LIMIT", DEFAULT_BANDWIDTH_LIMIT)),
+                "status_port": int(os.getenv("MIGRATION_STATUS_PORT", DEFAULT_STATUS_PORT))
             },
             "logging": {
                 "level": os.getenv("LOG_LEVEL", "info"),
@@ -107,7 +333,7 @@ class ConfigManager:
     def get_final_config(self, args: argparse.Namespace) -> Dict:
         """获取最终配置（优先级：命令行参数 > 环境变量 > 配置文件）"""
         # 加载配置文件
-        config_file = self.load_config(args.config)
+        config_file = self.load_config(args.config) or {}
         # 加载环境变量
         env_config = self.load_environment()
         
@@ -123,8 +349,115 @@ class ConfigManager:
             "s3_policy": args.s3_policy or env_config.get("s3", {}).get("policy", DEFAULT_S3_POLICY),
             "insert_interval": args.insert_interval or env_config.get("migration", {}).get("insert_interval", DEFAULT_INSERT_INTERVAL),
             "resume": args.resume or env_config.get("migration", {}).get("resume", False),
+            "query_timeout": args.query_timeout or env_config.get("migration", {}).get("query_timeout", DEFAULT_QUERY_TIMEOUT),
+            "poll_interval": args.poll_interval or env_config.get("migration", {}).get("poll_interval", DEFAULT_POLL_INTERVAL),
+            "max_retries": args.max_retries or env_config.get("migration", {}).get("max_retries", DEFAULT_MAX_RETRIES),
+            "retry_base_delay": args.retry_base_delay or env_config.get("migration", {}).get("retry_base_delay", DEFAULT_RETRY_BASE_DELAY),
+            "retry_max_delay": args.retry_max_delay or env_config.get("migration", {}).get("retry_max_delay", DEFAULT_RETRY_MAX_DELAY),
+            "workers": args.workers or env_config.get("migration", {}).get("workers", DEFAULT_WORKERS),
+            "bandwidth_limit": args.bandwidth_limit or env_config.get("migration", {}).get("bandwidth_limit", DEFAULT_BANDWIDTH_LIMIT),
+            "status_port": args.status_port or env_config.get("migration", {}).get("status_port", DEFAULT_STATUS_PORT),
             "log_path": args.log_path or env_config.get("logging", {}).get("path", DEFAULT_LOG_PATH),
-            "report_path": args.report_path or env_config.get("report", {}).get("path", DEFAULT_REPORT_PATH)
+            "report_path": args.report_path or env_config.get("report", {}).get("path", DEFAULT_REPORT_PATH),
+            "history_db": args.history_db,
+            "metadata_cache": args.metadata_cache,
+            "profile": args.profile,
+            "profile_cprofile": args.profile_cprofile,
+            "profile_memory": args.profile_memory,
+            "trace": args.trace,
+            "job_concurrency": getattr(args, "job_concurrency", 0)
         }
+
+        # 压缩编码：配置文件按列配置，命令行指定全表默认编码
+        compression_config = config_file.get("compression", {})
+        codecs = dict(compression_config.get("codecs", {}))
+        if args.default_codec:
+            codecs["*"] = args.default_codec
+        final_config["codecs"] = codecs
+        final_config["compress_block_profile"] = (
+            args.compress_block_profile if args.compress_block_profile != DEFAULT_COMPRESS_BLOCK_PROFILE
+            else compression_config.get("block_profile", DEFAULT_COMPRESS_BLOCK_PROFILE)
+        )
+        final_config["compression_preview"] = args.compression_preview
+
+        # 数据块布局：配置文件part_layout.settings可覆盖预置设置
+        part_layout_config = config_file.get("part_layout", {})
+        final_config["part_layout_profile"] = (
+            args.part_layout_profile if args.part_layout_profile != DEFAULT_PART_LAYOUT_PROFILE
+            else part_layout_config.get("profile", DEFAULT_PART_LAYOUT_PROFILE)
+        )
+        final_config["part_layout_settings"] = part_layout_config.get("settings", {})
+        final_config["optimize_mode"] = args.optimize_mode
+        final_config["optimize_concurrency"] = args.optimize_concurrency
+
+        final_config["snapshot"] = args.snapshot
+        final_config["rollback"] = args.rollback
+        final_config["rollback_policy"] = args.rollback_policy
+        final_config["merge_aware"] = args.merge_aware
+        final_config["busy_partition_max_wait"] = args.busy_partition_max_wait
+        final_config["defer_secondary"] = args.defer_indexes
+        final_config["materialize_concurrency"] = args.materialize_concurrency
+
+        # 维护窗口：命令行优先，其次配置文件schedule.windows
+        final_config["windows"] = args.window or config_file.get("schedule", {}).get("windows", [])
+        final_config["control_file"] = args.control_file
+
+        # 复制策略自动调优：候选max_insert_threads可在配置文件autotune.insert_threads中指定
+        autotune_config = config_file.get("autotune", {})
+        final_config["autotune"] = args.autotune or autotune_config.get("enabled", False)
+        final_config["autotune_refresh"] = args.autotune_refresh
+        final_config["autotune_sample_bytes"] = int(args.autotune_sample_size * 1024 * 1024)
+        final_config["autotune_insert_threads"] = autotune_config.get("insert_threads", [])
+
+        # 迁移前后查询基准：配置文件benchmark.queries按"库.表"或表名配置查询（可使用{db}、{table}占位符）
+        benchmark_config = config_file.get("benchmark", {})
+        final_config["benchmark"] = args.benchmark or benchmark_config.get("enabled", False)
+        final_config["benchmark_queries"] = benchmark_config.get("queries", {})
+        final_config["benchmark_runs"] = args.benchmark_runs
+        final_config["benchmark_query_count"] = args.benchmark_query_count
+        final_config["benchmark_lookback_hours"] = args.benchmark_lookback
+        final_config["benchmark_regression_ratio"] = args.benchmark_regression
+
+        # 负载隔离：配置文件isolation段可设置相同的选项
+        isolation_config = config_file.get("isolation", {})
+        final_config["settings_profile"] = args.settings_profile or isolation_config.get("settings_profile")
+        final_config["query_priority"] = args.query_priority or isolation_config.get("priority", 0)
+        final_config["workload"] = args.workload or isolation_config.get("workload")
+        final_config["max_server_queries"] = args.max_server_queries or isolation_config.get("max_server_queries", 0)
+
+        # 切换后缓存预热
+        final_config["prewarm"] = args.prewarm
+        final_config["prewarm_partitions"] = args.prewarm_partitions
+        final_config["prewarm_concurrency"] = args.prewarm_concurrency
+        final_config["prewarm_hot_columns"] = args.prewarm_hot_columns
+        final_config["prewarm_lookback_hours"] = args.prewarm_lookback
+        final_config["cache_on_write"] = args.cache_on_write
+
+        # 迁移后巡检
+        final_config["checksum"] = args.checksum
+        final_config["verify_concurrency"] = args.verify_concurrency
+        final_config["verify_checksums"] = args.verify_checksums
+        final_config["verify_max_threads"] = args.verify_max_threads
+        final_config["verify_read_bandwidth"] = args.verify_read_bandwidth
+
+        # TTL分层
+        final_config["tier_policy"] = args.tier_policy
+        final_config["tier_ttl"] = args.tier_ttl
+        final_config["tier_volume"] = args.tier_volume
+        final_config["tier_disk"] = args.tier_disk
+        final_config["ttl_batch_size"] = args.ttl_batch_size
+        final_config["tier_timeout"] = args.tier_timeout
+
+        # 跨库迁移过滤条件：命令行优先，其次配置文件catalog段
+        catalog_config = config_file.get("catalog", {})
+        final_config["include_databases"] = args.include_db or catalog_config.get("include_databases", [])
+        final_config["exclude_databases"] = args.exclude_db or catalog_config.get("exclude_databases", [])
+        final_config["include_tables"] = args.include_table or catalog_config.get("include_tables", [])
+        final_config["exclude_tables"] = args.exclude_table or catalog_config.get("exclude_tables", [])
+        final_config["engines"] = args.engine or catalog_config.get("engines", [])
+        final_config["order_by_heat"] = args.order_by_heat or catalog_config.get("order_by_heat", False)
+        final_config["heat_lookback_hours"] = args.heat_lookback
+        final_config["min_table_size"] = args.min_table_size or catalog_config.get("min_table_size", 0)
+        final_config["max_table_size"] = args.max_table_size or catalog_config.get("max_table_size", 0)
         
         return final_config
@@ -0,0 +1,257 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+
+from clickhouse_migrator.utils.job_server import JobServer, DEFAULT_DAEMON_HOST, DEFAULT_DAEMON_PORT, DEFAULT_JOB_CONCURRENCY
+
+# 任务可指定的迁移模式
+JOB_MODES = ("single", "full", "catalog", "tier", "verify")
+# 任务不可覆盖的配置项：守护进程启动时已据此建立连接、负载隔离与共享组件（连接池、调度器、带宽预算、运行控制、历史库）
+FIXED_JOB_KEYS = (
+    "host", "port", "user", "password", "settings_profile", "query_priority", "workload", "max_server_queries",
+    "workers", "bandwidth_limit", "optimize_concurrency", "materialize_concurrency", "prewarm_concurrency",
+    "verify_concurrency", "poll_interval", "query_timeout",
+    "windows", "control_file", "status_port", "history_db", "metadata_cache", "log_path", "report_path",
+    "profile", "profile_cprofile", "profile_memory", "trace", "job_concurrency", "job_id"
+)
+# 保留的已结束任务数上限，超出时丢弃最早结束的任务
+MAX_FINISHED_JOBS = 1000
+# 退出时等待执行中的任务在分区边界停止的最长时间（秒），超时后终止服务端查询
+SHUTDOWN_DRAIN_TIMEOUT = 600
+
+class MigrationDaemon:
+    """
+    迁移守护进程：启动时一次性建立连接、检查负载隔离，创建共享的连接池、合并调度器、带宽调控器、
+    运行控制器并导入运行历史；之后经本地HTTP接口接收迁移任务排队执行，
+    所有任务复用这些共享组件与断点续传进度，同一存储策略在进程内只检查一次
+    """
+
+    def __init__(self, config: Dict, port: int = DEFAULT_DAEMON_PORT, host: str = DEFAULT_DAEMON_HOST,
+                 job_concurrency: int = DEFAULT_JOB_CONCURRENCY):
+        """
+        :param config: 任务默认配置（serve子命令的迁移参数）
+        :param job_concurrency: 同时执行的任务数
+        """
+        from clickhouse_migrator.config import ConfigManager
+        from clickhouse_migrator.orchestrator import MigrationOrchestrator
+
+        self.config = config
+        self.config_manager = ConfigManager()
+        self.orchestrator = MigrationOrchestrator()
+        self.job_concurrency = max(1, job_concurrency)
+        self.job_server = JobServer(self, port, host)
+        self.jobs = OrderedDict()
+        self.progress = None
+        self._job_configs = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._stopped = threading.Event()
+
+    def submit(self, request: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        提交任务：请求中的配置项覆盖任务默认配置
+        :return: (任务信息, 错误信息)
+        """
+        unsupported = sorted(key for key in request if key not in self.config or key in FIXED_JOB_KEYS)
+        if unsupported:
+            return None, f"不支持的任务配置项：{unsupported}"
+        if request.get("mode") not in JOB_MODES:
+            return None, f"任务必须指定mode，可选值：{list(JOB_MODES)}"
+        job_config = dict(self.config, **request)
+        error = self.config_manager.validate_mode_options(job_config)
+        if error:
+            return None, error
+
+        with self._lock:
+            self._seq += 1
+            job_id = f"job{self._seq:05d}"
+            job_config["job_id"] = job_id
+            job = {
+                "id": job_id,
+                "status": "queued",
+                "request": request,
+                "submitted_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "started_at": "",
+                "finished_at": "",
+                "success": None,
+                "error": "",
+                "results": []
+            }
+            self.jobs[job_id] = job
+            self._job_configs[job_id] = job_config
+            self._prune_jobs()
+        self._queue.put(job_id)
+        logger.info(f"已接收任务{job_id}：{request}")
+        return self.describe(job), None
+
+    def _prune_jobs(self):
+        """丢弃超出保留上限的已结束任务（调用方持有锁）"""
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] in ("completed", "failed", "cancelled")]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self.jobs[job_id]
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        取消排队中的任务，返回错误信息
+        执行中的任务请通过控制文件排空（action=drain）；排空只作用于当时执行中的任务，
+        之后没有执行中的任务时开始的新任务自动解除排空，也可写入action=resume立即解除
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return f"任务{job_id}不存在"
+            if job["status"] != "queued":
+                return f"任务{job_id}状态为{job['status']}，只能取消排队中的任务"
+            job["status"] = "cancelled"
+            job["finished_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self._job_configs.pop(job_id, None)
+        logger.info(f"任务{job_id}已取消")
+        return None
+
+    def describe(self, job: Dict, detail: bool = False) -> Dict:
+        """任务信息：列表中只包含按状态统计的表数，详情包含每个表的结果"""
+        info = {key: value for key, value in job.items() if key != "results"}
+        tables = {}
+        for result in job["results"]:
+            tables[result["status"]] = tables.get(result["status"], 0) + 1
+        info["tables"] = tables
+        if detail:
+            info["results"] = job["results"]
+        return info
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return self.describe(job, detail=True) if job is not None else None
+
+    def list_jobs(self) -> List[Dict]:
+        with self._lock:
+            return [self.describe(job) for job in self.jobs.values()]
+
+    def status(self) -> Dict:
+        """迁移进度、运行控制与任务队列状态"""
+        with self._lock:
+            jobs = {}
+            for job in self.jobs.values():
+                jobs[job["status"]] = jobs.get(job["status"], 0) + 1
+        status = self.orchestrator.migration_service.progress_tracker.snapshot()
+        if self.orchestrator.controller is not None:
+            status["control"] = self.orchestrator.controller.status()
+        status["jobs"] = jobs
+        return status
+
+    def _run_job(self, job_id: str):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job["status"] != "queued":
+                return
+            # 排空指令针对下达时执行中的任务：这些任务都已结束时，新任务开始前解除排空
+            controller = self.orchestrator.controller
+            undrain = controller is not None and controller.draining and not self._stopped.is_set() \
+                and not any(other["status"] == "running" for other in self.jobs.values())
+            if undrain:
+                controller.draining = False
+            job["status"] = "running"
+            job["started_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            config = self._job_configs.pop(job_id)
+        if undrain:
+            logger.info("之前的排空指令已完成（没有执行中的任务），解除排空")
+        logger.info(f"开始执行任务{job_id}")
+        try:
+            # 每个任务从共享连接池租用一个连接，任务内的并发迁移再按需租用
+            with self.orchestrator.client_pool.lease() as client:
+                self.orchestrator.check_policy(client, config)
+                results, success = self.orchestrator.run(client, config, self.progress)
+            job["results"] = results
+            job["success"] = success
+            job["status"] = "completed" if success else "failed"
+        except Exception as e:
+            import traceback
+            job["error"] = f"{str(e)}\n{traceback.format_exc()}"
+            job["success"] = False
+            job["status"] = "failed"
+            logger.error(f"任务{job_id}执行失败：{str(e)}")
+        finally:
+            job["finished_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            # 移除该任务的表进度，进度跟踪只保留执行中任务的表
+            self.orchestrator.migration_service.progress_tracker.finish_run(job_id)
+        logger.info(f"任务{job_id}结束：{job['status']}")
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            self._run_job(job_id)
+
+    def serve(self) -> bool:
+        """
+        启动守护进程并阻塞到收到SIGTERM或Ctrl-C
+        :return: 启动是否成功
+        """
+        self.orchestrator.setup_logger(self.config["log_path"])
+        logger.info("=" * 50)
+        logger.info("启动ClickHouse迁移守护进程")
+        logger.info("=" * 50)
+        self.orchestrator.profiler = self.orchestrator.migration_service.profiler
+        workers = []
+        try:
+            self.orchestrator.setup(self.config)
+            self.progress = self.orchestrator.resume_service.load_migration_progress()
+            for idx in range(self.job_concurrency):
+                worker = threading.Thread(target=self._worker, name=f"job-{idx + 1}", daemon=True)
+                worker.start()
+                workers.append(worker)
+            self.job_server.start(logger)
+            logger.info(f"同时执行的任务数：{self.job_concurrency}")
+            while not self._stopped.wait(1):
+                pass
+            return True
+        except (KeyboardInterrupt, SystemExit) as e:
+            logger.warning(f"守护进程退出：{str(e) or '收到中断'}")
+            return True
+        except Exception as e:
+            import traceback
+            logger.error(f"守护进程异常终止：{str(e)}\n{traceback.format_exc()}")
+            return False
+        finally:
+            self.job_server.stop()
+            # 执行中的任务在下一个分区边界停止（可使用--resume继续），排队中的任务取消
+            with self._lock:
+                for job in self.jobs.values():
+                    if job["status"] == "queued":
+                        job["status"] = "cancelled"
+            if self.orchestrator.controller is not None:
+                self.orchestrator.controller.draining = True
+            for _ in workers:
+                self._queue.put(None)
+            self.wait_workers(workers)
+            self.orchestrator.shutdown()
+
+    def wait_workers(self, workers: List[threading.Thread], timeout: float = SHUTDOWN_DRAIN_TIMEOUT):
+        """
+        等待执行中的任务在分区边界停止后再释放共享组件；超时或再次收到中断时不再等待，
+        由shutdown终止仍在运行的服务端查询（这些任务的当前分区未完成，可提交resume任务继续）
+        """
+        with self._lock:
+            running = [job_id for job_id, job in self.jobs.items() if job["status"] == "running"]
+        if running:
+            logger.warning(f"等待执行中的任务{running}在当前分区完成后停止（最长{timeout}秒）")
+        deadline = time.monotonic() + timeout
+        try:
+            for worker in workers:
+                worker.join(max(deadline - time.monotonic(), 0))
+        except (KeyboardInterrupt, SystemExit):
+            logger.warning("再次收到中断，不再等待执行中的任务")
+        alive = [worker.name for worker in workers if worker.is_alive()]
+        if alive:
+            logger.warning(f"任务线程{alive}未在{timeout}秒内停止，终止其服务端查询")
+
+    def stop(self):
+        """停止守护进程（serve返回）"""
+        self._stopped.set()
@@ -1,4 +1,6 @@
 import os
+import signal
+import threading
 from typing import List, Dict
 from loguru import logger
 
@@ -17,6 +19,26 @@ class MigrationOrchestrator:
         self.report_service = ReportService()
         self.resume_service = ResumeService()
         self.setup_logger = setup_logger
+        self.query_runner = None
+        self.merge_scheduler = None
+        self.status_server = None
+        self.history_service = None
+        self.metadata_cache = None
+        self.profiler = None
+        self.client_pool = None
+        self.controller = None
+        # 已检查通过的存储策略（守护进程中只检查一次）
+        self.checked_policies = set()
+    
+    def install_signal_handlers(self):
+        """将SIGTERM转换为SystemExit，确保进程退出前终止服务端仍在运行的查询"""
+        if threading.current_thread() is not threading.main_thread():
+            return
+
+        def handle_sigterm(signum, frame):
+            raise SystemExit(f"收到信号{signum}，终止迁移")
+
+        signal.signal(signal.SIGTERM, handle_sigterm)
     
     def orchestrate_migration(self, config: Dict):
         """
@@ -28,24 +50,28 @@ class MigrationOrchestrator:
         self.setup_logger(config["log_path"])
         logger.info("=" * 50)
         logger.info("开始ClickHouse表迁移到S3存储策略")
-        logger.info(f"迁移模式：{config['mode']}，目标数据库：{config['db']}")
+        logger.info(f"迁移模式：{config['mode']}，目标数据库：{config['db'] or '按过滤条件筛选'}")
         if config["mode"] == "single":
             logger.info(f"目标表：{config['table']}")
         logger.info("=" * 50)
 
-        try:
-            # 1. 创建ClickHouse客户端
-            client = self.ch_client_manager.create_client(
-                config["host"],
-                config["port"],
-                config["user"],
-                config["password"]
-            )
-            logger.info("ClickHouse连接成功")
+        # 客户端性能剖析：各阶段计时，可选cProfile与tracemalloc；指定--trace时同时输出时间线
+        from clickhouse_migrator.utils.profiling import Profiler
+        tracer = None
+        if config["trace"]:
+            from clickhouse_migrator.utils.tracing import TraceRecorder
+            tracer = TraceRecorder(config["trace"])
+            logger.info(f"时间线输出到：{config['trace']}")
+        self.profiler = Profiler(config["profile"], config["profile_cprofile"], config["profile_memory"], tracer=tracer)
+        self.migration_service.profiler = self.profiler
+        self.profiler.start_thread_profile()
+        run_span = self.profiler.begin("run", mode=config["mode"])
+        setup_span = self.profiler.begin("setup")
 
-            # 2. 环境检查
-            if not self.ch_client_manager.check_s3_policy(client, config["s3_policy"], logger):
-                raise RuntimeError("S3存储策略检查失败，终止迁移")
+        try:
+            client = self.setup(config)
+            self.check_policy(client, config)
+            self.profiler.end(setup_span)
 
             # 3. 加载断点续传进度
             progress = self.resume_service.load_migration_progress()
@@ -53,31 +79,7 @@ class MigrationOrchestrator:
             if config["resume"] and os.path.exists("migration_progress.json"):
                 logger.info(f"加载迁移进度文件：migration_progress.json")
 
-            # 4. 执行迁移
-            migration_results = []
-            if config["mode"] == "single":
-                # 单表迁移
-                result = self.migration_service.migrate_single_table(
-                    client, config, logger, progress, config["db"], config["table"]
-                )
-                migration_results.append(result)
-            else:
-                # 整库迁移
-                migration_results = self.migration_service.migrate_full_database(
-                    client, config, logger, progress
-                )
-
-            # 5. 生成迁移报告
-            self.report_service.generate_migration_report(config, migration_results, logger)
-
-            # 6. 最终状态检查
-            failed_tables = [r for r in migration_results if r["status"] == "failed"]
-            if failed_tables:
-                logger.error(f"迁移完成，但有{len(failed_tables)}个表迁移失败")
-                return migration_results, False
-            else:
-                logger.info("所有表迁移成功完成！")
-                return migration_results, True
+            return self.run(client, config, progress)
 
         except Exception as e:
             import traceback
@@ -85,5 +87,223 @@ class MigrationOrchestrator:
             logger.error(error_msg)
             return [], False
         finally:
-            # 关闭客户端连接
-            self.ch_client_manager.close()
+            self.shutdown()
+            # 输出客户端剖析结果
+            self.profiler.end(run_span)
+            self.profiler.stop_thread_profile()
+            try:
+                self.profiler.finish(config["report_path"], logger)
+            except Exception as e:
+                logger.warning(f"输出剖析结果失败：{str(e)}")
+
+    def setup(self, config: Dict):
+        """
+        创建连接与共享组件（连接池、合并调度器、历史库、带宽调控器、运行控制器、状态接口）
+        单次运行与守护进程启动时各调用一次
+        :return: 主连接
+        """
+        # 1. 创建ClickHouse客户端
+        client = self.ch_client_manager.create_client(
+            config["host"],
+            config["port"],
+            config["user"],
+            config["password"]
+        )
+        logger.info("ClickHouse连接成功")
+
+        # 负载隔离：迁移的复制、校验、删除查询在独立的设置配置文件/优先级/工作负载下执行
+        if config["settings_profile"] or config["query_priority"] or config["workload"]:
+            isolation_settings = self.ch_client_manager.check_workload(client, config, logger)
+            if isolation_settings is None:
+                raise RuntimeError("负载隔离配置检查失败，终止迁移")
+            self.ch_client_manager.apply_session_settings(isolation_settings)
+
+        # 创建长查询执行器（独立监控连接用于轮询进度和终止查询）
+        from clickhouse_migrator.clients.query_runner import AsyncQueryRunner
+        self.query_runner = AsyncQueryRunner(
+            self.ch_client_manager.create_extra_client(isolated=False),
+            poll_interval=config["poll_interval"],
+            timeout=config["query_timeout"]
+        )
+        self.migration_service.query_runner = self.query_runner
+
+        # 创建连接池（并发迁移工作线程与OPTIMIZE共用）与合并调度器
+        from clickhouse_migrator.clients.pool import CHClientPool, get_pool_size
+        from clickhouse_migrator.services.merge import MergeScheduler
+        pool_size = get_pool_size(config)
+        if config["max_server_queries"]:
+            # 限制本次运行同时在服务端执行的查询数：查询执行期间占用槽位，不缩小连接池（避免嵌套租用连接时死锁）
+            from clickhouse_migrator.clients.pool import QuerySlots
+            self.ch_client_manager.query_slots = QuerySlots(config["max_server_queries"])
+            client = self.ch_client_manager.limit_queries(client)
+            logger.info(f"服务端并发查询上限：{config['max_server_queries']}")
+        client_pool = CHClientPool(self.ch_client_manager, pool_size)
+        self.client_pool = client_pool
+        self.merge_scheduler = MergeScheduler(client_pool, config["optimize_concurrency"])
+        self.migration_service.merge_scheduler = self.merge_scheduler
+        self.migration_service.client_pool = client_pool
+        self.migration_service.prewarm_service.client_pool = client_pool
+        self.migration_service.verify_service.client_pool = client_pool
+
+        # 运行历史库：导入以往报告，为剩余时间估算与复制策略选择提供历史数据
+        if config["history_db"]:
+            from clickhouse_migrator.services.history import HistoryService
+            self.history_service = HistoryService(config["history_db"])
+            imported = self.history_service.ingest_directory(config["report_path"])
+            if imported:
+                logger.info(f"已导入{imported}份历史迁移报告到{config['history_db']}")
+            self.migration_service.history_service = self.history_service
+            self.migration_service.verify_service.history_service = self.history_service
+
+        # 元数据快照：跨运行复用未变化表的建表语句、分区键与分区统计
+        if config["metadata_cache"]:
+            from clickhouse_migrator.services.metadata_cache import MetadataCache
+            self.metadata_cache = MetadataCache(config["metadata_cache"], config["host"])
+            self.migration_service.metadata_cache = self.metadata_cache
+
+        # 索引/投影延迟物化（每张表同时执行的物化变更数受并发上限约束）
+        from clickhouse_migrator.services.materialize import MaterializationService
+        self.migration_service.materialization_service = MaterializationService(
+            config["materialize_concurrency"], poll_interval=config["poll_interval"]
+        )
+
+        # 带宽调控器（所有工作线程共享同一字节预算）
+        if config["bandwidth_limit"] > 0:
+            from clickhouse_migrator.utils.throttle import BandwidthGovernor
+            self.migration_service.bandwidth_governor = BandwidthGovernor(config["bandwidth_limit"] * 1024 * 1024)
+            logger.info(f"S3上传带宽预算：{config['bandwidth_limit']} MB/s")
+
+        # 运行控制器：维护窗口、信号/控制文件驱动的暂停、恢复、排空与在线调整
+        from clickhouse_migrator.utils.control import MigrationController
+        controller = MigrationController(config, config["control_file"])
+        controller.bandwidth_governor = self.migration_service.bandwidth_governor
+        controller.merge_scheduler = self.merge_scheduler
+        controller.client_pool = client_pool
+        controller.install_signal_handlers(logger)
+        self.migration_service.controller = controller
+        self.controller = controller
+        if config["windows"]:
+            logger.info(f"维护窗口：{config['windows']}")
+        self.install_signal_handlers()
+
+        # 本地进度状态接口（按字节加权的进度、剩余时间、各工作线程状态及运行控制状态）
+        if config["status_port"]:
+            from clickhouse_migrator.utils.status_server import StatusServer
+            tracker = self.migration_service.progress_tracker
+            self.status_server = StatusServer(
+                lambda: dict(tracker.snapshot(), control=controller.status()), config["status_port"]
+            )
+            self.status_server.start(logger)
+
+        self.migration_service.tiering_service.poll_interval = config["poll_interval"]
+        return client
+
+    def check_policy(self, client, config: Dict):
+        """环境检查：TTL分层模式检查分层存储策略，其余模式检查S3存储策略（同一进程内每个策略只检查一次）"""
+        # 回滚与巡检不写入S3存储策略，无需检查
+        if config["rollback"] or config["mode"] == "verify":
+            return
+        target_policy = config["tier_policy"] if config["mode"] == "tier" else config["s3_policy"]
+        if target_policy in self.checked_policies:
+            return
+        with self.profiler.span("check_policy", policy=target_policy):
+            if not self.ch_client_manager.check_s3_policy(client, target_policy, logger):
+                raise RuntimeError("S3存储策略检查失败，终止迁移")
+        self.checked_policies.add(target_policy)
+
+    def run(self, client, config: Dict, progress: Dict):
+        """
+        执行一次迁移（按模式分派、生成报告、最终状态检查）
+        :param progress: 断点续传进度（守护进程中各任务共享同一进度）
+        :return: (迁移结果列表, 是否全部成功)
+        """
+        # 批量核对元数据快照，丢弃结构或数据块已变化的表（回滚、巡检与分层不使用快照）
+        use_metadata_cache = self.metadata_cache is not None and not config["rollback"] \
+            and config["mode"] in ("single", "full", "catalog")
+        if use_metadata_cache:
+            with self.profiler.span("metadata_cache_refresh"):
+                self.metadata_cache.refresh(client, logger, [config["db"]] if config["mode"] != "catalog" else None)
+
+        # 4. 执行迁移
+        migrate_span = self.profiler.begin("migrate")
+        migration_results = []
+        if config["rollback"]:
+            # 回滚未完成的迁移（硬链接重组分区，不重新复制数据）
+            migration_results = self.migration_service.rollback_tables(client, config, logger, progress)
+        elif config["mode"] == "single":
+            # 单表迁移
+            result = self.migration_service.migrate_single_table(
+                client, config, logger, progress, config["db"], config["table"]
+            )
+            migration_results.append(result)
+        elif config["mode"] == "verify":
+            # 迁移后巡检（只读）
+            migration_results = self.migration_service.verify_tables(client, config, logger)
+        elif config["mode"] == "tier":
+            # TTL分层（后台搬迁，不复制数据）
+            migration_results = self.migration_service.tier_tables(client, config, logger)
+        elif config["mode"] == "catalog":
+            # 跨库迁移
+            migration_results = self.migration_service.migrate_catalog(
+                client, config, logger, progress
+            )
+        else:
+            # 整库迁移
+            migration_results = self.migration_service.migrate_full_database(
+                client, config, logger, progress
+            )
+
+        self.profiler.end(migrate_span)
+        if use_metadata_cache:
+            try:
+                self.metadata_cache.save()
+            except Exception as e:
+                logger.warning(f"保存元数据快照失败：{str(e)}")
+
+        # 5. 生成迁移报告
+        report_span = self.profiler.begin("report")
+        if config["mode"] == "verify":
+            self.report_service.generate_verify_report(
+                config, migration_results, logger, catalog_summary=self.migration_service.catalog_summary
+            )
+            self.profiler.end(report_span)
+            failed_tables = [r for r in migration_results if r["status"] == "failed"]
+            if failed_tables:
+                logger.error(f"巡检完成，{len(failed_tables)}个表未通过")
+                return migration_results, False
+            logger.info("所有表巡检通过！")
+            return migration_results, True
+        report_file = self.report_service.generate_migration_report(
+            config, migration_results, logger, catalog_summary=self.migration_service.catalog_summary
+        )
+        if self.history_service:
+            self.history_service.ingest_report(report_file)
+        self.profiler.end(report_span)
+
+        # 6. 最终状态检查
+        drained_tables = [r for r in migration_results if r["status"] == "drained"]
+        if config["rollback"]:
+            rolled_back = [r for r in migration_results if r["status"] == "rolled_back"]
+            logger.info(f"回滚完成：{len(rolled_back)}/{len(migration_results)}个表")
+        if drained_tables:
+            logger.warning(f"迁移已按指令排空，{len(drained_tables)}个表未完成，可使用--resume继续")
+        failed_tables = [r for r in migration_results if r["status"] == "failed"]
+        if failed_tables:
+            logger.error(f"迁移完成，但有{len(failed_tables)}个表迁移失败")
+            return migration_results, False
+        else:
+            logger.info("所有表迁移成功完成！")
+            return migration_results, True
+
+    def shutdown(self):
+        """终止仍在运行的服务端查询并释放共享组件（如Ctrl-C或SIGTERM中断）"""
+        if self.query_runner:
+            self.query_runner.cancel_all(logger)
+        if self.merge_scheduler:
+            self.merge_scheduler.shutdown()
+        if self.status_server:
+            self.status_server.stop()
+        if self.history_service:
+            self.history_service.close()
+        # 关闭客户端连接
+        self.ch_client_manager.close()
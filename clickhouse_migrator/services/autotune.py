@@ -0,0 +1,211 @@
+import time
+from typing import Dict, List, Optional
+
+from clickhouse_migrator.clients.query_runner import AsyncQueryRunner
+from clickhouse_migrator.utils.progress import format_bytes
+
+# INSERT ... SELECT候选的max_insert_threads取值
+AUTOTUNE_INSERT_THREADS = (1, 4, 8)
+# 样本分区大小上限（字节），避免在超大分区上重复试跑
+DEFAULT_AUTOTUNE_SAMPLE_BYTES = 1024 * 1024 * 1024
+# 吞吐相差不超过该比例时视为持平，选择服务端CPU耗时更少的策略
+THROUGHPUT_TIE_RATIO = 0.05
+
+# 样本试跑使用的一次性临时表后缀
+AUTOTUNE_DST_SUFFIX = "_autotune_dst"
+AUTOTUNE_STAGE_SUFFIX = "_autotune_stage"
+
+# 默认复制策略（与未启用自动调优时一致）
+DEFAULT_STRATEGY = {"method": "insert_select", "settings": {}}
+
+class AutotuneService:
+    """
+    复制策略自动调优：在有代表性的样本分区上，将各候选策略写入一次性的临时表，
+    按实测吞吐与system.query_log中的服务端CPU耗时选出最优策略，用于该表剩余分区
+    候选策略：
+    - insert_select：不同max_insert_threads的INSERT ... SELECT；
+    - attach_from_staging：先写入临时中转表，再ATTACH PARTITION FROM到目标表；
+    - move_partition：目标存储策略有多个卷时，先写入首个卷，再MOVE PARTITION到最后一个卷（整分区上传）
+    """
+
+    def choose_sample_partition(self, stats: Dict[str, Dict], max_bytes: int = DEFAULT_AUTOTUNE_SAMPLE_BYTES) -> str:
+        """
+        选择样本分区：在不超过大小上限的分区中取字节数居中的分区（无满足条件的分区时取最小分区）
+        :param stats: get_partition_stats返回的单表分区统计
+        :return: 分区ID
+        """
+        if not stats:
+            raise RuntimeError("表无分区数据，无法选择样本分区")
+        ordered = sorted(stats, key=lambda partition_id: stats[partition_id]["bytes"])
+        eligible = [partition_id for partition_id in ordered if stats[partition_id]["bytes"] <= max_bytes]
+        if not eligible:
+            return ordered[0]
+        return eligible[len(eligible) // 2]
+
+    def get_policy_volumes(self, client, policy: str) -> List[str]:
+        """按优先级返回存储策略的卷列表"""
+        result = client.query(f"""
+            SELECT volume_name
+            FROM system.storage_policies
+            WHERE policy_name = '{policy}'
+            ORDER BY volume_priority
+        """)
+        return [row[0] for row in result.result_rows]
+
+    def get_strategies(self, client, config: Dict) -> List[Dict]:
+        """生成适用于当前环境的候选策略列表"""
+        thread_options = config.get("autotune_insert_threads") or AUTOTUNE_INSERT_THREADS
+        strategies = [
+            {"method": "insert_select", "settings": {"max_insert_threads": threads}}
+            for threads in thread_options
+        ]
+        strategies.append({"method": "attach_from_staging", "settings": {"max_insert_threads": max(thread_options)}})
+        volumes = self.get_policy_volumes(client, config["s3_policy"])
+        if len(volumes) > 1:
+            strategies.append({
+                "method": "move_partition",
+                "settings": {"max_insert_threads": max(thread_options)},
+                "volume": volumes[-1]
+            })
+        return strategies
+
+    def get_query_metrics(self, client, query_ids: List[str]) -> Dict:
+        """从system.query_log汇总查询的服务端耗时、CPU与读写字节"""
+        try:
+            client.command("SYSTEM FLUSH LOGS")
+        except Exception:
+            # 无SYSTEM FLUSH LOGS权限时直接查询（可能存在数秒延迟）
+            pass
+        id_list = ", ".join(f"'{query_id}'" for query_id in query_ids)
+        result = client.query(f"""
+            SELECT sum(query_duration_ms), sum(read_bytes), sum(written_bytes),
+                   sum(ProfileEvents['OSCPUVirtualTimeMicroseconds']), max(memory_usage)
+            FROM system.query_log
+            WHERE type = 'QueryFinish' AND query_id IN ({id_list})
+        """)
+        duration_ms, read_bytes, written_bytes, cpu_us, memory = result.result_rows[0]
+        return {
+            "server_seconds": round((duration_ms or 0) / 1000, 3),
+            "read_bytes": int(read_bytes or 0),
+            "written_bytes": int(written_bytes or 0),
+            "cpu_seconds": round((cpu_us or 0) / 1000000, 3),
+            "peak_memory": int(memory or 0)
+        }
+
+    def warm_sample(self, client, logger, db: str, table: str, where_clause: str):
+        """
+        试跑前读取一遍样本分区（结果丢弃），使各候选策略都在已预热的缓存上试跑，
+        避免先试跑的策略承担冷读开销而后试跑的策略读取热缓存
+        """
+        try:
+            client.command(f"SELECT * FROM {db}.{table} WHERE {where_clause} FORMAT Null")
+        except Exception as e:
+            logger.warning(f"{db}.{table}预热调优样本分区失败，试跑结果可能受缓存影响：{str(e)}")
+
+    def run_strategy(self, client, logger, db: str, table: str, strategy: Dict, create_sql_for, where_clause: str,
+                     partition_expr: str, sample_bytes: int, sample_rows: int = 0, bandwidth_governor=None) -> Dict:
+        """
+        在临时表上试跑单个策略
+        :param create_sql_for: 根据表名生成临时表建表语句的函数（与备份表结构、存储策略一致）
+        :param bandwidth_governor: 带宽调控器，试跑写入与正式复制共用--bandwidth-limit预算（等待预算的时间不计入耗时）
+        :return: 实测结果
+        """
+        target_table = table + AUTOTUNE_DST_SUFFIX
+        stage_table = table + AUTOTUNE_STAGE_SUFFIX
+        tag = f"{strategy['method']}_{strategy['settings'].get('max_insert_threads', 0)}"
+        query_ids = []
+        elapsed = {"seconds": 0.0}
+
+        def execute(sql: str, settings: Dict):
+            start_time = time.time()
+            client.command(sql, settings=settings)
+            elapsed["seconds"] += time.time() - start_time
+
+        def run(sql: str, step: str, settings: Optional[Dict] = None, throttled: bool = False):
+            query_id = AsyncQueryRunner.build_query_id("autotune", db, table, tag, step, time.time())
+            query_ids.append(query_id)
+            settings = dict(settings or {}, query_id=query_id)
+            if throttled and bandwidth_governor is not None:
+                with bandwidth_governor.throttle(client, sample_bytes, sample_rows, query_id, logger) as lease:
+                    execute(sql, dict(settings, **lease.settings))
+            else:
+                execute(sql, settings)
+
+        try:
+            for name in (target_table, stage_table):
+                client.command(f"DROP TABLE IF EXISTS {db}.{name}")
+            client.command(create_sql_for(target_table))
+            select_sql = f"SELECT * FROM {db}.{table} WHERE {where_clause}"
+            if strategy["method"] == "attach_from_staging":
+                client.command(create_sql_for(stage_table))
+                run(f"INSERT INTO {db}.{stage_table} {select_sql}", "insert", strategy["settings"], throttled=True)
+                run(f"ALTER TABLE {db}.{target_table} ATTACH PARTITION {partition_expr} FROM {db}.{stage_table}", "attach")
+            else:
+                run(f"INSERT INTO {db}.{target_table} {select_sql}", "insert", strategy["settings"], throttled=True)
+                if strategy["method"] == "move_partition":
+                    run(f"ALTER TABLE {db}.{target_table} MOVE PARTITION {partition_expr} TO VOLUME '{strategy['volume']}'",
+                        "move")
+            wall_seconds = max(elapsed["seconds"], 0.001)
+        finally:
+            for name in (target_table, stage_table):
+                client.command(f"DROP TABLE IF EXISTS {db}.{name}")
+
+        measurement = dict(strategy)
+        measurement.update(self.get_query_metrics(client, query_ids))
+        measurement["wall_seconds"] = round(wall_seconds, 3)
+        measurement["bytes_per_second"] = round(sample_bytes / wall_seconds, 2)
+        logger.info(
+            f"{db}.{table}调优试跑{tag}：{format_bytes(measurement['bytes_per_second'])}/s，"
+            f"服务端CPU {measurement['cpu_seconds']}秒，耗时{measurement['wall_seconds']}秒"
+        )
+        return measurement
+
+    def pick_winner(self, measurements: List[Dict]) -> Dict:
+        """吞吐最高者胜出；吞吐持平（相差不超过THROUGHPUT_TIE_RATIO）时选择服务端CPU耗时更少的策略"""
+        best_rate = max(m["bytes_per_second"] for m in measurements)
+        contenders = [m for m in measurements if m["bytes_per_second"] >= best_rate * (1 - THROUGHPUT_TIE_RATIO)]
+        return min(contenders, key=lambda m: m["cpu_seconds"])
+
+    def autotune(self, client, logger, db: str, table: str, config: Dict, stats: Dict[str, Dict], create_sql_for,
+                 partition_key: str, partition_manager, bandwidth_governor=None) -> Dict:
+        """
+        在样本分区上试跑全部候选策略并选出最优策略（源表数据不受影响）
+        :param bandwidth_governor: 带宽调控器，试跑写入同样受--bandwidth-limit限制
+        :return: {"strategy": 选中的策略, "sample_partition", "sample_bytes", "measurements": 各策略实测结果}
+        """
+        partition_id = self.choose_sample_partition(stats, config.get("autotune_sample_bytes", DEFAULT_AUTOTUNE_SAMPLE_BYTES))
+        partition = stats[partition_id]["partition"]
+        sample_bytes = stats[partition_id]["bytes"]
+        sample_rows = stats[partition_id]["rows"]
+        where_clause = partition_manager.generate_partition_where_clause(partition_key, partition)
+        partition_expr = partition_manager.format_partition_value_for_drop(partition)
+        logger.info(f"{db}.{table}开始复制策略调优，样本分区{partition}（{format_bytes(sample_bytes)}）")
+
+        self.warm_sample(client, logger, db, table, where_clause)
+        measurements = []
+        for strategy in self.get_strategies(client, config):
+            try:
+                measurements.append(self.run_strategy(
+                    client, logger, db, table, strategy, create_sql_for, where_clause, partition_expr, sample_bytes,
+                    sample_rows, bandwidth_governor
+                ))
+            except Exception as e:
+                # 单个策略不适用（如版本不支持）不影响其他策略
+                logger.warning(f"{db}.{table}调优策略{strategy['method']}试跑失败：{str(e)}")
+        if not measurements:
+            logger.warning(f"{db}.{table}所有调优策略试跑失败，使用默认复制策略")
+            return {"strategy": DEFAULT_STRATEGY, "sample_partition": partition, "sample_bytes": sample_bytes,
+                    "measurements": []}
+
+        winner = self.pick_winner(measurements)
+        strategy = {key: winner[key] for key in ("method", "settings", "volume") if key in winner}
+        logger.info(
+            f"{db}.{table}选用复制策略：{strategy['method']}（{strategy['settings']}），"
+            f"样本吞吐{format_bytes(winner['bytes_per_second'])}/s"
+        )
+        return {
+            "strategy": strategy,
+            "sample_partition": partition,
+            "sample_bytes": sample_bytes,
+            "measurements": measurements
+        }
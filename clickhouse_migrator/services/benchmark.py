@@ -0,0 +1,130 @@
+import time
+from typing import Dict, List, Optional
+
+from clickhouse_migrator.clients.query_runner import AsyncQueryRunner, QUERY_ID_PREFIX
+
+# 每条查询的重复执行次数
+DEFAULT_BENCHMARK_RUNS = 5
+# 未配置查询时从system.query_log回放的查询数
+DEFAULT_BENCHMARK_QUERIES = 5
+# 回放查询的回溯时长（小时）
+DEFAULT_BENCHMARK_LOOKBACK_HOURS = 168
+# 迁移后p95延迟超过迁移前的该倍数时判定为性能回退
+DEFAULT_REGRESSION_RATIO = 2.0
+# 单次基准查询的执行时间上限（秒），避免回放的重查询拖慢迁移
+DEFAULT_BENCHMARK_TIMEOUT = 300
+# 基准查询的结果集上限：超出时服务端截断结果（result_overflow_mode=break），避免回放的导出类查询传输海量数据
+BENCHMARK_RESULT_LIMITS = {"max_result_rows": 1000000, "max_result_bytes": 256 * 1024 * 1024,
+                           "result_overflow_mode": "break"}
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近秩法计算百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(-(-pct * len(ordered) // 100)), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+class BenchmarkService:
+    """
+    迁移前后查询延迟对比：在迁移开始前与切换（RENAME）后分别多次执行代表性查询，
+    统计p50/p95/p99延迟、读取字节与S3 GET请求数，p95延迟超过阈值倍数时标记为性能回退
+    代表性查询来自配置文件，未配置时回放system.query_log中该表最常见的SELECT查询
+    """
+
+    def get_queries(self, client, db: str, table: str, config: Dict, logger) -> List[str]:
+        """获取表的基准查询（配置的查询优先，其次回放system.query_log）"""
+        configured = config.get("benchmark_queries", {})
+        queries = configured.get(f"{db}.{table}") or configured.get(table)
+        if queries:
+            return [query.format(db=db, table=table) for query in queries]
+        limit = config.get("benchmark_query_count", DEFAULT_BENCHMARK_QUERIES)
+        lookback = config.get("benchmark_lookback_hours", DEFAULT_BENCHMARK_LOOKBACK_HOURS)
+        result = client.query(f"""
+            SELECT any(query), count() AS cnt
+            FROM system.query_log
+            WHERE type = 'QueryFinish' AND query_kind = 'Select' AND is_initial_query
+                  AND has(tables, '{db}.{table}')
+                  AND event_time >= now() - INTERVAL {int(lookback)} HOUR
+                  AND NOT startsWith(query_id, '{QUERY_ID_PREFIX}_')
+            GROUP BY normalized_query_hash
+            ORDER BY cnt DESC
+            LIMIT {int(limit)}
+        """)
+        queries = [row[0] for row in result.result_rows]
+        if not queries:
+            logger.warning(f"{db}.{table}在system.query_log中最近{lookback}小时无查询记录，跳过查询基准测试")
+        return queries
+
+    def get_query_metrics(self, client, query_ids: List[str]) -> Dict[str, Dict]:
+        """从system.query_log获取每次执行的服务端耗时、读取字节与S3 GET请求数"""
+        try:
+            client.command("SYSTEM FLUSH LOGS")
+        except Exception:
+            # 无SYSTEM FLUSH LOGS权限时直接查询（可能存在数秒延迟）
+            pass
+        id_list = ", ".join(f"'{query_id}'" for query_id in query_ids)
+        result = client.query(f"""
+            SELECT query_id, query_duration_ms, read_bytes, ProfileEvents['S3GetObject']
+            FROM system.query_log
+            WHERE type = 'QueryFinish' AND query_id IN ({id_list})
+        """)
+        return {
+            row[0]: {"server_ms": int(row[1]), "read_bytes": int(row[2]), "s3_gets": int(row[3])}
+            for row in result.result_rows
+        }
+
+    def execute(self, client, query: str, settings: Dict):
+        """流式执行基准查询并逐块丢弃结果（客户端内存与结果集大小无关）"""
+        with client.query_row_block_stream(query, settings=settings) as stream:
+            for _ in stream:
+                pass
+
+    def run(self, client, db: str, table: str, queries: List[str], stage: str, config: Dict, logger) -> List[Dict]:
+        """
+        逐条执行基准查询，每条重复多次
+        :param stage: before/after
+        :return: 每条查询的延迟分位数与资源统计
+        """
+        runs = config.get("benchmark_runs", DEFAULT_BENCHMARK_RUNS)
+        settings = dict(BENCHMARK_RESULT_LIMITS, max_execution_time=config.get("benchmark_timeout", DEFAULT_BENCHMARK_TIMEOUT))
+        results = []
+        for idx, query in enumerate(queries):
+            latencies = []
+            query_ids = []
+            for run in range(runs):
+                query_id = AsyncQueryRunner.build_query_id("benchmark", db, table, stage, idx, run, time.time())
+                start_time = time.perf_counter()
+                self.execute(client, query, dict(settings, query_id=query_id))
+                latencies.append((time.perf_counter() - start_time) * 1000)
+                query_ids.append(query_id)
+            metrics = list(self.get_query_metrics(client, query_ids).values())
+            results.append({
+                "query": query,
+                "runs": runs,
+                "p50_ms": round(percentile(latencies, 50), 2),
+                "p95_ms": round(percentile(latencies, 95), 2),
+                "p99_ms": round(percentile(latencies, 99), 2),
+                "read_bytes": max((m["read_bytes"] for m in metrics), default=0),
+                "s3_gets": round(sum(m["s3_gets"] for m in metrics) / len(metrics), 1) if metrics else 0
+            })
+        logger.info(f"{db}.{table}查询基准测试（{stage}）完成：{len(queries)}条查询，每条{runs}次")
+        return results
+
+    def compare(self, before: List[Dict], after: List[Dict], regression_ratio: float = DEFAULT_REGRESSION_RATIO) -> Dict:
+        """对比迁移前后的结果，p95延迟超过迁移前regression_ratio倍的查询记为回退"""
+        queries = []
+        for b, a in zip(before, after):
+            ratio = round(a["p95_ms"] / b["p95_ms"], 2) if b["p95_ms"] else None
+            queries.append({
+                "query": b["query"],
+                "before": {k: v for k, v in b.items() if k != "query"},
+                "after": {k: v for k, v in a.items() if k != "query"},
+                "p95_ratio": ratio,
+                "regression": ratio is not None and ratio > regression_ratio
+            })
+        return {
+            "regression_ratio": regression_ratio,
+            "queries": queries,
+            "regressions": len([q for q in queries if q["regression"]])
+        }
@@ -0,0 +1,119 @@
+import fnmatch
+import re
+from typing import Dict, List, Optional
+
+from clickhouse_migrator.services.autotune import AUTOTUNE_DST_SUFFIX, AUTOTUNE_STAGE_SUFFIX
+from clickhouse_migrator.services.compression import CODEC_PREVIEW_SUFFIX
+from clickhouse_migrator.services.rollback import BACKUP_SUFFIX, SNAPSHOT_SUFFIX, STAGING_SUFFIX
+
+# 永不迁移的系统库
+SYSTEM_DATABASES = ("system", "INFORMATION_SCHEMA", "information_schema")
+# 默认只迁移MergeTree系列引擎（Log、Memory、Kafka、Dictionary、Distributed等无法按分区迁移）
+DEFAULT_ENGINE_PATTERNS = ["*MergeTree"]
+# 迁移过程创建的辅助表后缀（备份表、中转表、迁移前快照表、自动调优试跑表、压缩预估表），永不作为迁移对象
+HELPER_TABLE_SUFFIXES = (
+    BACKUP_SUFFIX, STAGING_SUFFIX, SNAPSHOT_SUFFIX, AUTOTUNE_DST_SUFFIX, AUTOTUNE_STAGE_SUFFIX, CODEC_PREVIEW_SUFFIX
+)
+# 以该前缀开头的模式按正则表达式匹配，其余按通配符匹配
+REGEX_PREFIX = "re:"
+
+def match_pattern(name: str, pattern: str) -> bool:
+    """匹配名称：'re:'前缀为正则表达式（整体匹配），否则为通配符（如'log_*'）"""
+    if pattern.startswith(REGEX_PREFIX):
+        return re.fullmatch(pattern[len(REGEX_PREFIX):], name) is not None
+    return fnmatch.fnmatchcase(name, pattern)
+
+def match_filters(name: str, include: List[str], exclude: List[str]) -> bool:
+    """include为空表示全部包含；命中exclude的名称总是被排除"""
+    if include and not any(match_pattern(name, p) for p in include):
+        return False
+    return not any(match_pattern(name, p) for p in exclude)
+
+class CatalogService:
+    """跨库迁移目录服务：一次扫描system.tables与system.parts，按过滤条件筛选待迁移表"""
+
+    def scan_catalog(self, client, databases: Optional[List[str]] = None) -> List[Dict]:
+        """
+        一次查询获取所有表的引擎、存储策略与活跃数据块统计
+        :param databases: 限定数据库列表，None表示全部非系统库
+        """
+        excluded = ", ".join(f"'{db}'" for db in SYSTEM_DATABASES)
+        database_filter = ""
+        if databases:
+            database_filter = "AND t.database IN (" + ", ".join(f"'{db}'" for db in databases) + ")"
+        try:
+            result = client.query(f"""
+                SELECT t.database, t.name, t.engine, t.storage_policy,
+                       ifNull(p.bytes, 0), ifNull(p.rows, 0), ifNull(p.partitions, 0)
+                FROM system.tables AS t
+                LEFT JOIN (
+                    SELECT database, table, sum(bytes_on_disk) AS bytes, sum(rows) AS rows,
+                           uniqExact(partition_id) AS partitions
+                    FROM system.parts
+                    WHERE active
+                    GROUP BY database, table
+                ) AS p ON t.database = p.database AND t.name = p.table
+                WHERE t.database NOT IN ({excluded}) AND NOT t.is_temporary {database_filter}
+                ORDER BY t.database, t.name
+            """)
+        except Exception as e:
+            raise RuntimeError(f"扫描表目录失败：{str(e)}")
+        return [
+            {
+                "database": row[0],
+                "table": row[1],
+                "engine": row[2],
+                "storage_policy": row[3],
+                "bytes": int(row[4]),
+                "rows": int(row[5]),
+                "partitions": int(row[6])
+            }
+            for row in result.result_rows
+        ]
+
+    def get_skip_reason(self, entry: Dict, config: Dict) -> Optional[str]:
+        """返回表被排除的原因，None表示该表需要迁移"""
+        if not match_filters(entry["database"], config.get("include_databases", []), config.get("exclude_databases", [])):
+            return "database_filter"
+        if not match_filters(entry["table"], config.get("include_tables", []), config.get("exclude_tables", [])):
+            return "table_filter"
+        if entry["table"].endswith(HELPER_TABLE_SUFFIXES):
+            return "helper_table"
+        engines = config.get("engines") or DEFAULT_ENGINE_PATTERNS
+        if not any(match_pattern(entry["engine"], p) for p in engines):
+            return "engine"
+        if entry["storage_policy"] == config["s3_policy"]:
+            return "already_on_s3"
+        min_bytes = config.get("min_table_size", 0) * 1024 * 1024
+        max_bytes = config.get("max_table_size", 0) * 1024 * 1024
+        if min_bytes and entry["bytes"] < min_bytes:
+            return "too_small"
+        if max_bytes and entry["bytes"] > max_bytes:
+            return "too_large"
+        return None
+
+    def discover_tables(self, client, config: Dict, logger, databases: Optional[List[str]] = None) -> Dict:
+        """
+        筛选待迁移表
+        :return: {"candidates": [表信息], "skipped": [表信息（含reason）]}
+        """
+        candidates = []
+        skipped = []
+        for entry in self.scan_catalog(client, databases):
+            reason = self.get_skip_reason(entry, config)
+            if reason:
+                skipped.append(dict(entry, reason=reason))
+            else:
+                candidates.append(entry)
+
+        reasons = {}
+        for entry in skipped:
+            reasons[entry["reason"]] = reasons.get(entry["reason"], 0) + 1
+        logger.info(
+            f"表目录扫描完成：待迁移{len(candidates)}个表"
+            f"（{len({c['database'] for c in candidates})}个数据库），排除{len(skipped)}个表{reasons if reasons else ''}"
+        )
+        for entry in skipped:
+            if entry["reason"] in ("engine", "already_on_s3"):
+                logger.debug(f"跳过{entry['database']}.{entry['table']}（{entry['reason']}，引擎{entry['engine']}）")
+        return {"candidates": candidates, "skipped": skipped}
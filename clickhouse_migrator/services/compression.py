@@ -0,0 +1,129 @@
+from typing import Dict, List
+
+from clickhouse_migrator.utils.progress import format_bytes
+
+# 预置的压缩块大小配置：s3配置使用更大的压缩块，提升压缩率并减少对象存储的小块读取
+COMPRESS_BLOCK_PROFILES = {
+    "none": {},
+    "s3": {
+        "min_compress_block_size": 1048576,
+        "max_compress_block_size": 4194304
+    }
+}
+
+# 压缩预估使用的临时表后缀
+CODEC_PREVIEW_SUFFIX = "_codec_preview"
+# 压缩预估时样本分区的字节数上限（优先选择不超过该大小的最大分区）
+DEFAULT_PREVIEW_SAMPLE_BYTES = 256 * 1024 * 1024
+
+class CompressionService:
+    """压缩编码服务"""
+    
+    def get_block_settings(self, config: Dict) -> Dict:
+        """根据配置获取备份表的压缩块大小设置"""
+        profile = config.get("compress_block_profile", "none")
+        if profile not in COMPRESS_BLOCK_PROFILES:
+            raise RuntimeError(f"未知的压缩块配置：{profile}，可选值：{list(COMPRESS_BLOCK_PROFILES.keys())}")
+        return dict(COMPRESS_BLOCK_PROFILES[profile])
+    
+    def get_table_bytes(self, client, db: str, tables: List[str]) -> Dict[str, Dict]:
+        """
+        批量获取表的磁盘占用（基于system.parts活跃数据块）
+        :return: {表名: {'bytes_on_disk': 磁盘字节数, 'compressed_bytes': 压缩字节数, 'uncompressed_bytes': 未压缩字节数}}
+        """
+        table_list = ", ".join(f"'{t}'" for t in tables)
+        result = client.query(f"""
+            SELECT table, sum(bytes_on_disk), sum(data_compressed_bytes), sum(data_uncompressed_bytes)
+            FROM system.parts
+            WHERE database = '{db}' AND table IN ({table_list}) AND active = 1
+            GROUP BY table
+        """)
+        sizes = {t: {"bytes_on_disk": 0, "compressed_bytes": 0, "uncompressed_bytes": 0} for t in tables}
+        for table, bytes_on_disk, compressed, uncompressed in result.result_rows:
+            sizes[table] = {
+                "bytes_on_disk": int(bytes_on_disk),
+                "compressed_bytes": int(compressed),
+                "uncompressed_bytes": int(uncompressed)
+            }
+        return sizes
+    
+    def get_column_sizes(self, client, db: str, table: str) -> Dict[str, Dict]:
+        """从system.columns获取各列的压缩/未压缩字节数"""
+        result = client.query(f"""
+            SELECT name, data_compressed_bytes, data_uncompressed_bytes
+            FROM system.columns
+            WHERE database = '{db}' AND table = '{table}'
+        """)
+        return {
+            row[0]: {"compressed_bytes": int(row[1]), "uncompressed_bytes": int(row[2])}
+            for row in result.result_rows
+        }
+    
+    def get_partition_column_sizes(self, client, db: str, table: str, partition_id: str) -> Dict[str, Dict]:
+        """从system.parts_columns获取单个分区各列的压缩/未压缩字节数"""
+        result = client.query(f"""
+            SELECT column, sum(column_data_compressed_bytes), sum(column_data_uncompressed_bytes)
+            FROM system.parts_columns
+            WHERE database = '{db}' AND table = '{table}' AND partition_id = '{partition_id}' AND active = 1
+            GROUP BY column
+        """)
+        return {
+            row[0]: {"compressed_bytes": int(row[1]), "uncompressed_bytes": int(row[2])}
+            for row in result.result_rows
+        }
+    
+    def choose_sample_partition(self, partition_stats: Dict[str, Dict],
+                                max_bytes: int = DEFAULT_PREVIEW_SAMPLE_BYTES) -> str:
+        """
+        选择压缩预估的样本分区：不超过max_bytes的最大分区，均超过时取最小分区
+        :param partition_stats: PartitionManager.get_partition_stats返回的单表分区元数据
+        :return: partition_id
+        """
+        if not partition_stats:
+            raise RuntimeError("表无分区数据，无法进行压缩预估")
+        within_limit = [pid for pid, info in partition_stats.items() if info["bytes"] <= max_bytes]
+        if within_limit:
+            return max(within_limit, key=lambda pid: partition_stats[pid]["bytes"])
+        return min(partition_stats, key=lambda pid: partition_stats[pid]["bytes"])
+    
+    def preview_compression(self, client, logger, db: str, table: str, preview_table: str, preview_create_sql: str,
+                            partition_id: str, where_clause: str) -> Dict:
+        """
+        在样本分区上预估新压缩编码的效果
+        将样本分区写入按新编码创建的临时预览表，对比源分区（system.parts_columns）与预览表（system.columns）的各列字节数
+        :return: 预估结果字典
+        """
+        try:
+            client.command(f"DROP TABLE IF EXISTS {db}.{preview_table}")
+            client.command(preview_create_sql)
+            client.command(f"INSERT INTO {db}.{preview_table} SELECT * FROM {db}.{table} WHERE {where_clause}")
+            before = self.get_partition_column_sizes(client, db, table, partition_id)
+            after = self.get_column_sizes(client, db, preview_table)
+        finally:
+            client.command(f"DROP TABLE IF EXISTS {db}.{preview_table}")
+
+        columns = {}
+        for column, before_info in before.items():
+            after_info = after.get(column, {"compressed_bytes": 0})
+            columns[column] = {
+                "uncompressed_bytes": before_info["uncompressed_bytes"],
+                "before_bytes": before_info["compressed_bytes"],
+                "after_bytes": after_info["compressed_bytes"],
+                "ratio": round(after_info["compressed_bytes"] / before_info["compressed_bytes"], 4)
+                if before_info["compressed_bytes"] else None
+            }
+        before_bytes = sum(c["before_bytes"] for c in columns.values())
+        after_bytes = sum(c["after_bytes"] for c in columns.values())
+        preview = {
+            "sample_partition_id": partition_id,
+            "uncompressed_bytes": sum(c["uncompressed_bytes"] for c in columns.values()),
+            "before_bytes": before_bytes,
+            "after_bytes": after_bytes,
+            "estimated_ratio": round(after_bytes / before_bytes, 4) if before_bytes else None,
+            "columns": columns
+        }
+        logger.info(
+            f"{db}.{table}压缩预估（样本分区{partition_id}）：当前{format_bytes(before_bytes)}，"
+            f"新编码{format_bytes(after_bytes)}，预估比例{preview['estimated_ratio']}"
+        )
+        return preview
@@ -0,0 +1,57 @@
+from typing import Dict, List
+
+from clickhouse_migrator.clients.query_runner import QUERY_ID_PREFIX
+
+# 访问热度统计的默认回溯时长（小时）
+DEFAULT_HEAT_LOOKBACK_HOURS = 168
+# 读取字节数折算为查询次数的单位：每读取该字节数计一次查询
+HEAT_READ_BYTES_UNIT = 100 * 1024 * 1024
+
+class HeatScorer:
+    """
+    访问热度评分：一次查询汇总system.query_log中各候选表在回溯窗口内的查询次数与读取字节数，
+    热度 = 查询次数 + 读取字节数 / HEAT_READ_BYTES_UNIT；按热度升序迁移（冷表先迁移，热表最后迁移）
+    """
+
+    def get_table_heat(self, client, entries: List[Dict], lookback_hours: int = DEFAULT_HEAT_LOOKBACK_HOURS) -> Dict[str, Dict]:
+        """
+        统计候选表的访问热度（一次查询）
+        :param entries: 表目录条目，包含database、table
+        :return: {"库.表": {"queries": 查询次数, "read_bytes": 读取字节数}}，无查询记录的表不在结果中
+        """
+        if not entries:
+            return {}
+        table_list = ", ".join(f"'{entry['database']}.{entry['table']}'" for entry in entries)
+        result = client.query(f"""
+            SELECT t, count(), sum(read_bytes)
+            FROM system.query_log
+            ARRAY JOIN tables AS t
+            WHERE type = 'QueryFinish' AND is_initial_query
+                  AND event_time >= now() - INTERVAL {int(lookback_hours)} HOUR
+                  AND t IN ({table_list})
+                  AND NOT startsWith(query_id, '{QUERY_ID_PREFIX}_')
+            GROUP BY t
+        """)
+        return {row[0]: {"queries": int(row[1]), "read_bytes": int(row[2] or 0)} for row in result.result_rows}
+
+    def order_by_heat(self, client, entries: List[Dict], logger,
+                      lookback_hours: int = DEFAULT_HEAT_LOOKBACK_HOURS) -> List[Dict]:
+        """
+        按访问热度升序排列表目录条目（热度相同时保持原顺序），并为每个条目附加heat（score、rank、queries、read_bytes）
+        :return: 排序后的新条目列表
+        """
+        heat = self.get_table_heat(client, entries, lookback_hours)
+        scored = []
+        for entry in entries:
+            stats = heat.get(f"{entry['database']}.{entry['table']}", {"queries": 0, "read_bytes": 0})
+            score = round(stats["queries"] + stats["read_bytes"] / HEAT_READ_BYTES_UNIT, 2)
+            scored.append(dict(entry, heat=dict(stats, score=score)))
+        scored.sort(key=lambda entry: entry["heat"]["score"])
+        for rank, entry in enumerate(scored, 1):
+            entry["heat"]["rank"] = rank
+        cold = len([entry for entry in scored if entry["heat"]["score"] == 0])
+        logger.info(
+            f"按最近{lookback_hours}小时访问热度排序：{cold}个表无查询记录优先迁移，"
+            f"最热的表：{[(e['database'] + '.' + e['table'], e['heat']['score']) for e in scored[-3:][::-1]]}"
+        )
+        return scored
@@ -0,0 +1,252 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from clickhouse_migrator.utils.report_store import REPORT_PREFIX
+
+DEFAULT_HISTORY_DB = "migration_history.db"
+# 估算吞吐时参考的最近运行次数
+HISTORY_RATE_RUNS = 5
+# history子命令支持的聚合维度
+HISTORY_GROUP_COLUMNS = {
+    "table": "p.database || '.' || p.table_name",
+    "server": "r.host",
+    "strategy": "p.strategy"
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    started_at TEXT,
+    mode TEXT,
+    host TEXT,
+    s3_policy TEXT,
+    report_file TEXT,
+    total_tables INTEGER,
+    completed_tables INTEGER,
+    failed_tables INTEGER
+);
+CREATE TABLE IF NOT EXISTS table_runs (
+    run_id TEXT,
+    database TEXT,
+    table_name TEXT,
+    status TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    before_bytes INTEGER,
+    after_bytes INTEGER,
+    strategy TEXT,
+    strategy_detail TEXT
+);
+CREATE TABLE IF NOT EXISTS partition_runs (
+    run_id TEXT,
+    database TEXT,
+    table_name TEXT,
+    partition TEXT,
+    rows INTEGER,
+    bytes INTEGER,
+    seconds REAL,
+    strategy TEXT,
+    checksum TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_partition_runs_table ON partition_runs (database, table_name);
+CREATE INDEX IF NOT EXISTS idx_table_runs_table ON table_runs (database, table_name);
+"""
+
+def describe_strategy(strategy: Optional[Dict]) -> str:
+    """将复制策略描述为简短标识，如insert_select(max_insert_threads=4)"""
+    if not strategy:
+        return "insert_select"
+    settings = ", ".join(f"{k}={v}" for k, v in sorted(strategy.get("settings", {}).items()))
+    return f"{strategy['method']}({settings})" if settings else strategy["method"]
+
+class HistoryService:
+    """
+    本地运行历史库（SQLite）：导入每次运行的迁移报告（分区级耗时与字节数），
+    供history子命令分析吞吐趋势，并为剩余时间估算与复制策略选择提供历史数据
+    """
+
+    def __init__(self, path: str = DEFAULT_HISTORY_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        # 早期版本的历史库缺少checksum列
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(partition_runs)")]
+        if "checksum" not in columns:
+            self._conn.execute("ALTER TABLE partition_runs ADD COLUMN checksum TEXT")
+
+    def close(self):
+        """关闭历史库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def ingest_report(self, report_file: str) -> bool:
+        """
+        导入一份迁移报告（按报告文件名去重）
+        :return: 是否为新导入
+        """
+        run_id = os.path.splitext(os.path.basename(report_file))[0]
+        with open(report_file, "r", encoding="utf-8") as f:
+            report = json.load(f)
+        info = report.get("migration_info", {})
+        summary = report.get("summary", {})
+        host = info.get("clickhouse_config", {}).get("host", "")
+
+        with self._lock, self._conn:
+            if self._conn.execute("SELECT 1 FROM runs WHERE run_id = ?", (run_id,)).fetchone():
+                return False
+            self._conn.execute(
+                "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, info.get("start_time"), info.get("mode"), host, info.get("s3_policy"), report_file,
+                 summary.get("total_tables"), summary.get("completed_tables"), summary.get("failed_tables"))
+            )
+            for result in self._flatten_results(report.get("results", []), info.get("database")):
+                strategy = result.get("autotune", {}).get("strategy")
+                strategy_name = describe_strategy(strategy)
+                compression = result.get("compression", {})
+                self._conn.execute(
+                    "INSERT INTO table_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (run_id, result.get("database"), result["table"], result.get("status"),
+                     result.get("start_time"), result.get("end_time"),
+                     compression.get("before_bytes"), compression.get("after_bytes"),
+                     strategy_name, json.dumps(strategy) if strategy else None)
+                )
+                self._conn.executemany(
+                    "INSERT INTO partition_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (run_id, result.get("database"), result["table"], partition, rows, size, cost_time,
+                         strategy_name, checksum)
+                        for partition, rows, size, cost_time, checksum in self._iter_partition_log(result)
+                    ]
+                )
+        return True
+
+    def _iter_partition_log(self, result: Dict) -> Iterator[Tuple]:
+        """
+        表结果中通过校验的分区：(分区, 行数, 字节数, 耗时, 校验和)
+        优先读取列式partition_log，早期报告回退到check_results中通过校验的分区
+        """
+        partition_log = result.get("partition_log")
+        if partition_log is not None:
+            return zip(partition_log["partition"], partition_log["rows"], partition_log["bytes"],
+                       partition_log["cost_time"], partition_log["checksum"])
+        return (
+            (check["partition"], check.get("src_count"), check.get("bytes"), check.get("cost_time"),
+             check.get("src_checksum"))
+            for check in result.get("check_results", []) if check.get("passed")
+        )
+
+    def _flatten_results(self, results: List[Dict], default_db: Optional[str]) -> List[Dict]:
+        """展开分布式表的本地表结果，并补全早期报告中缺失的database字段"""
+        flat = []
+        for result in results:
+            for item in [result] + result.get("local_tables", []):
+                if "table" in item and ("check_results" in item or "status" in item):
+                    flat.append(dict(item, database=item.get("database") or default_db))
+        return flat
+
+    def ingest_directory(self, report_dir: str) -> int:
+        """导入报告目录下尚未导入的全部迁移报告，返回新导入的报告数"""
+        count = 0
+        for report_file in sorted(glob.glob(os.path.join(report_dir, f"{REPORT_PREFIX}_*.json"))):
+            try:
+                if self.ingest_report(report_file):
+                    count += 1
+            except (ValueError, KeyError, OSError):
+                # 损坏或格式不兼容的报告跳过
+                continue
+        return count
+
+    def get_table_rate(self, host: str, db: str, table: str, runs: int = HISTORY_RATE_RUNS) -> Optional[float]:
+        """表在最近若干次运行中的分区复制吞吐（字节/秒），无历史返回None"""
+        return self._get_rate(
+            "r.host = ? AND p.database = ? AND p.table_name = ?", (host, db, table), runs
+        )
+
+    def get_host_rate(self, host: str, runs: int = HISTORY_RATE_RUNS) -> Optional[float]:
+        """服务器在最近若干次运行中的整体分区复制吞吐（字节/秒），无历史返回None"""
+        return self._get_rate("r.host = ?", (host,), runs)
+
+    def _get_rate(self, condition: str, params: tuple, runs: int) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute(f"""
+                SELECT sum(p.bytes), sum(p.seconds)
+                FROM partition_runs p JOIN runs r ON p.run_id = r.run_id
+                WHERE {condition} AND p.bytes IS NOT NULL AND p.run_id IN (
+                    SELECT p2.run_id FROM partition_runs p2 JOIN runs r ON p2.run_id = r.run_id
+                    WHERE {condition.replace('p.', 'p2.')}
+                    GROUP BY p2.run_id ORDER BY max(r.started_at) DESC LIMIT ?
+                )
+            """, params + params + (runs,)).fetchone()
+        total_bytes, total_seconds = row
+        if not total_bytes or not total_seconds:
+            return None
+        return total_bytes / total_seconds
+
+    def get_last_strategy(self, host: str, db: str, table: str) -> Optional[Dict]:
+        """表最近一次成功迁移时自动调优选出的复制策略"""
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT t.strategy_detail
+                FROM table_runs t JOIN runs r ON t.run_id = r.run_id
+                WHERE r.host = ? AND t.database = ? AND t.table_name = ?
+                      AND t.status = 'completed' AND t.strategy_detail IS NOT NULL
+                ORDER BY r.started_at DESC LIMIT 1
+            """, (host, db, table)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_partition_fingerprints(self, host: str, db: str, table: str) -> Dict[str, Dict]:
+        """
+        表各分区最近一次迁移时记录的迁移前指纹（同一分区多次迁移时以最近一次为准）
+        :return: {分区值: {"rows": 行数, "checksum": 校验和（未记录时为None）, "run_id": 运行标识}}
+        """
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT p.partition, p.rows, p.checksum, p.run_id
+                FROM partition_runs p JOIN runs r ON p.run_id = r.run_id
+                WHERE r.host = ? AND p.database = ? AND p.table_name = ?
+                ORDER BY r.started_at
+            """, (host, db, table)).fetchall()
+        return {row[0]: {"rows": row[1], "checksum": row[2], "run_id": row[3]} for row in rows}
+
+    def query_trends(self, by: str, host: Optional[str] = None, db: Optional[str] = None,
+                     table: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """
+        按维度与运行统计吞吐趋势
+        :param by: table/server/strategy
+        """
+        if by not in HISTORY_GROUP_COLUMNS:
+            raise RuntimeError(f"未知的统计维度：{by}，可选值：{list(HISTORY_GROUP_COLUMNS.keys())}")
+        conditions = ["p.bytes IS NOT NULL"]
+        params = []
+        for column, value in (("r.host", host), ("p.database", db), ("p.table_name", table)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT {HISTORY_GROUP_COLUMNS[by]} AS grp, r.run_id, min(r.started_at),
+                       count(), sum(p.rows), sum(p.bytes), sum(p.seconds)
+                FROM partition_runs p JOIN runs r ON p.run_id = r.run_id
+                WHERE {' AND '.join(conditions)}
+                GROUP BY grp, r.run_id
+                ORDER BY grp, min(r.started_at) DESC
+                LIMIT ?
+            """, params + [limit]).fetchall()
+        return [
+            {
+                by: row[0],
+                "run_id": row[1],
+                "started_at": row[2],
+                "partitions": row[3],
+                "rows": row[4],
+                "bytes": row[5],
+                "seconds": round(row[6] or 0, 2),
+                "bytes_per_second": round(row[5] / row[6], 2) if row[6] else None
+            }
+            for row in rows
+        ]
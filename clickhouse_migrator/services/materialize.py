@@ -0,0 +1,100 @@
+import time
+from typing import Dict, List
+
+from clickhouse_migrator.utils import ddl
+
+# 延迟构建的元素类型：数据跳过索引与投影
+DEFERRED_KINDS = ("index", "projection")
+# 等待变更时的轮询间隔（秒）
+MUTATION_POLL_INTERVAL = 5
+
+class MaterializationService:
+    """
+    延迟构建二级索引与投影：备份表先不带索引/投影批量复制，
+    复制完成后再ADD并按分区MATERIALIZE，切换前等待system.mutations中的变更全部完成
+    """
+
+    def __init__(self, concurrency: int = 2, poll_interval: float = MUTATION_POLL_INTERVAL):
+        """
+        :param concurrency: 同一张表同时执行的物化变更数上限
+        :param poll_interval: system.mutations轮询间隔（秒）
+        """
+        self.concurrency = max(1, int(concurrency))
+        self.poll_interval = poll_interval
+
+    def split_deferred(self, create_sql: str):
+        """
+        从建表语句中拆出索引与投影定义
+        :return: (不含索引/投影的建表语句, 被拆出的定义列表)
+        """
+        return ddl.strip_definitions(create_sql, DEFERRED_KINDS)
+
+    def add_definitions(self, client, db: str, table: str, definitions: List[str], logger):
+        """将拆出的索引/投影定义加回表结构（仅修改元数据，已有数据需另行物化）"""
+        for definition in definitions:
+            kind = ddl.get_definition_kind(definition).upper()
+            body = definition.strip()[len(kind):].strip()
+            client.command(f"ALTER TABLE {db}.{table} ADD {kind} IF NOT EXISTS {body}")
+            logger.info(f"{db}.{table}已添加{kind}：{ddl.get_definition_name(definition)}")
+
+    def get_running_mutations(self, client, db: str, table: str) -> Dict:
+        """统计表上未完成的变更数及最近一次失败原因"""
+        result = client.query(f"""
+            SELECT count(), anyIf(latest_fail_reason, latest_fail_reason != '')
+            FROM system.mutations
+            WHERE database = '{db}' AND table = '{table}' AND NOT is_done
+        """)
+        running, fail_reason = result.result_rows[0]
+        return {"running": int(running), "fail_reason": fail_reason or ""}
+
+    def wait_for_mutations(self, client, db: str, table: str, logger, max_running: int = 0, timeout: float = 0):
+        """
+        等待表上未完成的变更数降到max_running以下
+        :param max_running: 允许保留的未完成变更数，0表示等待全部完成
+        :param timeout: 等待超时（秒），0表示不限制
+        """
+        start_time = time.time()
+        last_log = 0
+        while True:
+            state = self.get_running_mutations(client, db, table)
+            if state["fail_reason"]:
+                raise RuntimeError(f"{db}.{table}物化变更执行失败：{state['fail_reason']}")
+            if state["running"] <= max_running:
+                return
+            if timeout and time.time() - start_time > timeout:
+                raise RuntimeError(f"等待{db}.{table}物化变更超时（{timeout}秒），仍有{state['running']}个未完成")
+            if max_running == 0 and time.time() - last_log >= 60:
+                logger.info(f"{db}.{table}仍有{state['running']}个物化变更在执行，等待中")
+                last_log = time.time()
+            time.sleep(self.poll_interval)
+
+    def materialize(self, client, db: str, table: str, definitions: List[str], partitions: List[str], logger,
+                    timeout: float = 0) -> Dict:
+        """
+        按分区物化索引/投影，同一张表同时执行的变更数不超过并发上限，返回前等待全部变更完成
+        :param partitions: 分区表达式列表（同DROP PARTITION格式）
+        :return: 物化统计
+        """
+        start_time = time.time()
+        self.add_definitions(client, db, table, definitions, logger)
+        mutations = 0
+        for definition in definitions:
+            kind = ddl.get_definition_kind(definition).upper()
+            name = ddl.get_definition_name(definition)
+            for partition in partitions:
+                self.wait_for_mutations(client, db, table, logger, max_running=self.concurrency - 1, timeout=timeout)
+                client.command(
+                    f"ALTER TABLE {db}.{table} MATERIALIZE {kind} `{name}` IN PARTITION {partition}",
+                    settings={"mutations_sync": 0}
+                )
+                mutations += 1
+            logger.info(f"{db}.{table}的{kind} {name}已提交{len(partitions)}个分区的物化变更")
+        self.wait_for_mutations(client, db, table, logger, timeout=timeout)
+        cost_time = round(time.time() - start_time, 2)
+        logger.info(f"{db}.{table}索引/投影物化完成：{len(definitions)}个定义，{mutations}个变更，耗时{cost_time}秒")
+        return {
+            "indexes": len([d for d in definitions if ddl.get_definition_kind(d) == "index"]),
+            "projections": len([d for d in definitions if ddl.get_definition_kind(d) == "projection"]),
+            "mutations": mutations,
+            "cost_time": cost_time
+        }
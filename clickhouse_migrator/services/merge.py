@@ -0,0 +1,163 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List
+
+# 预置的数据块布局配置：s3配置让中小数据块保持Compact格式（每个数据块的对象数更少）
+PART_LAYOUT_PROFILES = {
+    "none": {},
+    "s3": {
+        "min_bytes_for_wide_part": 268435456,
+        "min_rows_for_wide_part": 10000000
+    }
+}
+
+# 合并线程数上限（实际并发由可在线调整的并发闸门控制）
+MAX_OPTIMIZE_THREADS = 16
+
+# 对象数估算：每个数据块的元数据文件数（checksums.txt、columns.txt、count.txt等）
+PART_METADATA_FILES = 6
+# Compact数据块的数据文件数（data.bin、data.mrk3及主键索引）
+COMPACT_PART_DATA_FILES = 3
+
+class MergeScheduler:
+    """合并调度器：分区复制后在并发上限内对备份表分区执行OPTIMIZE，或等待后台合并完成"""
+
+    def __init__(self, client_pool=None, concurrency: int = 1):
+        """
+        :param client_pool: CHClientPool连接池，为None时在调用方连接上同步执行
+        :param concurrency: 并发执行OPTIMIZE的上限
+        """
+        from clickhouse_migrator.utils.control import ConcurrencyGate
+
+        self.client_pool = client_pool
+        self.concurrency = max(1, int(concurrency))
+        self._gate = ConcurrencyGate(self.concurrency)
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def get_layout_settings(self, config: Dict) -> Dict:
+        """根据配置获取备份表的数据块布局设置（配置文件part_layout.settings可覆盖预置值）"""
+        profile = config.get("part_layout_profile", "none")
+        if profile not in PART_LAYOUT_PROFILES:
+            raise RuntimeError(f"未知的数据块布局配置：{profile}，可选值：{list(PART_LAYOUT_PROFILES.keys())}")
+        settings = dict(PART_LAYOUT_PROFILES[profile])
+        settings.update(config.get("part_layout_settings") or {})
+        return settings
+
+    def schedule_optimize(self, client, db: str, table: str, partition_expr: str, logger):
+        """
+        提交分区合并任务（OPTIMIZE TABLE ... PARTITION ... FINAL）
+        配置了连接池时异步执行，否则在当前连接上同步执行
+        :param partition_expr: 分区表达式（同DROP PARTITION格式）
+        """
+        sql = f"OPTIMIZE TABLE {db}.{table} PARTITION {partition_expr} FINAL"
+        if self.client_pool is None:
+            self._run_optimize(client, sql, logger)
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=MAX_OPTIMIZE_THREADS, thread_name_prefix="optimize")
+            future = self._executor.submit(self._run_pooled_optimize, sql, logger)
+            self._futures.setdefault((db, table), []).append(future)
+
+    def set_concurrency(self, concurrency: int):
+        """在线调整OPTIMIZE并发上限"""
+        self.concurrency = max(1, min(int(concurrency), MAX_OPTIMIZE_THREADS))
+        self._gate.set_limit(self.concurrency)
+
+    def _run_pooled_optimize(self, sql: str, logger):
+        with self._gate.slot(), self.client_pool.lease() as client:
+            self._run_optimize(client, sql, logger)
+
+    def _run_optimize(self, client, sql: str, logger):
+        start_time = time.time()
+        try:
+            client.command(sql)
+            logger.debug(f"合并完成（耗时{time.time() - start_time:.2f}秒）：{sql}")
+        except Exception as e:
+            # 合并失败不影响数据正确性，仅记录告警
+            logger.warning(f"合并失败：{sql}，错误：{str(e)}")
+
+    def wait_table(self, db: str, table: str, logger):
+        """等待指定表已提交的合并任务全部完成"""
+        with self._lock:
+            futures = self._futures.pop((db, table), [])
+        if futures:
+            logger.info(f"等待{db}.{table}的{len(futures)}个分区合并任务完成")
+            wait(futures)
+
+    def wait_for_merges(self, client, db: str, table: str, logger, timeout: float = 3600, poll_interval: float = 10):
+        """等待表的后台合并（system.merges）结束，超时后继续执行"""
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            result = client.query(
+                f"SELECT count() FROM system.merges WHERE database = '{db}' AND table = '{table}'"
+            )
+            running = int(result.result_rows[0][0])
+            if running == 0:
+                return
+            logger.info(f"{db}.{table}仍有{running}个后台合并在执行，等待中")
+            time.sleep(poll_interval)
+        logger.warning(f"等待{db}.{table}后台合并超时（{timeout}秒），继续执行")
+
+    def get_part_layout(self, client, db: str, tables: List[str]) -> Dict[str, Dict[str, Dict]]:
+        """
+        批量统计表各分区的数据块数和对象存储对象数（对象数按数据块格式估算）
+        :return: {表名: {分区值: {'parts': 数据块数, 'objects': 估算对象数}}}
+        """
+        table_list = ", ".join(f"'{t}'" for t in tables)
+        columns_result = client.query(f"""
+            SELECT table, count()
+            FROM system.columns
+            WHERE database = '{db}' AND table IN ({table_list})
+            GROUP BY table
+        """)
+        column_counts = {row[0]: int(row[1]) for row in columns_result.result_rows}
+        parts_result = client.query(f"""
+            SELECT table, partition, count(), countIf(part_type = 'Wide')
+            FROM system.parts
+            WHERE database = '{db}' AND table IN ({table_list}) AND active = 1
+            GROUP BY table, partition
+        """)
+        layout = {t: {} for t in tables}
+        for table, partition, parts, wide_parts in parts_result.result_rows:
+            parts, wide_parts = int(parts), int(wide_parts)
+            wide_files = 2 * column_counts.get(table, 0) + PART_METADATA_FILES
+            compact_files = COMPACT_PART_DATA_FILES + PART_METADATA_FILES
+            layout[table][partition] = {
+                "parts": parts,
+                "objects": wide_parts * wide_files + (parts - wide_parts) * compact_files
+            }
+        return layout
+
+    def summarize_layout(self, before: Dict[str, Dict], after: Dict[str, Dict]) -> Dict:
+        """汇总迁移前后的数据块布局（每分区数据块数和对象数）"""
+        partitions = {}
+        for partition in set(before) | set(after):
+            before_info = before.get(partition, {"parts": 0, "objects": 0})
+            after_info = after.get(partition, {"parts": 0, "objects": 0})
+            partitions[partition] = {
+                "parts_before": before_info["parts"],
+                "objects_before": before_info["objects"],
+                "parts_after": after_info["parts"],
+                "objects_after": after_info["objects"]
+            }
+        partition_count = len(partitions) or 1
+        return {
+            "parts_before": sum(p["parts_before"] for p in partitions.values()),
+            "parts_after": sum(p["parts_after"] for p in partitions.values()),
+            "objects_before": sum(p["objects_before"] for p in partitions.values()),
+            "objects_after": sum(p["objects_after"] for p in partitions.values()),
+            "avg_parts_per_partition_before": round(sum(p["parts_before"] for p in partitions.values()) / partition_count, 2),
+            "avg_parts_per_partition_after": round(sum(p["parts_after"] for p in partitions.values()) / partition_count, 2),
+            "partitions": partitions
+        }
+
+    def shutdown(self):
+        """关闭合并线程池"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,143 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+from clickhouse_migrator.services.partition import PartitionList
+
+DEFAULT_METADATA_CACHE = "metadata_cache.json"
+# 快照文件格式版本，不一致时整体丢弃
+METADATA_CACHE_VERSION = 2
+
+class MetadataCache:
+    """
+    元数据快照：跨运行持久化各表的发现结果（建表语句、分区键、分区列表及各分区大小），
+    以system.tables.metadata_modification_time与活跃数据块指纹（块数+块名哈希）为版本；
+    启动时一次批量查询找出结构或数据块已变化的表并丢弃其快照，迁移表时再以单表指纹核对，
+    未变化的表直接复用快照，省去SHOW CREATE、分区键与分区统计查询
+    """
+
+    def __init__(self, path: str = DEFAULT_METADATA_CACHE, host: str = ""):
+        """
+        :param path: 快照文件路径
+        :param host: ClickHouse地址，快照按地址区分，地址不一致时不复用
+        """
+        self.path = path
+        self.host = host
+        self._lock = threading.Lock()
+        self.tables = {}
+        self.load()
+
+    def load(self):
+        """加载快照文件（不存在、损坏或版本/地址不一致时为空）"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return
+        if snapshot.get("version") == METADATA_CACHE_VERSION and snapshot.get("host") == self.host:
+            self.tables = snapshot.get("tables", {})
+            for entry in self.tables.values():
+                if "partitions" in entry:
+                    entry["partitions"] = PartitionList.from_columns(entry["partitions"])
+
+    def save(self):
+        """写入快照文件（先写临时文件再替换，避免中断时损坏）"""
+        with self._lock:
+            content = json.dumps(
+                {"version": METADATA_CACHE_VERSION, "host": self.host, "tables": self.tables},
+                ensure_ascii=False, default=lambda value: value.to_columns()
+            )
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, self.path)
+
+    def get_fingerprints(self, client, databases: Optional[List[str]] = None,
+                         table: Optional[str] = None) -> Dict[str, Dict]:
+        """
+        批量获取表的变化指纹（一次查询，只读system.tables与system.parts元数据）
+        块名包含分区、块号范围、合并层级与变更版本，写入、合并、变更、删除分区都会改变指纹
+        :param table: 指定时只查询databases[0]中的该表
+        :return: {"库.表": {"metadata_modification_time": 元数据修改时间, "parts_fingerprint": 数据块指纹}}
+        """
+        table_filter = ""
+        parts_filter = ""
+        if databases:
+            db_list = ", ".join(f"'{db}'" for db in databases)
+            table_filter += f" AND t.database IN ({db_list})"
+            parts_filter += f" AND database IN ({db_list})"
+        if table:
+            table_filter += f" AND t.name = '{table}'"
+            parts_filter += f" AND table = '{table}'"
+        result = client.query(f"""
+            SELECT t.database, t.name, toString(t.metadata_modification_time),
+                   ifNull(p.parts, 0), ifNull(p.hash, 0)
+            FROM system.tables AS t
+            LEFT JOIN (
+                SELECT database, table, count() AS parts, groupBitXor(cityHash64(name)) AS hash
+                FROM system.parts
+                WHERE active{parts_filter}
+                GROUP BY database, table
+            ) AS p ON t.database = p.database AND t.name = p.table
+            WHERE NOT t.is_temporary{table_filter}
+        """)
+        return {
+            f"{row[0]}.{row[1]}": {"metadata_modification_time": row[2], "parts_fingerprint": f"{int(row[3])}:{int(row[4])}"}
+            for row in result.result_rows
+        }
+
+    def refresh(self, client, logger, databases: Optional[List[str]] = None) -> Dict:
+        """
+        启动时批量核对快照：丢弃已删除或元数据/数据块已变化的表
+        :param databases: 限定数据库列表，None表示全部；范围外的快照保持不变
+        :return: {"reusable": 可复用的表数, "changed": 已变化的表数, "dropped": 已不存在的表数}
+        """
+        fingerprints = self.get_fingerprints(client, databases)
+        summary = {"reusable": 0, "changed": 0, "dropped": 0}
+        with self._lock:
+            for name in list(self.tables):
+                if databases and name.split(".", 1)[0] not in databases:
+                    continue
+                current = fingerprints.get(name)
+                if current is None:
+                    summary["dropped"] += 1
+                    del self.tables[name]
+                elif not self._matches(self.tables[name], current):
+                    summary["changed"] += 1
+                    del self.tables[name]
+                else:
+                    summary["reusable"] += 1
+        logger.info(
+            f"元数据快照{self.path}：{summary['reusable']}个表未变化可复用，"
+            f"{summary['changed']}个表已变化、{summary['dropped']}个表已删除，需重新发现"
+        )
+        return summary
+
+    def lookup(self, client, db: str, table: str) -> Dict:
+        """
+        以单表指纹核对快照：未变化时返回快照中的元数据，否则以当前指纹重建空快照
+        :return: 元数据字典（副本），可能包含create_sql、partition_key、partitions（PartitionList）
+        """
+        current = self.get_fingerprints(client, [db], table).get(f"{db}.{table}")
+        if current is None:
+            return {}
+        name = f"{db}.{table}"
+        with self._lock:
+            entry = self.tables.get(name)
+            if entry is None or not self._matches(entry, current):
+                entry = dict(current)
+                self.tables[name] = entry
+            return {key: value for key, value in entry.items() if key not in current}
+
+    def update(self, db: str, table: str, field: str, value):
+        """写入单表的一项发现结果（lookup之后调用）"""
+        with self._lock:
+            entry = self.tables.get(f"{db}.{table}")
+            if entry is not None:
+                entry[field] = value
+
+    def _matches(self, entry: Dict, current: Dict) -> bool:
+        return all(entry.get(key) == value for key, value in current.items())
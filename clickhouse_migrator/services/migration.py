@@ -1,9 +1,36 @@
+import hashlib
 import re
+import threading
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Dict, Optional
 
+from clickhouse_migrator.clients.query_runner import AsyncQueryRunner
+from clickhouse_migrator.services.autotune import DEFAULT_STRATEGY as AUTOTUNE_DEFAULT_STRATEGY
+from clickhouse_migrator.services.catalog import DEFAULT_ENGINE_PATTERNS
+from clickhouse_migrator.services.compression import CODEC_PREVIEW_SUFFIX
+from clickhouse_migrator.services.partition import PartitionScheduler, describe_partitions
+from clickhouse_migrator.services.prewarm import CACHE_ON_WRITE_SETTINGS
+from clickhouse_migrator.utils import ddl
+from clickhouse_migrator.utils.progress import ProgressTracker, format_bytes, format_duration
+from clickhouse_migrator.utils.control import ConcurrencyGate, MigrationDrained
+from clickhouse_migrator.utils.profiling import Profiler
+from clickhouse_migrator.utils.retry import RetryPolicy
+
+# 并发迁移工作线程数上限（实际并发由可在线调整的并发闸门控制）
+MAX_WORKER_THREADS = 32
+
+# 非Replicated备份表的插入去重窗口（保留最近N个数据块的去重信息）
+DEFAULT_DEDUPLICATION_WINDOW = 1000
+
+# 报告中每个表保留的分区校验明细数（校验失败的分区总是保留）；全部分区以列式partition_log记录
+CHECK_RESULTS_SAMPLE = 20
+
+# 整库迁移默认引擎范围：MergeTree系列及分布式表（分布式表迁移其关联的本地表）
+FULL_MODE_ENGINE_PATTERNS = DEFAULT_ENGINE_PATTERNS + ["Distributed"]
+
 class MigrationService:
     """迁移服务"""
     
@@ -11,13 +38,313 @@ class MigrationService:
         from clickhouse_migrator.services.partition import PartitionManager
         from clickhouse_migrator.services.validator import DataValidator
         from clickhouse_migrator.services.resume import ResumeService
+        from clickhouse_migrator.services.compression import CompressionService
+        from clickhouse_migrator.services.catalog import CatalogService
+        from clickhouse_migrator.services.materialize import MaterializationService
+        from clickhouse_migrator.services.tiering import TieringService
+        from clickhouse_migrator.services.autotune import AutotuneService
+        from clickhouse_migrator.services.benchmark import BenchmarkService
+        from clickhouse_migrator.services.prewarm import PrewarmService
+        from clickhouse_migrator.services.heat import HeatScorer
+        from clickhouse_migrator.services.rollback import RollbackService
+        from clickhouse_migrator.services.verify import VerifyService
+        from clickhouse_migrator.services.merge import MergeScheduler
         from clickhouse_migrator.utils.lock import TableLock
         
         self.partition_manager = PartitionManager()
         self.validator = DataValidator()
         self.resume_service = ResumeService()
         self.table_lock = TableLock()
+        self.compression_service = CompressionService()
+        self.catalog_service = CatalogService()
+        # 索引/投影延迟物化服务，协调器可注入按配置设置并发上限的实例
+        self.materialization_service = MaterializationService()
+        self.tiering_service = TieringService()
+        self.autotune_service = AutotuneService()
+        self.benchmark_service = BenchmarkService()
+        # 切换后缓存预热服务，协调器注入连接池后可并发预热
+        self.prewarm_service = PrewarmService()
+        self.heat_scorer = HeatScorer()
+        self.rollback_service = RollbackService(self.partition_manager, self.tiering_service)
+        # 迁移后巡检服务，协调器注入连接池与运行历史库
+        self.verify_service = VerifyService(self.validator, self.partition_manager, self.tiering_service)
+        # 最近一次表目录筛选汇总（整库/跨库迁移时写入报告），按线程保存，守护进程中并发任务互不覆盖
+        self._local = threading.local()
+        # 合并调度器，协调器可注入带连接池的实例以并发执行OPTIMIZE
+        self.merge_scheduler = MergeScheduler()
+        # 连接池与带宽调控器由协调器注入（并发迁移及字节限速时使用）
+        self.client_pool = None
+        self.bandwidth_governor = None
+        # 运行控制器（维护窗口、暂停/恢复/排空、在线调整配置），由协调器注入
+        self.controller = None
+        # 长查询执行器，由协调器注入；为None时同步执行
+        self.query_runner = None
+        # 按字节加权的进度跟踪器（终端进度行与状态接口共用）
+        self.progress_tracker = ProgressTracker()
+        # 客户端性能剖析（--profile），由协调器注入；默认不启用，所有计时接口为空操作
+        self.profiler = Profiler()
+        # 运行历史库，由协调器注入；用于剩余时间估算与复用历史调优结果
+        self.history_service = None
+        # 元数据快照（--metadata-cache），由协调器注入；未变化的表复用上次运行的发现结果
+        self.metadata_cache = None
+        # 本次运行标识，参与生成插入去重令牌
+        self.run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+        # 每次迁移表时生成的标识（守护进程中同一表可被多次提交迁移，不能沿用上一次的去重令牌）
+        self.table_run_ids = {}
+
+    @property
+    def catalog_summary(self) -> Optional[Dict]:
+        return getattr(self._local, "catalog_summary", None)
+
+    @catalog_summary.setter
+    def catalog_summary(self, value: Optional[Dict]):
+        self._local.catalog_summary = value
+    
+    def execute_long_query(self, client, sql: str, query_id: str, logger, label: str = "", settings: Optional[Dict] = None,
+                           on_progress=None):
+        """
+        执行长耗时SQL（如分区复制）
+        配置了异步执行器时以固定query_id提交并轮询服务端进度，否则同步执行
+        :param on_progress: 轮询到服务端进度时的回调（同步执行时不调用）
+        """
+        if self.query_runner is None:
+            client.command(sql, settings=settings)
+            return
+        self.query_runner.execute(client, sql, query_id, logger, settings=settings, label=label, on_progress=on_progress)
+    
+    def build_deduplication_token(self, db: str, table: str, partition: str, chunk: int = 0, generation: int = 0) -> str:
+        """
+        生成分区复制的插入去重令牌（insert_deduplication_token）
+        同一运行内对同一分区块的重试使用相同令牌，已提交的数据块会被服务端去重
+        :param chunk: 分区内的块序号
+        :param generation: 清理备份表分区后重新写入的代次，清理后需使用新令牌
+        """
+        run_id = self.table_run_ids.get(f"{db}.{table}", self.run_id)
+        raw = f"{run_id}|{db}|{table}|{partition}|{chunk}|{generation}"
+        return hashlib.md5(raw.encode("utf-8")).hexdigest()
+    
+    def copy_partition(self, client, logger, db: str, table: str, backup_table: str, partition: str,
+                       partition_key: str, src_count: int, retry_policy: RetryPolicy, verify_first: bool = False,
+                       extra_settings: Optional[Dict] = None, on_progress=None):
+        """
+        幂等复制单个分区（INSERT携带去重令牌，失败重试前核对备份表分区状态）
+        :param verify_first: 首次写入前也核对备份表分区状态（断点续传时备份表可能已有该分区数据）
+        :param extra_settings: 复制查询的额外设置（如服务端限速）
+        :param on_progress: 复制查询的进度回调（如带宽租约按写入进度扣费）
+        - 备份表分区行数与源表一致：已写入完成，跳过写入；
+        - 备份表分区存在部分数据：删除该分区后以新令牌重新写入；
+        - 备份表分区无数据：沿用原令牌重新写入（服务端已提交的数据块会被去重）
+        """
+        where_clause = self.partition_manager.generate_partition_where_clause(partition_key, partition)
+        insert_sql = f"""
+        INSERT INTO {db}.{backup_table} 
+        SELECT * FROM {db}.{table} WHERE {where_clause}
+        """
+        formatted_partition = self.partition_manager.format_partition_value_for_drop(partition)
+        state = {"generation": 0}
+
+        def attempt_copy(attempt: int):
+            if attempt > 1 or verify_first:
+                dst_count = self.validator.get_row_count(client, db, backup_table, partition, partition_key)
+                if dst_count == src_count:
+                    logger.info(f"分区{partition}已在上次尝试中完整写入备份表，跳过重复写入")
+                    return
+                if dst_count > 0:
+                    logger.warning(f"备份表分区{partition}存在部分数据（{dst_count}/{src_count}行），清理后重新写入")
+                    client.command(f"ALTER TABLE {db}.{backup_table} DROP PARTITION {formatted_partition}")
+                    state["generation"] += 1
+            settings = dict(extra_settings or {})
+            settings.update({
+                "insert_deduplicate": 1,
+                "insert_deduplication_token": self.build_deduplication_token(
+                    db, table, partition, 0, state["generation"]
+                )
+            })
+            query_id = AsyncQueryRunner.build_query_id("insert", db, table, partition)
+            self.execute_long_query(client, insert_sql, query_id, logger,
+                                    label=f"复制分区{db}.{table}:{partition}", settings=settings,
+                                    on_progress=on_progress)
+
+        retry_policy.call(attempt_copy, logger, f"复制分区{db}.{table}:{partition}")
+    
+    def table_exists(self, client, db: str, table: str) -> bool:
+        """检查表是否存在"""
+        result = client.query(f"SELECT name FROM system.tables WHERE database = '{db}' AND name = '{table}'")
+        return len(result.result_rows) > 0
+    
+    def check_backup_schema(self, client, db: str, table: str, backup_table: str) -> bool:
+        """校验已有备份表与源表的结构是否一致（列名/类型/顺序、分区键、排序键）"""
+        columns_result = client.query(f"""
+            SELECT table, groupArray((name, type))
+            FROM (
+                SELECT table, name, type
+                FROM system.columns
+                WHERE database = '{db}' AND table IN ('{table}', '{backup_table}')
+                ORDER BY table, position
+            )
+            GROUP BY table
+        """)
+        columns = {row[0]: [tuple(c) for c in row[1]] for row in columns_result.result_rows}
+        keys_result = client.query(f"""
+            SELECT name, partition_key, sorting_key
+            FROM system.tables
+            WHERE database = '{db}' AND name IN ('{table}', '{backup_table}')
+        """)
+        keys = {row[0]: (row[1], row[2]) for row in keys_result.result_rows}
+        return (
+            table in columns and columns.get(table) == columns.get(backup_table)
+            and table in keys and keys.get(table) == keys.get(backup_table)
+        )
+    
+    def reconcile_backup_partitions(self, client, logger, progress: Dict, db: str, table: str, backup_table: str) -> Dict:
+        """
+        断点续传时按system.parts元数据对齐源表与已有备份表的分区状态
+        半复制分区会从备份表中删除，后续重新复制
+        :return: {'classification': 分区分类统计, 'copied': 已完整复制待删源分区的分区值集合, 'done_rows': 已完成分区行数}
+        """
+        stats = self.partition_manager.get_partition_stats(client, db, [table, backup_table])
+        src_stats, backup_stats = stats[table], stats[backup_table]
+        classification = self.resume_service.classify_partitions(src_stats, backup_stats)
+        logger.info(
+            f"备份表{db}.{backup_table}分区对账：已完成{len(classification['done'])}个，"
+            f"已复制待删除源分区{len(classification['copied'])}个，半复制{len(classification['half_copied'])}个，"
+            f"未开始{len(classification['untouched'])}个"
+        )
+
+        for partition_id in classification["half_copied"]:
+            logger.warning(
+                f"分区{backup_stats[partition_id]['partition']}复制中断（源表{src_stats[partition_id]['rows']}行，"
+                f"备份表{backup_stats[partition_id]['rows']}行），清理备份表分区后重新复制"
+            )
+            client.command(f"ALTER TABLE {db}.{backup_table} DROP PARTITION ID '{partition_id}'")
+
+        done_partitions = [backup_stats[pid]["partition"] for pid in classification["done"]]
+        self.resume_service.mark_partitions_completed(progress, db, table, done_partitions)
+        return {
+            "classification": {state: len(ids) for state, ids in classification.items()},
+            "copied": set(backup_stats[pid]["partition"] for pid in classification["copied"]),
+            "done_partitions": len(done_partitions),
+            "done_rows": sum(backup_stats[pid]["rows"] for pid in classification["done"])
+        }
+    
+    def preview_table_compression(self, client, logger, db: str, table: str, create_sql: str,
+                                  codecs: Dict, block_settings: Dict) -> Dict:
+        """在样本分区上预估按配置改写压缩编码后的效果（不执行迁移）"""
+        stats = self.partition_manager.get_partition_stats(client, db, [table])[table]
+        partition_id = self.compression_service.choose_sample_partition(stats)
+        partition_key = self.partition_manager.get_table_partition_key(client, db, table)
+        where_clause = self.partition_manager.generate_partition_where_clause(
+            partition_key, stats[partition_id]["partition"]
+        )
+        preview_table = table + CODEC_PREVIEW_SUFFIX
+        preview_create_sql = self.replace_table_name(create_sql, preview_table)
+        if codecs:
+            preview_create_sql = self.apply_column_codecs(preview_create_sql, codecs)
+        if block_settings:
+            preview_create_sql = self.append_table_settings(preview_create_sql, block_settings)
+        preview = self.compression_service.preview_compression(
+            client, logger, db, table, preview_table, preview_create_sql, partition_id, where_clause
+        )
+        preview["sample_partition"] = stats[partition_id]["partition"]
+        return preview
+    
+    def copy_partition_throttled(self, client, logger, db: str, table: str, backup_table: str, partition: str,
+                                 partition_key: str, src_count: int, retry_policy: RetryPolicy,
+                                 partition_bytes: int, verify_first: bool = False,
+                                 strategy_settings: Optional[Dict] = None):
+        """
+        在带宽预算内复制分区（未配置带宽调控器时直接复制）
+        :param strategy_settings: 复制策略的查询设置（如自动调优选出的max_insert_threads）
+        """
+        if self.bandwidth_governor is None:
+            self.copy_partition(client, logger, db, table, backup_table, partition, partition_key,
+                                src_count, retry_policy, verify_first=verify_first,
+                                extra_settings=strategy_settings)
+            return
+        query_id = AsyncQueryRunner.build_query_id("insert", db, table, partition)
+        # 等待带宽预算的时间单独计时，时间线上可区分限速等待与实际复制
+        wait_span = self.profiler.begin("throttle_wait", bytes=partition_bytes)
+        try:
+            with self.bandwidth_governor.throttle(client, partition_bytes, src_count, query_id, logger) as lease:
+                self.profiler.end(wait_span)
+                self.copy_partition(client, logger, db, table, backup_table, partition, partition_key,
+                                    src_count, retry_policy, verify_first=verify_first,
+                                    extra_settings=dict(strategy_settings or {}, **lease.settings),
+                                    on_progress=lease.report)
+        finally:
+            self.profiler.end(wait_span)
+
+    def move_partition_to_volume(self, client, logger, db: str, backup_table: str, partition: str, partition_id: str,
+                                 volume: str, retry_policy: RetryPolicy):
+        """
+        将备份表分区搬迁到指定卷（move_partition复制策略）
+        每次尝试前按system.parts核对分区数据块所在磁盘：已全部在目标卷上（断点续传跳过了复制，
+        或上次尝试已搬迁成功）时跳过，避免MOVE因数据块已在目标卷而报错
+        """
+        formatted_partition = self.partition_manager.format_partition_value_for_drop(partition)
+        volume_disks = ", ".join(
+            f"'{disk}'" for disk in self.tiering_service.get_policy_disks(
+                client, self.tiering_service.get_table_policy(client, db, backup_table), volume
+            )
+        )
+
+        def attempt_move(attempt: int):
+            result = client.query(f"""
+                SELECT count()
+                FROM system.parts
+                WHERE database = '{db}' AND table = '{backup_table}' AND partition_id = '{partition_id}'
+                  AND active = 1 AND disk_name NOT IN ({volume_disks})
+            """)
+            if not result.result_rows[0][0]:
+                logger.info(f"备份表分区{partition}已全部在卷{volume}上，跳过搬迁")
+                return
+            client.command(f"ALTER TABLE {db}.{backup_table} MOVE PARTITION {formatted_partition} TO VOLUME '{volume}'")
+
+        retry_policy.call(attempt_move, logger, f"搬迁备份表分区{partition}")
+
+    def copy_partition_via_staging(self, client, logger, db: str, table: str, backup_table: str, staging_table: str,
+                                   partition: str, partition_key: str, src_count: int, retry_policy: RetryPolicy,
+                                   partition_bytes: int, strategy_settings: Optional[Dict] = None):
+        """
+        经中转表复制分区：先幂等写入中转表，再ATTACH PARTITION FROM到备份表（整分区原子出现）
+        ATTACH前核对备份表分区行数，重试不会重复挂载
+        """
+        formatted_partition = self.partition_manager.format_partition_value_for_drop(partition)
+        dst_count = self.validator.get_row_count(client, db, backup_table, partition, partition_key)
+        if dst_count == src_count:
+            logger.info(f"分区{partition}已挂载到备份表，跳过重复写入")
+            client.command(f"ALTER TABLE {db}.{staging_table} DROP PARTITION {formatted_partition}")
+            return
+        if dst_count > 0:
+            logger.warning(f"备份表分区{partition}存在部分数据（{dst_count}/{src_count}行），清理后重新写入")
+            client.command(f"ALTER TABLE {db}.{backup_table} DROP PARTITION {formatted_partition}")
+        self.copy_partition_throttled(client, logger, db, table, staging_table, partition, partition_key,
+                                      src_count, retry_policy, partition_bytes, verify_first=True,
+                                      strategy_settings=strategy_settings)
+
+        def attempt_attach(attempt: int):
+            if attempt > 1 and self.validator.get_row_count(client, db, backup_table, partition, partition_key) == src_count:
+                return
+            client.command(
+                f"ALTER TABLE {db}.{backup_table} ATTACH PARTITION {formatted_partition} FROM {db}.{staging_table}"
+            )
+
+        retry_policy.call(attempt_attach, logger, f"挂载中转表分区{db}.{staging_table}:{partition}")
+        client.command(f"ALTER TABLE {db}.{staging_table} DROP PARTITION {formatted_partition}")
     
+    def discover(self, cached: Optional[Dict], db: str, table: str, field: str, loader):
+        """
+        获取表的一项元数据：快照中已有时直接复用，否则调用loader查询并写入快照
+        :param cached: MetadataCache.lookup返回的元数据，None表示未启用元数据快照
+        """
+        if cached is not None and field in cached:
+            return cached[field]
+        value = loader()
+        if cached is not None:
+            cached[field] = value
+            self.metadata_cache.update(db, table, field, value)
+        return value
+
     def get_create_table_sql(self, client, db: str, table: str, logger) -> str:
         """获取表的完整建表语句（兼容不同ClickHouse版本的返回格式）"""
         try:
@@ -45,11 +372,42 @@ class MigrationService:
         except Exception as e:
             raise RuntimeError(f"获取{db}.{table}建表语句失败：{str(e)}")
     
-    def modify_create_sql_for_s3(self, create_sql: str, s3_policy: str, table: str, backup_suffix: str = "_backup_s3") -> str:
-        """修改建表语句，替换为S3存储策略，并生成备份表建表语句"""
-        # 1. 生成备份表名（保留原数据库）
-        backup_table = table + backup_suffix
+    def append_table_settings(self, create_sql: str, settings: Dict) -> str:
+        """
+        向建表语句追加表级SETTINGS（已存在的同名设置将被覆盖）
+        :param settings: 设置字典，如{'non_replicated_deduplication_window': 1000}
+        """
+        for name, value in settings.items():
+            value_sql = f"'{value}'" if isinstance(value, str) else str(value)
+            # 表级SETTINGS位于语句末尾，取最后一个SETTINGS子句
+            settings_matches = list(re.finditer(r"\bSETTINGS\s+", create_sql, re.IGNORECASE))
+            if not settings_matches:
+                # 无SETTINGS → 在ENGINE子句后添加
+                create_sql = re.sub(
+                    r"(ENGINE\s*=\s*\w*MergeTree\s*[^;]+?)(;?)$",
+                    lambda m: f"{m.group(1)} SETTINGS {name} = {value_sql}{m.group(2)}",
+                    create_sql.rstrip(),
+                    count=1,
+                    flags=re.IGNORECASE
+                )
+                continue
 
+            head = create_sql[:settings_matches[-1].end()]
+            tail = create_sql[settings_matches[-1].end():]
+            setting_pattern = re.compile(rf"\b{name}\s*=\s*('[^']*'|[^,\s;]+)", re.IGNORECASE)
+            if setting_pattern.search(tail):
+                # 已有同名设置 → 替换
+                tail = setting_pattern.sub(f"{name} = {value_sql}", tail, count=1)
+            else:
+                # 追加到SETTINGS末尾（位于表注释COMMENT之前）
+                comment_match = re.search(r"\s+COMMENT\s+'", tail, re.IGNORECASE)
+                end = comment_match.start() if comment_match else len(tail.rstrip().rstrip(";").rstrip())
+                tail = f"{tail[:end]}, {name} = {value_sql}{tail[end:]}"
+            create_sql = head + tail
+        return create_sql
+    
+    def replace_table_name(self, create_sql: str, new_table: str) -> str:
+        """将建表语句中的表名替换为new_table（保留原数据库）"""
         # 关键修改1：忽略大小写匹配 CREATE TABLE [db.]table，精准捕获库名和表名
         # 匹配模式：兼容 create table / CREATE TABLE，支持空格/换行，捕获 (库名, 表名)
         pattern = re.compile(r"(CREATE\s+TABLE\s+)([^\s.]+)\.([^\s]+)", re.IGNORECASE)
@@ -57,47 +415,70 @@ class MigrationService:
         if match:
             # 捕获到库名（如dws）和原表名（如ads_book_panel_30di）
             db_name = match.group(2)
-            original_table = match.group(3)
-            # 替换为 库名.备份表名
-            create_sql = pattern.sub(
-                f"\\1{db_name}.{backup_table}",
-                create_sql,
-                count=1
-            )
-        else:
-            # 兼容无库名的情况（如CREATE TABLE table (...)）
-            pattern_no_db = re.compile(r"(CREATE\s+TABLE\s+)([^\s]+)", re.IGNORECASE)
-            create_sql = pattern_no_db.sub(
-                f"\\1{backup_table}",
+            # 替换为 库名.新表名
+            return pattern.sub(
+                f"\\1{db_name}.{new_table}",
                 create_sql,
                 count=1
             )
+        # 兼容无库名的情况（如CREATE TABLE table (...)）
+        pattern_no_db = re.compile(r"(CREATE\s+TABLE\s+)([^\s]+)", re.IGNORECASE)
+        return pattern_no_db.sub(
+            f"\\1{new_table}",
+            create_sql,
+            count=1
+        )
+    
+    def apply_column_codecs(self, create_sql: str, codecs: Dict) -> str:
+        """
+        按配置改写列压缩编码
+        :param codecs: {列名: 编码}，键'*'表示全表默认编码，如{'*': 'ZSTD(3)', 'event_time': 'Delta, ZSTD(3)'}；
+                       编码也可为列表，如['Delta', 'ZSTD(3)']
+        """
+        definitions = ddl.split_column_definitions(create_sql)
+        new_definitions = []
+        for definition in definitions:
+            column = ddl.get_column_name(definition)
+            codec = codecs.get(column, codecs.get("*")) if column is not None else None
+            # ALIAS/EPHEMERAL列不落盘，不支持CODEC
+            if codec and not re.search(r"\b(ALIAS|EPHEMERAL)\b", ddl.mask_string_literals(definition), re.IGNORECASE):
+                if isinstance(codec, (list, tuple)):
+                    codec = ", ".join(codec)
+                definition = ddl.set_column_codec(definition, codec)
+            new_definitions.append(definition)
+        return ddl.replace_column_definitions(create_sql, new_definitions)
+    
+    def modify_create_sql_for_s3(self, create_sql: str, s3_policy: str, table: str, backup_suffix: str = "_backup_s3",
+                                 extra_settings: Optional[Dict] = None, codecs: Optional[Dict] = None,
+                                 defer_secondary: bool = False, ttl: Optional[str] = None) -> str:
+        """
+        修改建表语句，替换为S3存储策略，并生成备份表建表语句
+        :param extra_settings: 备份表额外的表级SETTINGS（如插入去重窗口、压缩块大小）
+        :param codecs: 列压缩编码改写配置，见apply_column_codecs
+        :param defer_secondary: 备份表不带数据跳过索引与投影（复制完成后再物化）
+        :param ttl: 表级TTL表达式（替换原有TTL）
+        """
+        # 1. 生成备份表名（保留原数据库）
+        backup_table = table + backup_suffix
+        create_sql = self.replace_table_name(create_sql, backup_table)
 
-        # 2. 处理storage_policy：确保添加到原SETTINGS后，兼容大小写
-        # 情况1：已有storage_policy → 替换（忽略大小写）
-        storage_policy_pattern = re.compile(r"storage_policy\s*=\s*['\"][^'\"]+['\"]", re.IGNORECASE)
-        if storage_policy_pattern.search(create_sql):
-            create_sql = storage_policy_pattern.sub(
-                f"storage_policy = '{s3_policy}'",
-                create_sql
-            )
-        # 情况2：有SETTINGS但无storage_policy → 追加（忽略大小写）
-        elif re.search(r"SETTINGS\s+", create_sql, re.IGNORECASE):
-            create_sql = re.sub(
-                r"(SETTINGS\s+[^;]+)",  # 匹配SETTINGS后的内容
-                r"\1, storage_policy = '" + s3_policy + "'",
-                create_sql,
-                flags=re.IGNORECASE
-            )
-        # 情况3：无SETTINGS → 在ENGINE后添加
-        else:
-            # 匹配ENGINE行末尾（兼容MergeTree/其他引擎，忽略大小写）
-            create_sql = re.sub(
-                r"(ENGINE\s*=\s*MergeTree\s*[^;]+)(;?)",
-                r"\1 SETTINGS storage_policy = '" + s3_policy + r"'\2",
-                create_sql,
-                flags=re.IGNORECASE
-            )
+        # 批量复制时不逐分区构建索引与投影
+        if defer_secondary:
+            create_sql, _ = self.materialization_service.split_deferred(create_sql)
+
+        # 列压缩编码改写（迁移会重写全部数据，是调整压缩的最低成本时机）
+        if codecs:
+            create_sql = self.apply_column_codecs(create_sql, codecs)
+
+        if ttl:
+            create_sql = ddl.set_table_ttl(create_sql, ttl)
+
+        # 2. 处理storage_policy：已有则替换，否则追加到原SETTINGS后（兼容大小写）
+        create_sql = self.append_table_settings(create_sql, {"storage_policy": s3_policy})
+
+        # 3. 追加额外的表级设置
+        if extra_settings:
+            create_sql = self.append_table_settings(create_sql, extra_settings)
 
         # 清理多余空格，确保格式正确
         create_sql = re.sub(r"\s+", " ", create_sql)
@@ -308,6 +689,7 @@ class MigrationService:
     def migrate_distributed_table(self, client, config: Dict, logger, progress: Dict, db: str, table: str) -> Dict:
         """迁移分布式表"""
         migration_result = {
+            "database": db,
             "table": table,
             "start_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "end_time": "",
@@ -316,6 +698,7 @@ class MigrationService:
             "local_tables": []
         }
         
+        distributed_span = self.profiler.begin("distributed_table", db=db, table=table)
         try:
             logger.info(f"开始迁移分布式表：{db}.{table}")
             
@@ -344,6 +727,11 @@ class MigrationService:
                 )
                 local_results.append(local_result)
                 
+                if local_result["status"] == "drained":
+                    migration_result["status"] = "drained"
+                    migration_result["local_tables"] = local_results
+                    migration_result["end_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    return migration_result
                 if local_result["status"] == "failed":
                     logger.error(f"本地表{local_table_info['db']}.{local_table_info['table']}迁移失败")
                     raise RuntimeError(f"本地表迁移失败：{local_result['error']}")
@@ -366,9 +754,34 @@ class MigrationService:
             logger.error(error_msg)
             migration_result["error"] = error_msg
             migration_result["end_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        finally:
+            self.profiler.end(distributed_span)
         
         return migration_result
     
+    def record_check(self, migration_result: Dict, check_result: Dict):
+        """
+        记录分区校验结果：汇总计入check_summary；通过的分区按列追加到partition_log（供运行历史导入），
+        check_results只保留校验失败的分区和前CHECK_RESULTS_SAMPLE个分区，避免分区很多时报告膨胀
+        """
+        summary = migration_result["check_summary"]
+        summary["checked"] += 1
+        summary["rows"] += check_result["src_count"]
+        summary["bytes"] += check_result["bytes"]
+        summary["cost_time"] = round(summary["cost_time"] + check_result["cost_time"], 2)
+        if check_result["passed"]:
+            summary["passed"] += 1
+            partition_log = migration_result["partition_log"]
+            partition_log["partition"].append(check_result["partition"])
+            partition_log["rows"].append(check_result["src_count"])
+            partition_log["bytes"].append(check_result["bytes"])
+            partition_log["cost_time"].append(check_result["cost_time"])
+            partition_log["checksum"].append(check_result.get("src_checksum"))
+        else:
+            summary["failed"] += 1
+        if not check_result["passed"] or len(migration_result["check_results"]) < CHECK_RESULTS_SAMPLE:
+            migration_result["check_results"].append(check_result)
+
     def migrate_single_table(self, client, config: Dict, logger, progress: Dict, db: str, table: str) -> Dict:
         """迁移单个表到S3存储策略（兼容任意分区字段/复合分区）"""
         # 检查是否为分布式表
@@ -376,6 +789,7 @@ class MigrationService:
             return self.migrate_distributed_table(client, config, logger, progress, db, table)
         
         migration_result = {
+            "database": db,
             "table": table,
             "start_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "end_time": "",
@@ -385,13 +799,22 @@ class MigrationService:
             "total_rows": 0,
             "migrated_rows": 0,
             "error": "",
-            "check_results": []
+            "check_results": [],
+            "check_summary": {"checked": 0, "passed": 0, "failed": 0, "rows": 0, "bytes": 0, "cost_time": 0.0},
+            "partition_log": {"partition": [], "rows": [], "bytes": [], "cost_time": [], "checksum": []}
         }
 
         backup_table = table + "_backup_s3"
         lock_file = None
+        table_span = self.profiler.begin("table", db=db, table=table)
         try:
+            # 维护窗口/暂停/排空检查
+            if self.controller:
+                self.profiler.phase("checkpoint")
+                self.controller.checkpoint(logger, f"{db}.{table}")
+
             # 1. 检查表是否被锁定
+            self.profiler.phase("lock")
             if self.table_lock.is_locked(db, table):
                 logger.warning(f"表{db}.{table}正在被其他进程迁移，跳过迁移")
                 migration_result["status"] = "locked"
@@ -405,33 +828,89 @@ class MigrationService:
                 return migration_result
             
             logger.info(f"获取表{db}.{table}迁移锁成功")
+            self.table_run_ids[f"{db}.{table}"] = datetime.now().strftime("%Y%m%d%H%M%S%f")
             
             # 3. 检查源表是否存在且为本地存储策略
             logger.info(f"开始迁移表：{db}.{table}")
-            create_sql = self.get_create_table_sql(client, db, table, logger)
+            self.profiler.phase("ddl")
+            cached = self.metadata_cache.lookup(client, db, table) if self.metadata_cache is not None else None
+            if cached:
+                logger.info(f"{db}.{table}元数据未变化，复用元数据快照")
+            create_sql = self.discover(
+                cached, db, table, "create_sql", lambda: self.get_create_table_sql(client, db, table, logger)
+            )
             if config["s3_policy"] in create_sql:
                 logger.warning(f"{db}.{table}已使用S3存储策略，跳过迁移")
                 migration_result["status"] = "skipped"
                 return migration_result
 
+            # 压缩编码改写与压缩块设置
+            codecs = config.get("codecs") or {}
+            block_settings = self.compression_service.get_block_settings(config)
+            if config.get("compression_preview"):
+                migration_result["compression_preview"] = self.preview_table_compression(
+                    client, logger, db, table, create_sql, codecs, block_settings
+                )
+                migration_result["status"] = "previewed"
+                migration_result["end_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                return migration_result
+            self.profiler.phase("inspect")
+            before_bytes = self.compression_service.get_table_bytes(client, db, [table])[table]["bytes_on_disk"]
+            layout_before = self.merge_scheduler.get_part_layout(client, db, [table])[table]
+            # 源表分区列表及各分区磁盘字节数（用于带宽计费），流式读取为紧凑的分区列表
+            source_partitions = self.discover(
+                cached, db, table, "partitions", lambda: self.partition_manager.collect_partitions(client, db, table)
+            )
+
             # 2. 创建备份表（S3存储策略）
-            new_create_sql = self.modify_create_sql_for_s3(create_sql, config["s3_policy"], table)
+            self.profiler.phase("create_backup")
+            # 非Replicated表需显式开启插入去重，保证分区复制重试的幂等性
+            backup_settings = dict(block_settings)
+            backup_settings.update(self.merge_scheduler.get_layout_settings(config))
+            if "ReplicatedMergeTree" not in create_sql:
+                backup_settings["non_replicated_deduplication_window"] = DEFAULT_DEDUPLICATION_WINDOW
+            # 延迟构建索引与投影：复制完成后再按分区物化
+            deferred_definitions = []
+            if config.get("defer_secondary"):
+                _, deferred_definitions = self.materialization_service.split_deferred(create_sql)
+                if deferred_definitions:
+                    logger.info(f"{db}.{table}的{len(deferred_definitions)}个索引/投影将在数据复制完成后物化")
+            with self.profiler.span("rewrite_ddl"):
+                new_create_sql = self.modify_create_sql_for_s3(
+                    create_sql, config["s3_policy"], table, extra_settings=backup_settings, codecs=codecs,
+                    defer_secondary=bool(deferred_definitions)
+                )
             logger.debug(f"备份表建表语句：{new_create_sql}")
-            client.command(f"DROP TABLE IF EXISTS {db}.{backup_table}")
-            client.command(new_create_sql)
 
-            # 校验备份表是否存在
-            def check_table_exists(client, db, table, logger):
-                result = client.query(f"SELECT name FROM system.tables WHERE database = '{db}' AND name = '{table}'")
-                return len(result.result_rows) > 0
-
-            if not check_table_exists(client, db, backup_table, logger):
-                raise RuntimeError(f"备份表{db}.{backup_table}创建失败！建表语句：\n{new_create_sql}")
-            logger.info(f"创建备份表成功：{db}.{backup_table}")
+            # 断点续传时复用结构一致的已有备份表，保留已复制的数据
+            reconcile = None
+            progress = self.resume_service.initialize_table_progress(progress, db, table)
+            if config["resume"] and self.table_exists(client, db, backup_table):
+                if not self.check_backup_schema(client, db, table, backup_table):
+                    raise RuntimeError(
+                        f"已有备份表{db}.{backup_table}与源表结构不一致，无法续传；请核对备份表数据后手动处理"
+                    )
+                logger.info(f"检测到已有备份表{db}.{backup_table}且结构一致，复用备份表续传")
+                self.profiler.phase("reconcile")
+                reconcile = self.reconcile_backup_partitions(client, logger, progress, db, table, backup_table)
+                migration_result["resume_reconcile"] = reconcile["classification"]
+            else:
+                client.command(f"DROP TABLE IF EXISTS {db}.{backup_table}")
+                client.command(new_create_sql)
+                if not self.table_exists(client, db, backup_table):
+                    raise RuntimeError(f"备份表{db}.{backup_table}创建失败！建表语句：\n{new_create_sql}")
+                logger.info(f"创建备份表成功：{db}.{backup_table}")
+                # 新建的备份表不含任何数据，进度文件中的已完成分区不再可信
+                self.resume_service.reset_table_progress(progress, db, table)
 
             # 3. 获取分区列表+动态解析分区键
-            all_partitions = self.partition_manager.get_table_partitions(client, db, table)
-            if not all_partitions:
+            self.profiler.phase("discover")
+            if cached is not None:
+                # 源表在创建备份表与续传对账期间没有变化，直接使用已读取的分区列表
+                all_partitions = source_partitions
+            else:
+                all_partitions = self.partition_manager.collect_partitions(client, db, table)
+            if not all_partitions and reconcile is None:
                 logger.warning(f"{db}.{table}无分区数据，直接重命名")
                 client.command(f"DROP TABLE {db}.{table}")
                 client.command(f"RENAME TABLE {db}.{backup_table} TO {db}.{table}")
@@ -440,74 +919,233 @@ class MigrationService:
                 migration_result["end_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 return migration_result
 
+            # 迁移前快照：源表全部分区硬链接到快照表，失败时可使用--rollback秒级回滚
+            if config.get("snapshot") and reconcile is None:
+                migration_result["snapshot"] = self.rollback_service.create_snapshot(
+                    client, db, table, create_sql, self.replace_table_name, logger
+                )
+
             # 解析表的实际分区键（如idate、dt、date_dt、复合分区）
-            partition_key = self.partition_manager.get_table_partition_key(client, db, table)
+            partition_key = self.discover(
+                cached, db, table, "partition_key",
+                lambda: self.partition_manager.get_table_partition_key(client, db, table)
+            )
             logger.info(f"表{db}.{table}的分区键：{partition_key}")
 
-            migration_result["total_partitions"] = len(all_partitions)
-            uncompleted_partitions = self.resume_service.get_uncompleted_partitions(progress, db, table, all_partitions)
+            # 源表中剩余的分区均需迁移（已复制的分区仅校验后删除源分区）
+            uncompleted_partitions = all_partitions
+            copied_partitions = reconcile["copied"] if reconcile else set()
+            done_partitions = reconcile["done_partitions"] if reconcile else 0
+            migration_result["total_partitions"] = len(all_partitions) + done_partitions
+            migration_result["completed_partitions"] = done_partitions
             if uncompleted_partitions:
-                logger.info(f"待迁移分区数：{len(uncompleted_partitions)}，分区列表：{uncompleted_partitions}")
+                logger.info(
+                    f"待迁移分区数：{len(uncompleted_partitions)}（{format_bytes(uncompleted_partitions.total_bytes)}），"
+                    f"分区：{describe_partitions(uncompleted_partitions)}"
+                )
             else:
-                logger.info(f"{db}.{table}所有分区已迁移完成")
-                migration_result["status"] = "completed"
-                migration_result["completed_partitions"] = len(all_partitions)
-                migration_result["end_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                return migration_result
-
-            # 4. 初始化表级进度
-            progress = self.resume_service.initialize_table_progress(progress, db, table)
+                logger.info(f"{db}.{table}所有分区已迁移到备份表，直接进行全表校验与切换")
+            self.progress_tracker.register_table(
+                db, table, uncompleted_partitions.total_bytes,
+                len(uncompleted_partitions), planned=config["mode"] != "single",
+                prior_rate=self.history_service.get_table_rate(config["host"], db, table) if self.history_service else None,
+                run_id=config.get("job_id", "")
+            )
 
             # 5. 全表总行数统计
-            total_rows = self.validator.get_row_count(client, db, table)
+            total_rows = self.validator.get_row_count(client, db, table) + (reconcile["done_rows"] if reconcile else 0)
             migration_result["total_rows"] = total_rows
             logger.info(f"{db}.{table}总数据量：{total_rows}行")
 
-            # 6. 逐个分区迁移（兼容任意分区字段）
-            for idx, partition in enumerate(uncompleted_partitions):
-                logger.info(f"开始迁移分区：[{idx + 1}/{len(uncompleted_partitions)}]：{partition}")
-                start_time = time.time()
+            # 迁移前查询基准：仅在源表数据完整（非续传）时执行，否则前后对比没有意义
+            benchmark_queries, benchmark_before = [], None
+            if config.get("benchmark"):
+                self.profiler.phase("benchmark")
+                if reconcile is not None:
+                    logger.warning(f"{db}.{table}为续传迁移，源表数据已不完整，跳过查询基准测试")
+                else:
+                    try:
+                        benchmark_queries = self.benchmark_service.get_queries(client, db, table, config, logger)
+                        if benchmark_queries:
+                            benchmark_before = self.benchmark_service.run(
+                                client, db, table, benchmark_queries, "before", config, logger
+                            )
+                    except Exception as e:
+                        logger.warning(f"{db}.{table}迁移前查询基准测试失败，跳过：{str(e)}")
 
-                # 6.1 生成动态WHERE条件，插入分区数据
-                where_clause = self.partition_manager.generate_partition_where_clause(partition_key, partition)
-                insert_sql = f"""
-                INSERT INTO {db}.{backup_table} 
-                SELECT * FROM {db}.{table} WHERE {where_clause}
-                """
-                client.command(insert_sql)
-                time.sleep(config["insert_interval"])
+            # 复制策略自动调优：在样本分区上试跑候选策略，剩余分区使用最优策略
+            self.profiler.phase("autotune")
+            strategy = AUTOTUNE_DEFAULT_STRATEGY
+            history_strategy = None
+            if config.get("autotune") and self.history_service is not None and not config.get("autotune_refresh"):
+                history_strategy = self.history_service.get_last_strategy(config["host"], db, table)
+            if history_strategy and uncompleted_partitions:
+                # 复用该表历史运行中选出的策略，省去样本试跑
+                strategy = history_strategy
+                migration_result["autotune"] = {"strategy": strategy, "source": "history"}
+                logger.info(f"{db}.{table}沿用历史调优结果：{strategy['method']}（{strategy['settings']}）")
+            elif config.get("autotune") and uncompleted_partitions:
+                remaining_stats = uncompleted_partitions.to_stats()
+                autotune_result = self.autotune_service.autotune(
+                    client, logger, db, table, config, remaining_stats,
+                    lambda name: self.replace_table_name(new_create_sql, name), partition_key, self.partition_manager,
+                    self.bandwidth_governor
+                )
+                strategy = autotune_result["strategy"]
+                migration_result["autotune"] = autotune_result
+            staging_table = table + "_staging_s3"
+            if strategy["method"] == "attach_from_staging":
+                client.command(f"DROP TABLE IF EXISTS {db}.{staging_table}")
+                client.command(self.replace_table_name(new_create_sql, staging_table))
 
-                # 6.2 分区数据一致性校验
-                src_count = self.validator.get_row_count(client, db, table, partition, partition_key)
-                dst_count = self.validator.get_row_count(client, db, backup_table, partition, partition_key)
-                check_result = {
-                    "partition": partition,
-                    "src_count": src_count,
-                    "dst_count": dst_count,
-                    "passed": src_count == dst_count,
-                    "cost_time": round(time.time() - start_time, 2)
-                }
-                migration_result["check_results"].append(check_result)
+            # 热点分区复制时同时写入文件系统缓存，切换后无需再从S3读取
+            cache_on_write_partitions = set()
+            if config.get("prewarm") and config.get("cache_on_write"):
+                cache_on_write_partitions = set(self.prewarm_service.get_hot_partitions(
+                    client, db, table, config["prewarm_partitions"]
+                ))
 
-                if not check_result["passed"]:
-                    raise RuntimeError(
-                        f"分区{partition}数据校验失败：源表{src_count}行，备份表{dst_count}行"
-                    )
-                logger.info(f"分区{partition}校验通过，原始条数：{check_result['src_count']}，迁移条数：{check_result['dst_count']}，耗时{check_result['cost_time']}秒")
+            # 6. 逐个分区迁移（兼容任意分区字段），瞬时故障按重试策略在分区级重试
+            retry_policy = RetryPolicy.from_config(config)
+            # 合并/变更感知调度：源分区正在合并或变更时先迁移其他空闲分区
+            scheduler = PartitionScheduler(
+                client, self.partition_manager, db, table, uncompleted_partitions, logger,
+                enabled=config.get("merge_aware"), max_wait=config.get("busy_partition_max_wait", 0),
+                poll_interval=config["poll_interval"], controller=self.controller
+            )
+            self.profiler.end_phase()
+            for idx, partition in enumerate(scheduler):
+                partition_span = self.profiler.begin("partition", db=db, table=table, partition=partition)
+                try:
+                    if self.controller:
+                        self.profiler.phase("checkpoint")
+                        self.controller.checkpoint(logger, f"{db}.{table}:{partition}")
+                    logger.info(f"开始迁移分区：[{idx + 1}/{len(uncompleted_partitions)}]：{partition}")
+                    start_time = time.time()
+                    self.progress_tracker.start_partition(db, table, partition, uncompleted_partitions.bytes_of(partition))
 
-                # 6.3 删除源表当前分区数据（核心修复：格式化分区值）
-                formatted_partition = self.partition_manager.format_partition_value_for_drop(partition)
-                drop_partition_sql = f"ALTER TABLE {db}.{table} DROP PARTITION {formatted_partition}"
-                logger.debug(f"删除分区SQL：{drop_partition_sql}")
-                client.command(drop_partition_sql)
-                logger.info(f"源表分区{partition}数据已删除\n")
+                    # 6.1 幂等复制分区数据
+                    self.profiler.phase("copy", query_id=AsyncQueryRunner.build_query_id("insert", db, table, partition))
+                    src_checksum = None
+                    if config.get("checksum"):
+                        # 记录迁移前指纹（行数与内容校验和），写入报告与运行历史，供verify模式核对
+                        src_fingerprint = retry_policy.call(
+                            lambda attempt: self.validator.get_fingerprint(client, db, table, partition, partition_key),
+                            logger, f"计算源表分区{partition}校验和"
+                        )
+                        src_count, src_checksum = src_fingerprint["rows"], src_fingerprint["checksum"]
+                    else:
+                        src_count = retry_policy.call(
+                            lambda attempt: self.validator.get_row_count(client, db, table, partition, partition_key),
+                            logger, f"统计源表分区{partition}行数"
+                        )
+                    formatted_partition = self.partition_manager.format_partition_value_for_drop(partition)
+                    copy_settings = strategy["settings"]
+                    if partition in cache_on_write_partitions:
+                        copy_settings = dict(copy_settings, **CACHE_ON_WRITE_SETTINGS)
+                    if strategy["method"] == "attach_from_staging":
+                        self.copy_partition_via_staging(
+                            client, logger, db, table, backup_table, staging_table, partition, partition_key, src_count,
+                            retry_policy, uncompleted_partitions.bytes_of(partition), strategy_settings=copy_settings
+                        )
+                    else:
+                        self.copy_partition_throttled(
+                            client, logger, db, table, backup_table, partition, partition_key, src_count, retry_policy,
+                            uncompleted_partitions.bytes_of(partition), verify_first=partition in copied_partitions,
+                            strategy_settings=copy_settings
+                        )
+                    if strategy["method"] == "move_partition":
+                        # 先写入首个卷，再整分区搬迁到对象存储卷
+                        self.move_partition_to_volume(
+                            client, logger, db, backup_table, partition, uncompleted_partitions.partition_id_of(partition),
+                            strategy["volume"], retry_policy
+                        )
+                    self.profiler.phase("insert_interval")
+                    time.sleep(config["insert_interval"])
 
-                # 6.4 更新进度
-                self.resume_service.update_partition_progress(progress, db, table, partition)
-                migration_result["completed_partitions"] += 1
-                migration_result["migrated_rows"] += src_count
+                    # 6.2 分区数据一致性校验
+                    self.profiler.phase("validate")
+                    self.progress_tracker.set_phase("validate")
+                    dst_checksum = None
+                    if src_checksum is not None:
+                        dst_fingerprint = retry_policy.call(
+                            lambda attempt: self.validator.get_fingerprint(client, db, backup_table, partition, partition_key),
+                            logger, f"计算备份表分区{partition}校验和"
+                        )
+                        dst_count, dst_checksum = dst_fingerprint["rows"], dst_fingerprint["checksum"]
+                    else:
+                        dst_count = retry_policy.call(
+                            lambda attempt: self.validator.get_row_count(client, db, backup_table, partition, partition_key),
+                            logger, f"统计备份表分区{partition}行数"
+                        )
+                    check_result = {
+                        "partition": partition,
+                        "src_count": src_count,
+                        "dst_count": dst_count,
+                        "passed": src_count == dst_count and src_checksum == dst_checksum,
+                        "bytes": uncompleted_partitions.bytes_of(partition),
+                        "cost_time": round(time.time() - start_time, 2)
+                    }
+                    if src_checksum is not None:
+                        check_result["src_checksum"] = src_checksum
+                        check_result["dst_checksum"] = dst_checksum
+                    self.record_check(migration_result, check_result)
+
+                    if not check_result["passed"]:
+                        raise RuntimeError(
+                            f"分区{partition}数据校验失败：源表{src_count}行，备份表{dst_count}行"
+                            + (f"，校验和{src_checksum}/{dst_checksum}" if src_checksum is not None else "")
+                        )
+                    logger.info(f"分区{partition}校验通过，原始条数：{check_result['src_count']}，迁移条数：{check_result['dst_count']}，耗时{check_result['cost_time']}秒")
+
+                    # 6.3 删除源表当前分区数据（核心修复：格式化分区值）
+                    self.progress_tracker.set_phase("drop")
+                    self.profiler.phase("drop")
+                    drop_partition_sql = f"ALTER TABLE {db}.{table} DROP PARTITION {formatted_partition}"
+                    logger.debug(f"删除分区SQL：{drop_partition_sql}")
+                    retry_policy.call(lambda attempt: client.command(drop_partition_sql), logger, f"删除源表分区{partition}")
+                    logger.info(f"源表分区{partition}数据已删除\n")
+
+                    # 合并备份表分区中的小数据块，减少对象存储的对象数
+                    if config.get("optimize_mode") == "optimize":
+                        self.merge_scheduler.schedule_optimize(client, db, backup_table, formatted_partition, logger)
+
+                    # 6.4 更新进度
+                    self.profiler.phase("save_progress")
+                    self.resume_service.update_partition_progress(progress, db, table, partition)
+                    migration_result["completed_partitions"] += 1
+                    migration_result["migrated_rows"] += src_count
+                    self.progress_tracker.finish_partition(db, table, uncompleted_partitions.bytes_of(partition))
+                    logger.info(self.progress_tracker.status_line(db, table))
+                finally:
+                    # 异常时同样结束分区区间，失败分区在剖析与时间线中完整可见
+                    self.profiler.end(partition_span)
+
+            if config.get("merge_aware"):
+                migration_result["partition_scheduling"] = scheduler.summary()
+            if strategy["method"] == "attach_from_staging":
+                client.command(f"DROP TABLE IF EXISTS {db}.{staging_table}")
+
+            # 等待分区合并完成，保证切换后的数据块布局
+            self.profiler.phase("merge_wait")
+            if config.get("optimize_mode") == "optimize":
+                self.merge_scheduler.wait_table(db, backup_table, logger)
+            elif config.get("optimize_mode") == "wait":
+                self.merge_scheduler.wait_for_merges(client, db, backup_table, logger)
+
+            # 物化延迟的索引与投影，切换前等待system.mutations中的变更全部完成
+            self.profiler.phase("materialize")
+            if deferred_definitions:
+                backup_partitions = [
+                    self.partition_manager.format_partition_value_for_drop(p)
+                    for p in self.partition_manager.get_table_partitions(client, db, backup_table)
+                ]
+                migration_result["deferred_materialization"] = self.materialization_service.materialize(
+                    client, db, backup_table, deferred_definitions, backup_partitions, logger
+                )
 
             # 7. 全表数据一致性校验
+            self.profiler.phase("full_validate")
             logger.info("开始全表数据校验")
             src_total = self.validator.get_row_count(client, db, table)
             dst_total = self.validator.get_row_count(client, db, backup_table)
@@ -517,17 +1155,84 @@ class MigrationService:
                 )
             logger.info(f"全表数据校验通过，原表行数：{total_rows}，迁移后行数：{dst_total}")
 
+            self.profiler.phase("inspect")
+            # 记录迁移前后的磁盘占用（续传时迁移前字节数仅含本次运行开始时源表剩余部分）
+            after_bytes = self.compression_service.get_table_bytes(client, db, [backup_table])[backup_table]["bytes_on_disk"]
+            migration_result["compression"] = {
+                "before_bytes": before_bytes,
+                "after_bytes": after_bytes,
+                "ratio": round(after_bytes / before_bytes, 4) if before_bytes else None,
+                "partial": reconcile is not None
+            }
+            logger.info(f"迁移前源表占用{format_bytes(before_bytes)}，迁移后备份表占用{format_bytes(after_bytes)}")
+
+            # 记录迁移前后每分区的数据块数与对象数
+            layout_after = self.merge_scheduler.get_part_layout(client, db, [backup_table])[backup_table]
+            migration_result["part_layout"] = self.merge_scheduler.summarize_layout(layout_before, layout_after)
+            logger.info(
+                f"数据块布局：迁移前{migration_result['part_layout']['parts_before']}个数据块"
+                f"（约{migration_result['part_layout']['objects_before']}个对象），"
+                f"迁移后{migration_result['part_layout']['parts_after']}个数据块"
+                f"（约{migration_result['part_layout']['objects_after']}个对象）"
+            )
+
             # 8. 重命名表（最终替换）
+            self.profiler.phase("cutover")
             logger.info("开始替换源表")
             client.command(f"DROP TABLE IF EXISTS {db}.{table}")
             client.command(f"RENAME TABLE {db}.{backup_table} TO {db}.{table}")
             logger.info(f"表{db}.{table}迁移完成，已切换到S3存储策略")
+            if config.get("snapshot"):
+                self.rollback_service.drop_snapshot(client, db, table, logger)
+
+            # 切换后预热热点分区与热点列到文件系统缓存（失败不影响已完成的迁移）
+            if config.get("prewarm"):
+                self.profiler.phase("prewarm")
+                try:
+                    hot_partitions = self.prewarm_service.get_hot_partitions(
+                        client, db, table, config["prewarm_partitions"]
+                    )
+                    hot_columns = self.prewarm_service.get_hot_columns(
+                        client, db, table, config["prewarm_lookback_hours"]
+                    ) if config.get("prewarm_hot_columns") else []
+                    migration_result["prewarm"] = self.prewarm_service.prewarm(
+                        client, db, table, hot_partitions, hot_columns, partition_key, self.partition_manager, logger,
+                        concurrency=config["prewarm_concurrency"]
+                    )
+                except Exception as e:
+                    logger.warning(f"{db}.{table}缓存预热失败：{str(e)}")
+
+            # 切换后再次执行基准查询，对比迁移前后的延迟（失败不影响已完成的迁移）
+            if benchmark_before:
+                self.profiler.phase("benchmark")
+                try:
+                    benchmark_after = self.benchmark_service.run(
+                        client, db, table, benchmark_queries, "after", config, logger
+                    )
+                    benchmark = self.benchmark_service.compare(
+                        benchmark_before, benchmark_after, config["benchmark_regression_ratio"]
+                    )
+                    migration_result["benchmark"] = benchmark
+                    for item in benchmark["queries"]:
+                        if item["regression"]:
+                            logger.warning(
+                                f"{db}.{table}查询性能回退：p95延迟{item['before']['p95_ms']}ms -> "
+                                f"{item['after']['p95_ms']}ms（{item['p95_ratio']}倍），"
+                                f"S3 GET {item['after']['s3_gets']}次，查询：{item['query'][:200]}"
+                            )
+                except Exception as e:
+                    logger.warning(f"{db}.{table}迁移后查询基准测试失败：{str(e)}")
 
             # 9. 更新迁移结果
             migration_result["status"] = "completed"
             migration_result["end_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             self.resume_service.mark_table_completed(progress, db, table)
 
+        except MigrationDrained as e:
+            # 排空：当前分区已完成，保留备份表与进度，可使用--resume继续
+            logger.warning(f"{str(e)}，{db}.{table}可使用--resume继续迁移")
+            migration_result["status"] = "drained"
+            migration_result["end_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         except Exception as e:
             error_msg = f"迁移表{db}.{table}失败：{str(e)}\n{traceback.format_exc()}"
             logger.error(error_msg)
@@ -536,28 +1241,294 @@ class MigrationService:
             self.resume_service.mark_table_failed(progress, db, table)
             # 恢复建议
             logger.warning(
-                f"恢复建议：1. 检查备份表{db}.{backup_table}数据完整性；2. 修复错误后使用--resume参数续传；3. 若数据损坏，从ClickHouse备份恢复源表"
+                f"恢复建议：1. 检查备份表{db}.{backup_table}数据完整性；2. 修复错误后使用--resume参数续传；"
+                f"3. 放弃迁移时使用--rollback将分区挂载回源表（无需重新复制）；4. 若数据损坏，从ClickHouse备份恢复源表"
             )
+        finally:
+            if table_span is not None:
+                table_span.args["status"] = migration_result["status"]
+            self.profiler.end(table_span)
+            self.progress_tracker.finish_table(db, table, migration_result["status"])
+            # 释放迁移锁
+            if lock_file:
+                self.table_lock.release_lock(lock_file)
+                logger.info(f"释放表{db}.{table}迁移锁成功")
 
         return migration_result
     
     def migrate_full_database(self, client, config: Dict, logger, progress: Dict) -> List[Dict]:
         """整库迁移：迁移指定数据库下所有本地存储策略的表"""
         logger.info(f"开始整库迁移：{config['db']}")
-        # 获取数据库下所有表
-        tables_result = client.query(
-            f"SELECT name FROM system.tables WHERE database = '{config['db']}' AND engine NOT IN ('View', 'MaterializedView')"
+        # 一次扫描筛选可迁移表（整库模式额外包含分布式表，由分布式表迁移其本地表）
+        catalog_config = dict(
+            config, include_databases=[], exclude_databases=[],
+            engines=config.get("engines") or FULL_MODE_ENGINE_PATTERNS
         )
-        tables = [row[0] for row in tables_result.result_rows]
-        logger.info(f"发现{config['db']}数据库下可迁移表数量：{len(tables)}")
+        discovery = self.catalog_service.discover_tables(client, catalog_config, logger, databases=[config['db']])
+        self.catalog_summary = self.summarize_discovery(discovery)
+        logger.info(f"发现{config['db']}数据库下可迁移表数量：{len(discovery['candidates'])}")
+        return self.migrate_tables(client, config, logger, progress, discovery["candidates"])
+
+    def migrate_catalog(self, client, config: Dict, logger, progress: Dict) -> List[Dict]:
+        """跨库迁移：按库/表/引擎/大小过滤条件迁移所有数据库中的表"""
+        logger.info("开始跨库迁移")
+        discovery = self.catalog_service.discover_tables(client, config, logger)
+        self.catalog_summary = self.summarize_discovery(discovery)
+        return self.migrate_tables(client, config, logger, progress, discovery["candidates"])
+
+    def summarize_discovery(self, discovery: Dict) -> Dict:
+        """汇总表目录筛选结果（写入迁移报告）"""
+        skipped_by_reason = {}
+        for entry in discovery["skipped"]:
+            skipped_by_reason[entry["reason"]] = skipped_by_reason.get(entry["reason"], 0) + 1
+        return {
+            "candidate_tables": len(discovery["candidates"]),
+            "candidate_bytes": sum(entry["bytes"] for entry in discovery["candidates"]),
+            "skipped_tables": len(discovery["skipped"]),
+            "skipped_by_reason": skipped_by_reason
+        }
+
+    def migrate_tables(self, client, config: Dict, logger, progress: Dict, entries: List[Dict]) -> List[Dict]:
+        """
+        迁移一组表（整库与跨库迁移共用）
+        :param entries: 表目录条目，包含database、table、bytes
+        """
+        # 按访问热度排序：无人查询的表先迁移，热表最后迁移（排序失败时保持原顺序）
+        if config.get("order_by_heat"):
+            try:
+                entries = self.heat_scorer.order_by_heat(client, entries, logger, config["heat_lookback_hours"])
+            except Exception as e:
+                logger.warning(f"统计表访问热度失败，按原顺序迁移：{str(e)}")
+
+        # 待迁移总字节数来自表目录扫描，用于整体进度与剩余时间估算
+        total_bytes = sum(entry["bytes"] for entry in entries)
+        self.progress_tracker.register_run(total_bytes, config.get("job_id", ""))
+        logger.info(f"待迁移数据总量：{format_bytes(total_bytes)}")
+        if self.history_service is not None:
+            host_rate = self.history_service.get_host_rate(config["host"])
+            if host_rate:
+                self.progress_tracker.set_prior_rate(host_rate)
+                logger.info(
+                    f"按历史吞吐{format_bytes(host_rate)}/s估算，单线程预计耗时{format_duration(total_bytes / host_rate)}"
+                )
+
+        # 多个工作线程并发迁移表（每个线程从连接池租用独立连接）
+        # 按表顺序派发，并发数由并发闸门控制，可通过控制器在线调整
+        workers = config.get("workers", 1)
+        if self.client_pool is not None and (workers > 1 or self.controller is not None):
+            gate = self.controller.worker_gate if self.controller else ConcurrencyGate(workers)
+            logger.info(f"使用{gate.limit}个工作线程并发迁移")
+            futures = []
+            with ThreadPoolExecutor(max_workers=MAX_WORKER_THREADS, thread_name_prefix="worker") as executor:
+                try:
+                    for entry in entries:
+                        with self.profiler.span("worker_gate_wait", db=entry["database"], table=entry["table"]):
+                            gate.acquire()
+                        future = executor.submit(
+                            self.migrate_table_with_pooled_client, config, logger, progress, entry["database"], entry["table"]
+                        )
+                        future.add_done_callback(lambda f: gate.release())
+                        futures.append(future)
+                    migration_results = [future.result() for future in futures]
+                except (KeyboardInterrupt, SystemExit):
+                    # Ctrl-C只送达主线程：退出线程池前（线程池会等待工作线程结束）取消未开始的表、
+                    # 让工作线程在下一个检查点停止，并终止服务端查询，使执行中的表尽快失败返回
+                    logger.warning("收到中断信号，取消未开始的表并终止执行中的服务端查询")
+                    for future in futures:
+                        future.cancel()
+                    if self.controller is not None:
+                        self.controller.draining = True
+                    if self.query_runner is not None:
+                        self.query_runner.cancel_all(logger)
+                    raise
+            for entry, result in zip(entries, migration_results):
+                if "heat" in entry:
+                    result["heat"] = entry["heat"]
+                if result["status"] == "failed":
+                    logger.warning(f"表{entry['database']}.{entry['table']}迁移失败")
+            return migration_results
 
         # 逐个迁移表
         migration_results = []
-        for table in tables:
-            result = self.migrate_single_table(client, config, logger, progress, config['db'], table)
+        for entry in entries:
+            result = self.migrate_single_table(client, config, logger, progress, entry["database"], entry["table"])
+            if "heat" in entry:
+                result["heat"] = entry["heat"]
             migration_results.append(result)
             # 表迁移失败时是否继续（可根据需求调整）
             if result["status"] == "failed":
-                logger.warning(f"表{table}迁移失败，继续处理下一个表")
+                logger.warning(f"表{entry['database']}.{entry['table']}迁移失败，继续处理下一个表")
 
         return migration_results
+    
+    def tier_tables(self, client, config: Dict, logger) -> List[Dict]:
+        """TTL分层：单表模式处理--table，否则按过滤条件筛选表"""
+        if config.get("table"):
+            return [self.tier_table(client, config, logger, config["db"], config["table"])]
+        discovery = self.catalog_service.discover_tables(
+            client, config, logger, databases=[config["db"]] if config.get("db") else None
+        )
+        self.catalog_summary = self.summarize_discovery(discovery)
+        return [self.tier_table(client, config, logger, entry["database"], entry["table"])
+                for entry in discovery["candidates"]]
+
+    def tier_table(self, client, config: Dict, logger, db: str, table: str) -> Dict:
+        """
+        TTL分层：不复制数据，切换到分层存储策略并追加TTL搬迁规则，由ClickHouse后台搬迁数据块
+        分批物化时先以materialize_ttl_after_modify=0修改TTL，再按分区分批MATERIALIZE TTL
+        """
+        tier_result = {
+            "database": db,
+            "table": table,
+            "start_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "end_time": "",
+            "status": "failed",
+            "error": ""
+        }
+        lock_file = None
+        table_span = self.profiler.begin("tier_table", db=db, table=table)
+        try:
+            lock_file = self.table_lock.acquire_lock(db, table)
+            if not lock_file:
+                logger.error(f"获取表{db}.{table}迁移锁失败，跳过分层")
+                tier_result["status"] = "lock_failed"
+                return tier_result
+
+            logger.info(f"开始TTL分层：{db}.{table}")
+            self.profiler.phase("ddl")
+            create_sql = self.get_create_table_sql(client, db, table, logger)
+            self.tiering_service.check_policy_compatible(client, db, table, config["tier_policy"])
+
+            # 合并原有表级TTL（如DELETE规则）与搬迁规则，已包含同一目标的搬迁规则时不重复修改
+            # （SHOW CREATE会规范化TTL表达式，因此按搬迁目标子句判断）
+            move_ttl = self.tiering_service.build_move_ttl(config)
+            move_target = move_ttl[len(config["tier_ttl"]):].strip()
+            existing_ttl = ddl.get_table_ttl(create_sql)
+            if existing_ttl and move_target in re.sub(r"\s+", " ", existing_ttl):
+                new_ttl = None
+                logger.info(f"{db}.{table}已包含搬迁规则，跳过修改TTL")
+            else:
+                new_ttl = f"{existing_ttl}, {move_ttl}" if existing_ttl else move_ttl
+            tier_result["target_create_sql"] = self.modify_create_sql_for_s3(
+                create_sql, config["tier_policy"], table, backup_suffix="", ttl=new_ttl or existing_ttl
+            )
+            logger.debug(f"分层后建表语句：{tier_result['target_create_sql']}")
+
+            batch_size = config.get("ttl_batch_size", 0)
+            self.profiler.phase("apply_tiering")
+            self.tiering_service.apply_tiering(
+                client, db, table, config["tier_policy"], new_ttl, logger, materialize_ttl=not batch_size
+            )
+            if batch_size and new_ttl:
+                self.profiler.phase("materialize_ttl")
+                partitions = [
+                    self.partition_manager.format_partition_value_for_drop(p)
+                    for p in self.partition_manager.get_table_partitions(client, db, table)
+                ]
+                self.tiering_service.materialize_ttl_in_batches(
+                    client, db, table, partitions, batch_size, self.materialization_service, logger
+                )
+
+            self.profiler.phase("monitor_moves")
+            target_disks = self.tiering_service.get_target_disks(client, config)
+            tier_result["tiering"] = self.tiering_service.monitor_moves(
+                client, db, table, target_disks, logger, timeout=config.get("tier_timeout", 0)
+            )
+            tier_result["status"] = "completed" if tier_result["tiering"]["finished"] else "in_progress"
+            logger.info(
+                f"{db}.{table}TTL分层{'完成' if tier_result['status'] == 'completed' else '已生效，后台搬迁进行中'}，"
+                f"本次搬迁{format_bytes(tier_result['tiering']['moved_bytes'])}"
+            )
+        except Exception as e:
+            error_msg = f"TTL分层{db}.{table}失败：{str(e)}\n{traceback.format_exc()}"
+            logger.error(error_msg)
+            tier_result["error"] = error_msg
+        finally:
+            tier_result["end_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.profiler.end(table_span)
+            if lock_file:
+                self.table_lock.release_lock(lock_file)
+        return tier_result
+
+    def rollback_tables(self, client, config: Dict, logger, progress: Dict) -> List[Dict]:
+        """回滚：单表模式回滚--table，否则回滚--db下所有存在备份表或快照表的表"""
+        from clickhouse_migrator.services.rollback import BACKUP_SUFFIX, SNAPSHOT_SUFFIX
+        db = config["db"]
+        if config.get("table"):
+            tables = [config["table"]]
+        else:
+            result = client.query(f"""
+                SELECT DISTINCT multiIf(endsWith(name, '{BACKUP_SUFFIX}'), substring(name, 1, length(name) - {len(BACKUP_SUFFIX)}),
+                                        substring(name, 1, length(name) - {len(SNAPSHOT_SUFFIX)}))
+                FROM system.tables
+                WHERE database = '{db}' AND (endsWith(name, '{BACKUP_SUFFIX}') OR endsWith(name, '{SNAPSHOT_SUFFIX}'))
+            """)
+            tables = sorted(row[0] for row in result.result_rows)
+            logger.info(f"{db}数据库下待回滚的表：{tables}")
+        return [self.rollback_table(client, config, logger, progress, db, table) for table in tables]
+
+    def rollback_table(self, client, config: Dict, logger, progress: Dict, db: str, table: str) -> Dict:
+        """回滚单表（持有迁移锁），成功后清除该表的续传进度"""
+        lock_file = None
+        try:
+            lock_file = self.table_lock.acquire_lock(db, table)
+            if not lock_file:
+                logger.error(f"获取表{db}.{table}迁移锁失败，跳过回滚")
+                return {"database": db, "table": table, "status": "lock_failed", "error": "获取迁移锁失败"}
+            logger.info(f"开始回滚：{db}.{table}")
+            result = self.rollback_service.rollback_table(
+                client, config, logger, db, table, lambda name: self.get_create_table_sql(client, db, name, logger)
+            )
+            self.resume_service.reset_table_progress(progress, db, table)
+            return result
+        except Exception as e:
+            error_msg = f"回滚{db}.{table}失败：{str(e)}\n{traceback.format_exc()}"
+            logger.error(error_msg)
+            return {"database": db, "table": table, "status": "failed", "error": error_msg}
+        finally:
+            if lock_file:
+                self.table_lock.release_lock(lock_file)
+
+    def verify_tables(self, client, config: Dict, logger) -> List[Dict]:
+        """
+        迁移后巡检：单表模式巡检--table，否则按过滤条件筛选表（包含已在S3存储策略上的表）
+        分布式表巡检其关联的本地表，并检查集群各分片上的数据块位置
+        """
+        if config.get("table"):
+            entries = [{"database": config["db"], "table": config["table"],
+                        "engine": "Distributed" if self.is_distributed_table(client, config["db"], config["table"]) else ""}]
+        else:
+            catalog_config = dict(config, engines=config.get("engines") or FULL_MODE_ENGINE_PATTERNS)
+            entries = []
+            skipped = []
+            for entry in self.catalog_service.scan_catalog(client, [config["db"]] if config.get("db") else None):
+                reason = self.catalog_service.get_skip_reason(entry, catalog_config)
+                if reason in (None, "already_on_s3"):
+                    entries.append(entry)
+                else:
+                    skipped.append(dict(entry, reason=reason))
+            self.catalog_summary = self.summarize_discovery({"candidates": entries, "skipped": skipped})
+
+        targets = {}
+        for entry in entries:
+            if entry["engine"] == "Distributed":
+                for local in self.get_local_tables(client, entry["database"], entry["table"]):
+                    targets[(local["db"], local["table"])] = {
+                        "database": local["db"], "table": local["table"], "cluster": local["cluster"],
+                        "distributed": f"{entry['database']}.{entry['table']}"
+                    }
+            else:
+                targets.setdefault((entry["database"], entry["table"]), {"database": entry["database"], "table": entry["table"]})
+        return self.verify_service.verify_tables(client, config, logger, list(targets.values()))
+
+    def migrate_table_with_pooled_client(self, config: Dict, logger, progress: Dict, db: str, table: str) -> Dict:
+        """从连接池租用连接迁移单个表（供并发工作线程调用）"""
+        with self.profiler.profile_thread():
+            lease_span = self.profiler.begin("lease_client")
+            try:
+                with self.client_pool.lease() as client:
+                    self.profiler.end(lease_span)
+                    return self.migrate_single_table(client, config, logger, progress, db, table)
+            finally:
+                # 等待连接超时时同样结束区间（已结束时不重复记录）
+                self.profiler.end(lease_span)
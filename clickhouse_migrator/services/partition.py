@@ -1,5 +1,137 @@
 import re
-from typing import List, Optional
+import sys
+import time
+from array import array
+from collections import deque
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+# 源分区存在合并/变更时的默认最长等待时间（秒），超时后仍按顺序迁移
+DEFAULT_BUSY_PARTITION_MAX_WAIT = 600
+# 日志中最多列出的分区值个数，超出时只输出开头几个、最后一个与总数
+MAX_LOGGED_PARTITIONS = 5
+
+def describe_partitions(partitions: Sequence[str], limit: int = MAX_LOGGED_PARTITIONS) -> str:
+    """分区列表的日志摘要，如'2024-01-01, 2024-01-02, … 2024-12-31（共366个）'"""
+    if len(partitions) <= limit:
+        return ", ".join(partitions)
+    return f"{', '.join(islice(partitions, limit))}, … {partitions[-1]}（共{len(partitions)}个）"
+
+class PartitionRecord:
+    """单个分区的汇总（分区值与分区ID为驻留字符串）"""
+    __slots__ = ("partition", "partition_id", "rows", "bytes", "parts")
+
+    def __init__(self, partition: str, partition_id: str, rows: int, bytes_on_disk: int, parts: int):
+        self.partition = sys.intern(partition)
+        self.partition_id = sys.intern(partition_id)
+        self.rows = rows
+        self.bytes = bytes_on_disk
+        self.parts = parts
+
+class PartitionCursor:
+    """
+    惰性分区游标：以块流式查询（query_row_block_stream）按分区值顺序读取表的活跃分区汇总，
+    逐个产出PartitionRecord，客户端不一次性物化整个结果集
+    迭代期间占用该连接的会话，遍历结束前不能在同一连接上执行其他查询
+    """
+
+    def __init__(self, client, db: str, table: str):
+        self.client = client
+        self.db = db
+        self.table = table
+
+    def __iter__(self) -> Iterator[PartitionRecord]:
+        query = f"""
+            SELECT partition, partition_id, sum(rows), sum(bytes_on_disk), count()
+            FROM system.parts
+            WHERE database = '{self.db}' AND table = '{self.table}' AND active = 1
+            GROUP BY partition, partition_id
+            ORDER BY partition
+        """
+        try:
+            with self.client.query_row_block_stream(query) as stream:
+                for block in stream:
+                    for partition, partition_id, rows, bytes_on_disk, parts in block:
+                        yield PartitionRecord(partition, partition_id, int(rows), int(bytes_on_disk), int(parts))
+        except Exception as e:
+            raise RuntimeError(f"获取{self.db}.{self.table}分区列表失败：{str(e)}")
+
+class PartitionList:
+    """
+    紧凑的分区列表（列式存储）：分区值与分区ID为驻留字符串，行数、字节数、数据块数存于array，
+    按分区值顺序迭代分区值，按分区值O(1)判断成员与查询字节数
+    """
+
+    def __init__(self, records: Iterable[PartitionRecord] = ()):
+        self.partitions = []
+        self.partition_ids = []
+        self.rows = array("q")
+        self.bytes = array("q")
+        self.parts = array("q")
+        self._index = {}
+        for record in records:
+            self.append(record)
+
+    def append(self, record: PartitionRecord):
+        self._index[record.partition] = len(self.partitions)
+        self.partitions.append(record.partition)
+        self.partition_ids.append(record.partition_id)
+        self.rows.append(record.rows)
+        self.bytes.append(record.bytes)
+        self.parts.append(record.parts)
+
+    def __len__(self) -> int:
+        return len(self.partitions)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.partitions)
+
+    def __getitem__(self, index: int) -> str:
+        return self.partitions[index]
+
+    def __contains__(self, partition: str) -> bool:
+        return partition in self._index
+
+    def bytes_of(self, partition: str) -> int:
+        """分区的磁盘字节数（不在列表中时为0）"""
+        index = self._index.get(partition)
+        return self.bytes[index] if index is not None else 0
+
+    def partition_id_of(self, partition: str) -> Optional[str]:
+        """分区的partition_id（不在列表中时为None）"""
+        index = self._index.get(partition)
+        return self.partition_ids[index] if index is not None else None
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self.bytes)
+
+    def to_stats(self) -> Dict[str, Dict]:
+        """转换为PartitionManager.get_partition_stats的单表格式：{partition_id: {partition, rows, bytes, parts}}"""
+        return {
+            self.partition_ids[i]: {
+                "partition": self.partitions[i], "rows": self.rows[i], "bytes": self.bytes[i], "parts": self.parts[i]
+            }
+            for i in range(len(self.partitions))
+        }
+
+    def to_columns(self) -> Dict[str, list]:
+        """列式字典（可JSON序列化）"""
+        return {
+            "partition": self.partitions,
+            "partition_id": self.partition_ids,
+            "rows": self.rows.tolist(),
+            "bytes": self.bytes.tolist(),
+            "parts": self.parts.tolist()
+        }
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, list]) -> "PartitionList":
+        return cls(
+            PartitionRecord(*values) for values in zip(
+                columns["partition"], columns["partition_id"], columns["rows"], columns["bytes"], columns["parts"]
+            )
+        )
 
 class PartitionManager:
     """分区管理器"""
@@ -103,16 +235,157 @@ class PartitionManager:
     
     def get_table_partitions(self, client, db: str, table: str) -> List[str]:
         """获取表的所有有效分区值列表（兼容单/复合分区）"""
+        return [record.partition for record in self.iter_partitions(client, db, table)]
+
+    def iter_partitions(self, client, db: str, table: str) -> PartitionCursor:
+        """按分区值顺序流式遍历表的活跃分区及其行数、字节数"""
+        return PartitionCursor(client, db, table)
+
+    def collect_partitions(self, client, db: str, table: str) -> PartitionList:
+        """流式读取表的活跃分区，汇总为紧凑的分区列表"""
+        return PartitionList(self.iter_partitions(client, db, table))
+
+    def get_partition_stats(self, client, db: str, tables: List[str]) -> Dict[str, Dict[str, Dict]]:
+        """
+        批量获取多个表的分区元数据（基于system.parts，一次查询）
+        :return: {表名: {partition_id: {'partition': 分区值, 'rows': 行数, 'bytes': 磁盘字节数, 'parts': 数据块数}}}
+        """
         try:
+            table_list = ", ".join(f"'{t}'" for t in tables)
             result = client.query(
                 f"""
-                SELECT DISTINCT partition 
-                FROM system.parts 
-                WHERE database = '{db}' AND table = '{table}' AND active = 1 
-                ORDER BY partition
+                SELECT table, partition_id, any(partition), sum(rows), sum(bytes_on_disk), count()
+                FROM system.parts
+                WHERE database = '{db}' AND table IN ({table_list}) AND active = 1
+                GROUP BY table, partition_id
                 """
             )
-            partitions = [row[0] for row in result.result_rows]
-            return partitions
+            stats = {t: {} for t in tables}
+            for table, partition_id, partition, rows, bytes_on_disk, parts in result.result_rows:
+                stats[table][partition_id] = {
+                    "partition": partition,
+                    "rows": int(rows),
+                    "bytes": int(bytes_on_disk),
+                    "parts": int(parts)
+                }
+            return stats
         except Exception as e:
-            raise RuntimeError(f"获取{db}.{table}分区列表失败：{str(e)}")
+            raise RuntimeError(f"获取{db}库表{tables}分区元数据失败：{str(e)}")
+
+    def get_busy_partitions(self, client, db: str, table: str) -> set:
+        """
+        批量获取正在合并（system.merges）或有未完成变更（system.mutations待处理数据块）的分区值（一次查询）
+        """
+        try:
+            result = client.query(f"""
+                SELECT DISTINCT partition
+                FROM system.parts
+                WHERE database = '{db}' AND table = '{table}' AND active = 1 AND (
+                    partition_id IN (
+                        SELECT partition_id FROM system.merges WHERE database = '{db}' AND table = '{table}'
+                    )
+                    OR name IN (
+                        SELECT arrayJoin(parts_to_do_names) FROM system.mutations
+                        WHERE database = '{db}' AND table = '{table}' AND NOT is_done
+                    )
+                )
+            """)
+            return {row[0] for row in result.result_rows}
+        except Exception as e:
+            raise RuntimeError(f"获取{db}.{table}合并/变更中的分区失败：{str(e)}")
+
+class PartitionScheduler:
+    """
+    合并/变更感知的分区调度：每次取下一个分区前批量查询源表正在合并或变更的分区，
+    优先迁移空闲分区，繁忙分区延后；剩余分区全部繁忙时轮询等待（等待期间响应暂停、排空与维护窗口），
+    超过最长等待时间后仍按顺序迁移
+    以迭代器方式使用：for partition in scheduler
+    """
+
+    def __init__(self, client, partition_manager: PartitionManager, db: str, table: str, partitions: Sequence[str],
+                 logger, enabled: bool = True, max_wait: float = DEFAULT_BUSY_PARTITION_MAX_WAIT,
+                 poll_interval: float = 10, controller=None):
+        """
+        :param partitions: 待迁移分区序列（如PartitionList），按下标顺序读取，不复制
+        :param enabled: 是否启用合并/变更感知，未启用时按原顺序迭代
+        :param max_wait: 剩余分区全部繁忙时的最长等待时间（秒，不含暂停与窗口外的时间）
+        :param controller: 运行控制器，等待繁忙分区期间执行检查点
+        """
+        self.client = client
+        self.partition_manager = partition_manager
+        self.db = db
+        self.table = table
+        self.partitions = partitions
+        self.logger = logger
+        self.enabled = enabled
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.controller = controller
+        # 下一个未检查的分区下标；检查时繁忙的分区按原顺序放入延后队列（每个分区只入队一次）
+        self._next = 0
+        self._deferred = deque()
+        self.deferred_partitions = 0
+        self.forced = 0
+        self.wait_seconds = 0.0
+
+    def __iter__(self):
+        return self
+
+    def _take_idle(self, busy) -> Optional[str]:
+        """
+        取第一个空闲分区：先检查延后队列（数量不超过繁忙分区数），再从下标处继续顺序检查
+        """
+        for _ in range(len(self._deferred)):
+            partition = self._deferred.popleft()
+            if partition not in busy:
+                return partition
+            self._deferred.append(partition)
+        skipped = 0
+        while self._next < len(self.partitions):
+            partition = self.partitions[self._next]
+            self._next += 1
+            if partition not in busy:
+                if skipped:
+                    self.logger.info(
+                        f"{self.db}.{self.table}的{skipped}个分区正在合并或变更，延后迁移，先迁移分区{partition}"
+                    )
+                return partition
+            self._deferred.append(partition)
+            self.deferred_partitions += 1
+            skipped += 1
+        return None
+
+    def __next__(self) -> str:
+        if not self.enabled:
+            if self._next >= len(self.partitions):
+                raise StopIteration
+            self._next += 1
+            return self.partitions[self._next - 1]
+        if not self._deferred and self._next >= len(self.partitions):
+            raise StopIteration
+        waited = 0.0
+        while True:
+            busy = self.partition_manager.get_busy_partitions(self.client, self.db, self.table)
+            partition = self._take_idle(busy)
+            if partition is not None:
+                return partition
+            if waited >= self.max_wait:
+                partition = self._deferred.popleft()
+                self.forced += 1
+                self.logger.warning(
+                    f"{self.db}.{self.table}剩余分区均在合并或变更，等待{self.max_wait}秒后仍迁移分区{partition}"
+                )
+                return partition
+            if self.controller is not None:
+                self.controller.checkpoint(self.logger, f"{self.db}.{self.table}等待繁忙分区")
+            time.sleep(self.poll_interval)
+            waited += self.poll_interval
+            self.wait_seconds += self.poll_interval
+
+    def summary(self) -> Dict:
+        """调度统计（均为实测值）：被延后的繁忙分区数、等待后强制迁移的繁忙分区数、等待繁忙分区的时长"""
+        return {
+            "deferred_partitions": self.deferred_partitions,
+            "forced": self.forced,
+            "wait_seconds": round(self.wait_seconds, 1)
+        }
@@ -0,0 +1,137 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from clickhouse_migrator.clients.query_runner import AsyncQueryRunner, QUERY_ID_PREFIX
+from clickhouse_migrator.utils.progress import format_bytes
+
+# 默认预热的最近分区数
+DEFAULT_PREWARM_PARTITIONS = 3
+# 默认预热并发数
+DEFAULT_PREWARM_CONCURRENCY = 2
+# 按查询频次选取热点列时的回溯时长（小时）
+DEFAULT_PREWARM_LOOKBACK_HOURS = 168
+# 按查询频次选取的热点列数上限
+DEFAULT_PREWARM_COLUMNS = 20
+
+# 预热查询设置：读取时写入文件系统缓存
+PREWARM_SETTINGS = {
+    "enable_filesystem_cache": 1,
+    "read_from_filesystem_cache_if_exists_otherwise_bypass_cache": 0
+}
+# 复制时写入缓存的查询设置（热点分区写入S3的同时写入本地缓存）
+CACHE_ON_WRITE_SETTINGS = {"enable_filesystem_cache_on_write_operations": 1}
+
+class PrewarmService:
+    """
+    切换后缓存预热：选出热点分区（最近N个分区）与热点列（system.query_log中最常被读取的列），
+    以受控并发执行SELECT ... FORMAT Null将其读入S3磁盘的文件系统缓存，
+    并通过system.filesystem_cache统计预热前后的缓存字节数
+    """
+
+    def __init__(self, client_pool=None):
+        """
+        :param client_pool: CHClientPool连接池，为None时在调用方连接上顺序执行
+        """
+        self.client_pool = client_pool
+
+    def get_hot_partitions(self, client, db: str, table: str, count: int = DEFAULT_PREWARM_PARTITIONS) -> List[str]:
+        """最近的N个分区（按数据块max_time排序，无日期分区键时按分区ID排序）"""
+        result = client.query(f"""
+            SELECT any(partition)
+            FROM system.parts
+            WHERE database = '{db}' AND table = '{table}' AND active
+            GROUP BY partition_id
+            ORDER BY max(max_time) DESC, partition_id DESC
+            LIMIT {int(count)}
+        """)
+        return [row[0] for row in result.result_rows]
+
+    def get_hot_columns(self, client, db: str, table: str, lookback_hours: int = DEFAULT_PREWARM_LOOKBACK_HOURS,
+                        limit: int = DEFAULT_PREWARM_COLUMNS) -> List[str]:
+        """system.query_log中该表最常被读取的列，无查询记录时返回空列表（预热全部列）"""
+        prefix = f"{db}.{table}."
+        result = client.query(f"""
+            SELECT substring(column, {len(prefix) + 1}) AS name, count() AS cnt
+            FROM system.query_log
+            ARRAY JOIN columns AS column
+            WHERE type = 'QueryFinish' AND query_kind = 'Select'
+                  AND event_time >= now() - INTERVAL {int(lookback_hours)} HOUR
+                  AND startsWith(column, '{prefix}')
+                  AND NOT startsWith(query_id, '{QUERY_ID_PREFIX}_')
+            GROUP BY name
+            ORDER BY cnt DESC
+            LIMIT {int(limit)}
+        """)
+        return [row[0] for row in result.result_rows]
+
+    def get_cache_bytes(self, client) -> Optional[int]:
+        """文件系统缓存当前占用字节数（未配置缓存或版本不支持时返回None）"""
+        try:
+            result = client.query("SELECT sum(size) FROM system.filesystem_cache")
+            return int(result.result_rows[0][0] or 0)
+        except Exception:
+            return None
+
+    def _warm_partition(self, client, db: str, table: str, columns: str, where_clause: str, partition: str) -> float:
+        start_time = time.time()
+        query_id = AsyncQueryRunner.build_query_id("prewarm", db, table, partition, start_time)
+        client.command(
+            f"SELECT {columns} FROM {db}.{table} WHERE {where_clause} FORMAT Null",
+            settings=dict(PREWARM_SETTINGS, query_id=query_id)
+        )
+        return time.time() - start_time
+
+    def _warm_pooled(self, db: str, table: str, columns: str, where_clause: str, partition: str) -> float:
+        with self.client_pool.lease() as client:
+            return self._warm_partition(client, db, table, columns, where_clause, partition)
+
+    def prewarm(self, client, db: str, table: str, partitions: List[str], columns: List[str], partition_key: str,
+                partition_manager, logger, concurrency: int = DEFAULT_PREWARM_CONCURRENCY) -> Dict:
+        """
+        预热指定分区的指定列（columns为空时预热全部列）
+        :return: 预热统计（分区数、列、耗时、缓存字节数变化）
+        """
+        start_time = time.time()
+        cache_before = self.get_cache_bytes(client)
+        column_list = ", ".join(f"`{c}`" for c in columns) if columns else "*"
+        tasks = [
+            (partition, partition_manager.generate_partition_where_clause(partition_key, partition))
+            for partition in partitions
+        ]
+        failed = 0
+        if self.client_pool is None or concurrency <= 1:
+            for partition, where_clause in tasks:
+                try:
+                    self._warm_partition(client, db, table, column_list, where_clause, partition)
+                except Exception as e:
+                    failed += 1
+                    logger.warning(f"预热{db}.{table}分区{partition}失败：{str(e)}")
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="prewarm") as executor:
+                futures = {
+                    executor.submit(self._warm_pooled, db, table, column_list, where_clause, partition): partition
+                    for partition, where_clause in tasks
+                }
+                for future, partition in futures.items():
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failed += 1
+                        logger.warning(f"预热{db}.{table}分区{partition}失败：{str(e)}")
+        cache_after = self.get_cache_bytes(client)
+        result = {
+            "partitions": partitions,
+            "columns": columns or ["*"],
+            "failed_partitions": failed,
+            "cost_time": round(time.time() - start_time, 2),
+            "cache_bytes_before": cache_before,
+            "cache_bytes_after": cache_after,
+            "cache_bytes_added": cache_after - cache_before if cache_before is not None and cache_after is not None else None
+        }
+        added = result["cache_bytes_added"]
+        logger.info(
+            f"{db}.{table}缓存预热完成：{len(partitions)}个分区，{len(columns) if columns else '全部'}列，"
+            f"耗时{result['cost_time']}秒，缓存新增{format_bytes(added) if added is not None else '未知'}"
+        )
+        return result
@@ -1,19 +1,28 @@
 import json
 import os
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+from clickhouse_migrator.utils.progress import format_bytes
 
 REPORT_PREFIX = "clickhouse_s3_migration_report"
+# 巡检报告使用独立前缀，不导入运行历史库
+VERIFY_REPORT_PREFIX = "clickhouse_s3_verify_report"
 
 class ReportService:
     """报告服务"""
     
-    def generate_migration_report(self, config: Dict, migration_results: List[Dict], logger) -> str:
+    def generate_migration_report(self, config: Dict, migration_results: List[Dict], logger,
+                                  catalog_summary: Optional[Dict] = None) -> str:
         """
         生成迁移报告
+        :param catalog_summary: 表目录筛选汇总（整库/跨库迁移）
         :return: 报告文件路径
         """
         report_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # 守护进程中多个任务可能在同一秒结束，报告文件名附加任务编号
+        if config.get("job_id"):
+            report_time += f"_{config['job_id']}"
         report_file = os.path.join(config["report_path"], f"{REPORT_PREFIX}_{report_time}.json")
 
         # 计算详细统计信息，包括分布式表的本地表
@@ -21,6 +30,11 @@ class ReportService:
         completed_tables = len([r for r in migration_results if r["status"] == "completed"])
         failed_tables = len([r for r in migration_results if r["status"] == "failed"])
         skipped_tables = len([r for r in migration_results if r["status"] == "skipped"])
+        previewed_tables = len([r for r in migration_results if r["status"] == "previewed"])
+        drained_tables = len([r for r in migration_results if r["status"] == "drained"])
+        # 迁移前后磁盘占用
+        before_bytes = sum(r.get("compression", {}).get("before_bytes", 0) for r in migration_results)
+        after_bytes = sum(r.get("compression", {}).get("after_bytes", 0) for r in migration_results)
         
         # 计算本地表统计信息
         total_local_tables = 0
@@ -34,11 +48,17 @@ class ReportService:
                 completed_local_tables += len([lt for lt in local_tables if lt["status"] == "completed"])
                 failed_local_tables += len([lt for lt in local_tables if lt["status"] == "failed"])
 
+        # 迁移后查询延迟回退的表
+        regression_tables = [
+            f"{r.get('database')}.{r['table']}" for r in migration_results if r.get("benchmark", {}).get("regressions")
+        ]
+
         report = {
             "migration_info": {
                 "mode": config["mode"],
                 "database": config["db"],
                 "table": config["table"] if config["mode"] == "single" else "all",
+                "databases": sorted({r.get("database") for r in migration_results if r.get("database")}),
                 "start_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "s3_policy": config["s3_policy"],
                 "clickhouse_config": {
@@ -53,6 +73,11 @@ class ReportService:
                 "completed_tables": completed_tables,
                 "failed_tables": failed_tables,
                 "skipped_tables": skipped_tables,
+                "previewed_tables": previewed_tables,
+                "drained_tables": drained_tables,
+                "before_bytes": before_bytes,
+                "after_bytes": after_bytes,
+                "benchmark_regression_tables": regression_tables,
                 "distributed_tables": {
                     "total_local_tables": total_local_tables,
                     "completed_local_tables": completed_local_tables,
@@ -61,6 +86,9 @@ class ReportService:
             }
         }
 
+        if catalog_summary:
+            report["catalog"] = catalog_summary
+
         # 保存报告
         with open(report_file, "w", encoding="utf-8") as f:
             json.dump(report, f, ensure_ascii=False, indent=2)
@@ -73,6 +101,16 @@ class ReportService:
         logger.info(f"成功：{completed_tables}")
         logger.info(f"失败：{failed_tables}")
         logger.info(f"跳过：{skipped_tables}")
+        if previewed_tables > 0:
+            logger.info(f"压缩预估：{previewed_tables}")
+        if drained_tables > 0:
+            logger.info(f"排空未完成：{drained_tables}")
+        if before_bytes > 0:
+            logger.info(f"磁盘占用：迁移前{format_bytes(before_bytes)}，迁移后{format_bytes(after_bytes)}")
+        if regression_tables:
+            logger.warning(f"查询性能回退：{regression_tables}")
+        if catalog_summary and catalog_summary["skipped_tables"] > 0:
+            logger.info(f"筛选排除：{catalog_summary['skipped_tables']}个表{catalog_summary['skipped_by_reason']}")
         if total_local_tables > 0:
             logger.info(f"分布式表本地表统计：")
             logger.info(f"  总本地表数：{total_local_tables}")
@@ -82,6 +120,67 @@ class ReportService:
         
         return report_file
     
+    def generate_verify_report(self, config: Dict, verify_results: List[Dict], logger,
+                               catalog_summary: Optional[Dict] = None) -> str:
+        """
+        生成巡检报告（紧凑格式：汇总、未通过的表及其问题、各表巡检结果）
+        :return: 报告文件路径
+        """
+        report_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if config.get("job_id"):
+            report_time += f"_{config['job_id']}"
+        report_file = os.path.join(config["report_path"], f"{VERIFY_REPORT_PREFIX}_{report_time}.json")
+
+        failed = [r for r in verify_results if r["status"] == "failed"]
+        off_s3_parts = [p for r in verify_results for p in r.get("off_s3_parts", [])]
+        summary = {
+            "total_tables": len(verify_results),
+            "verified_tables": len([r for r in verify_results if r["status"] == "verified"]),
+            "failed_tables": len(failed),
+            "fingerprint_missing_tables": len(
+                [r for r in verify_results if r.get("fingerprint", {}).get("status") == "missing"]
+            ),
+            "checksums_checked": sum(r.get("fingerprint", {}).get("checksums_checked", 0) for r in verify_results),
+            "off_s3_parts": sum(p["parts"] for p in off_s3_parts),
+            "off_s3_bytes": sum(p["bytes"] for p in off_s3_parts),
+            "leftover_tables": sum(len(r.get("leftover_tables", [])) for r in verify_results)
+        }
+        report = {
+            "verify_info": {
+                "database": config["db"],
+                "table": config["table"] or "all",
+                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "s3_policy": config["s3_policy"],
+                "host": config["host"]
+            },
+            "summary": summary,
+            "failures": {f"{r['database']}.{r['table']}": r["issues"] for r in failed},
+            "results": verify_results
+        }
+        if catalog_summary:
+            report["catalog"] = catalog_summary
+
+        with open(report_file, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+        logger.info(f"巡检报告已生成：{report_file}")
+        logger.info("=" * 50)
+        logger.info("巡检汇总：")
+        logger.info(f"总表数：{summary['total_tables']}")
+        logger.info(f"通过：{summary['verified_tables']}")
+        logger.info(f"未通过：{summary['failed_tables']}")
+        if summary["fingerprint_missing_tables"] > 0:
+            logger.info(f"无迁移前指纹（仅检查数据块位置与遗留表）：{summary['fingerprint_missing_tables']}")
+        if summary["checksums_checked"] > 0:
+            logger.info(f"重算校验和的分区数：{summary['checksums_checked']}")
+        if summary["off_s3_parts"] > 0:
+            logger.warning(f"不在S3磁盘上的数据块：{summary['off_s3_parts']}个（{format_bytes(summary['off_s3_bytes'])}）")
+        if summary["leftover_tables"] > 0:
+            logger.warning(f"遗留表：{summary['leftover_tables']}个")
+        logger.info("=" * 50)
+
+        return report_file
+
     def log_migration_summary(self, migration_results: List[Dict], logger):
         """
         记录迁移摘要
@@ -1,23 +1,24 @@
-import json
-import os
+import threading
 from typing import Dict, List
-
-PROGRESS_FILE = "migration_progress.json"
+from clickhouse_migrator.utils.progress import load_progress, save_progress
 
 class ResumeService:
     """断点续传服务"""
     
+    def __init__(self):
+        # 并发迁移时多个工作线程共享同一进度字典，修改与落盘需串行
+        self._lock = threading.RLock()
+        # 各表已完成分区的集合索引：{(库, 表): (已完成分区列表, 集合)}，列表被替换时重建
+        self._completed_index = {}
+    
     def load_migration_progress(self) -> Dict:
         """加载迁移进度文件"""
-        if os.path.exists(PROGRESS_FILE):
-            with open(PROGRESS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return {}
+        return load_progress()
     
     def save_migration_progress(self, progress: Dict):
         """保存迁移进度文件"""
-        with open(PROGRESS_FILE, "w", encoding="utf-8") as f:
-            json.dump(progress, f, ensure_ascii=False, indent=2)
+        with self._lock:
+            save_progress(progress)
     
     def get_uncompleted_partitions(
             self,
@@ -34,36 +35,96 @@ class ResumeService:
         if table_progress["status"] == "completed":
             return []
 
-        completed_partitions = table_progress.get("completed_partitions", [])
+        completed_partitions = set(table_progress.get("completed_partitions", []))
         uncompleted = [p for p in all_partitions if p not in completed_partitions]
         return uncompleted
     
     def initialize_table_progress(self, progress: Dict, db: str, table: str) -> Dict:
         """初始化表级进度"""
-        if db not in progress:
-            progress[db] = {}
-        if table not in progress[db]:
-            progress[db][table] = {
-                "completed_partitions": [],
-                "status": "running"
-            }
-        return progress
+        with self._lock:
+            if db not in progress:
+                progress[db] = {}
+            if table not in progress[db]:
+                progress[db][table] = {
+                    "completed_partitions": [],
+                    "status": "running"
+                }
+            return progress
     
+    def get_completed_set(self, db: str, table: str, completed: List[str]) -> set:
+        """已完成分区的集合（与进度中的列表同步维护，避免分区数很多时逐个线性查找；调用方持有锁）"""
+        indexed = self._completed_index.get((db, table))
+        if indexed is None or indexed[0] is not completed or len(indexed[1]) != len(completed):
+            indexed = (completed, set(completed))
+            self._completed_index[(db, table)] = indexed
+        return indexed[1]
+
     def update_partition_progress(self, progress: Dict, db: str, table: str, partition: str):
         """更新分区进度"""
-        if db in progress and table in progress[db]:
-            if partition not in progress[db][table]["completed_partitions"]:
-                progress[db][table]["completed_partitions"].append(partition)
-            self.save_migration_progress(progress)
+        with self._lock:
+            if db in progress and table in progress[db]:
+                completed = progress[db][table]["completed_partitions"]
+                completed_set = self.get_completed_set(db, table, completed)
+                if partition not in completed_set:
+                    completed.append(partition)
+                    completed_set.add(partition)
+                self.save_migration_progress(progress)
+    
+    def mark_partitions_completed(self, progress: Dict, db: str, table: str, partitions: List[str]):
+        """批量标记分区完成（用于断点续传时按备份表数据对齐进度）"""
+        with self._lock:
+            if db in progress and table in progress[db]:
+                completed = progress[db][table]["completed_partitions"]
+                completed_set = self.get_completed_set(db, table, completed)
+                for partition in partitions:
+                    if partition not in completed_set:
+                        completed.append(partition)
+                        completed_set.add(partition)
+                self.save_migration_progress(progress)
+    
+    def reset_table_progress(self, progress: Dict, db: str, table: str):
+        """重置表级进度（备份表重新创建时，已完成分区记录不再可信）"""
+        with self._lock:
+            if db in progress and table in progress[db]:
+                progress[db][table] = {
+                    "completed_partitions": [],
+                    "status": "running"
+                }
+                self.save_migration_progress(progress)
+    
+    def classify_partitions(self, src_stats: Dict[str, Dict], backup_stats: Dict[str, Dict]) -> Dict[str, List[str]]:
+        """
+        按源表与备份表的分区行数对比分类分区状态（以partition_id为键）
+        - done：仅存在于备份表，源表分区已删除，迁移完成；
+        - copied：两边行数一致，已完整复制但源表分区尚未删除；
+        - half_copied：两边均有数据但行数不一致，复制中断；
+        - untouched：仅存在于源表，尚未开始复制
+        :return: {状态: [partition_id, ...]}
+        """
+        classification = {"done": [], "copied": [], "half_copied": [], "untouched": []}
+        for partition_id, backup_info in backup_stats.items():
+            src_info = src_stats.get(partition_id)
+            if src_info is None:
+                classification["done"].append(partition_id)
+            elif src_info["rows"] == backup_info["rows"]:
+                classification["copied"].append(partition_id)
+            else:
+                classification["half_copied"].append(partition_id)
+        for partition_id in src_stats:
+            if partition_id not in backup_stats:
+                classification["untouched"].append(partition_id)
+        return classification
     
     def mark_table_completed(self, progress: Dict, db: str, table: str):
         """标记表迁移完成"""
-        if db in progress and table in progress[db]:
-            progress[db][table]["status"] = "completed"
-            self.save_migration_progress(progress)
+        with self._lock:
+            if db in progress and table in progress[db]:
+                progress[db][table]["status"] = "completed"
+                self.save_migration_progress(progress)
     
     def mark_table_failed(self, progress: Dict, db: str, table: str):
         """标记表迁移失败"""
-        if db in progress and table in progress[db]:
-            progress[db][table]["status"] = "failed"
-            self.save_migration_progress(progress)
+        with self._lock:
+            if db in progress and table in progress[db]:
+                progress[db][table]["status"] = "failed"
+                self.save_migration_progress(progress)
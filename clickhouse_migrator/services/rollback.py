@@ -0,0 +1,207 @@
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from clickhouse_migrator.services.materialize import DEFERRED_KINDS, MaterializationService
+from clickhouse_migrator.utils import ddl
+
+# 迁移前快照表后缀（与源表同结构、同存储策略，分区以硬链接挂载）
+SNAPSHOT_SUFFIX = "_snapshot_s3mig"
+# 备份表后缀（与迁移服务一致）
+BACKUP_SUFFIX = "_backup_s3"
+# 中转表后缀（attach_from_staging复制策略）
+STAGING_SUFFIX = "_staging_s3"
+
+class RollbackService:
+    """
+    快速回滚：不重新复制数据，通过ATTACH PARTITION ... FROM（硬链接）重组分区
+    - 迁移前快照：复制开始前将源表全部分区ATTACH到同结构的快照表（硬链接，秒级完成），
+      回滚时直接以快照表替换源表；
+    - 无快照时：将备份表中已迁移的分区ATTACH回源表（两表存储策略须一致，必要时先在线切换源表策略）
+    回滚前后各用一次system.parts批量统计核对每个分区的行数
+    """
+
+    def __init__(self, partition_manager, tiering_service):
+        self.partition_manager = partition_manager
+        self.tiering_service = tiering_service
+        self.materialization_service = MaterializationService()
+
+    def table_exists(self, client, db: str, table: str) -> bool:
+        result = client.query(f"SELECT count() FROM system.tables WHERE database = '{db}' AND name = '{table}'")
+        return result.result_rows[0][0] > 0
+
+    def get_rows_by_partition(self, client, db: str, tables: List[str]) -> Dict[str, Dict[str, Dict]]:
+        """批量获取多个表各分区的行数（一次system.parts查询），键为partition_id"""
+        return self.partition_manager.get_partition_stats(client, db, tables)
+
+    def attach_all(self, client, db: str, src_table: str, dst_table: str, partitions: List[str]):
+        """将src_table的分区逐个ATTACH到dst_table（硬链接，不复制数据）"""
+        for partition in partitions:
+            formatted_partition = self.partition_manager.format_partition_value_for_drop(partition)
+            client.command(f"ALTER TABLE {db}.{dst_table} ATTACH PARTITION {formatted_partition} FROM {db}.{src_table}")
+
+    def create_snapshot(self, client, db: str, table: str, create_sql: str, replace_table_name, logger) -> Dict:
+        """
+        创建迁移前快照表：同结构、同存储策略的新表，源表全部分区以硬链接挂载
+        :param replace_table_name: 将建表语句中的表名替换为指定表名的函数
+        :return: 快照统计
+        """
+        snapshot = table + SNAPSHOT_SUFFIX
+        client.command(f"DROP TABLE IF EXISTS {db}.{snapshot}")
+        client.command(replace_table_name(create_sql, snapshot))
+        stats = self.get_rows_by_partition(client, db, [table])[table]
+        self.attach_all(client, db, table, snapshot, [info["partition"] for info in stats.values()])
+        snapshot_stats = self.get_rows_by_partition(client, db, [snapshot])[snapshot]
+        mismatched = self.compare(stats, snapshot_stats)
+        if mismatched:
+            raise RuntimeError(f"快照表{db}.{snapshot}与源表分区行数不一致：{mismatched[:10]}")
+        rows = sum(info["rows"] for info in stats.values())
+        logger.info(f"已创建迁移前快照{db}.{snapshot}：{len(stats)}个分区，{rows}行（硬链接，不占用额外空间）")
+        return {"table": snapshot, "partitions": len(stats), "rows": rows}
+
+    def drop_snapshot(self, client, db: str, table: str, logger):
+        """迁移成功后删除快照表，释放源表数据块"""
+        snapshot = table + SNAPSHOT_SUFFIX
+        if self.table_exists(client, db, snapshot):
+            client.command(f"DROP TABLE IF EXISTS {db}.{snapshot}")
+            logger.info(f"已删除迁移前快照{db}.{snapshot}")
+
+    def compare(self, expected: Dict[str, Dict], actual: Dict[str, Dict]) -> List[str]:
+        """对比两组分区行数，返回不一致的分区描述"""
+        mismatched = []
+        for partition_id in sorted(set(expected) | set(actual)):
+            expected_rows = expected.get(partition_id, {}).get("rows", 0)
+            actual_rows = actual.get(partition_id, {}).get("rows", 0)
+            if expected_rows != actual_rows:
+                mismatched.append(f"{partition_id}（预期{expected_rows}行，实际{actual_rows}行）")
+        return mismatched
+
+    def snapshot_usable(self, src_stats: Dict[str, Dict], snapshot_stats: Dict[str, Dict]) -> bool:
+        """快照可用于回滚：源表剩余的每个分区都包含在快照中且行数不多于快照（迁移期间无新写入）"""
+        return all(
+            partition_id in snapshot_stats and info["rows"] <= snapshot_stats[partition_id]["rows"]
+            for partition_id, info in src_stats.items()
+        )
+
+    def check_rollback_policy(self, client, db: str, tables: List[str], target_policy: str, explicit: bool):
+        """
+        修改任何表之前校验目标存储策略包含各表当前策略的全部磁盘，不满足时终止并提示--rollback-policy
+        :param explicit: 目标策略是否由--rollback-policy指定
+        """
+        target_disks = set(self.tiering_service.get_policy_disks(client, target_policy))
+        if not target_disks:
+            raise RuntimeError(f"回滚目标存储策略{target_policy}不存在")
+        for name in tables:
+            policy = self.tiering_service.get_table_policy(client, db, name)
+            missing = set(self.tiering_service.get_policy_disks(client, policy)) - target_disks
+            if missing:
+                hint = "" if explicit else "；请使用--rollback-policy指定同时包含本地磁盘与S3磁盘的存储策略（如分层策略）"
+                raise RuntimeError(
+                    f"{db}.{name}的存储策略{policy}包含目标策略{target_policy}没有的磁盘{sorted(missing)}，"
+                    f"无法挂载备份表分区{hint}"
+                )
+
+    def add_missing_definitions(self, client, db: str, table: str, backup: str,
+                                get_create_sql: Callable[[str], str], logger) -> List[str]:
+        """
+        备份表以--defer-secondary创建且物化未完成时缺少源表的索引/投影，ATTACH PARTITION FROM要求两表结构一致：
+        先将缺少的定义加到备份表（仅修改元数据）
+        :param get_create_sql: 按表名获取建表语句的函数
+        :return: 补充的定义名称列表
+        """
+        _, source_definitions = ddl.strip_definitions(get_create_sql(table), DEFERRED_KINDS)
+        _, backup_definitions = ddl.strip_definitions(get_create_sql(backup), DEFERRED_KINDS)
+        existing = {ddl.get_definition_name(definition) for definition in backup_definitions}
+        missing = [d for d in source_definitions if ddl.get_definition_name(d) not in existing]
+        if missing:
+            self.materialization_service.add_definitions(client, db, backup, missing, logger)
+        return [ddl.get_definition_name(definition) for definition in missing]
+
+    def rollback_table(self, client, config: Dict, logger, db: str, table: str,
+                       get_create_sql: Callable[[str], str]) -> Dict:
+        """
+        回滚单表：优先使用迁移前快照，否则将备份表分区挂载回源表
+        :param get_create_sql: 按表名获取建表语句的函数（核对备份表是否缺少延迟物化的索引/投影）
+        :return: 回滚结果
+        """
+        result = {
+            "database": db,
+            "table": table,
+            "start_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "end_time": "",
+            "status": "failed",
+            "error": ""
+        }
+        backup = table + BACKUP_SUFFIX
+        snapshot = table + SNAPSHOT_SUFFIX
+        if not self.table_exists(client, db, table):
+            raise RuntimeError(f"源表{db}.{table}不存在（可能已完成切换），无法回滚")
+        has_backup = self.table_exists(client, db, backup)
+        has_snapshot = self.table_exists(client, db, snapshot)
+        tables = [table] + ([backup] if has_backup else []) + ([snapshot] if has_snapshot else [])
+        stats = self.get_rows_by_partition(client, db, tables)
+
+        if has_snapshot and self.snapshot_usable(stats[table], stats[snapshot]):
+            # 快照回滚：原子重命名，以快照表替换源表
+            partial = f"{table}_rollback_partial"
+            client.command(f"DROP TABLE IF EXISTS {db}.{partial}")
+            client.command(f"RENAME TABLE {db}.{table} TO {db}.{partial}, {db}.{snapshot} TO {db}.{table}")
+            after = self.get_rows_by_partition(client, db, [table])[table]
+            mismatched = self.compare(stats[snapshot], after)
+            if mismatched:
+                raise RuntimeError(
+                    f"快照回滚后分区行数不一致：{mismatched[:10]}，迁移中的源表保留为{db}.{partial}"
+                )
+            client.command(f"DROP TABLE IF EXISTS {db}.{partial}")
+            if has_backup:
+                client.command(f"DROP TABLE IF EXISTS {db}.{backup}")
+            result["method"] = "snapshot"
+            result["restored_partitions"] = len(after)
+            logger.info(f"{db}.{table}已从迁移前快照回滚：{len(after)}个分区")
+        else:
+            if has_snapshot:
+                logger.warning(f"快照{db}.{snapshot}与源表当前数据不一致（迁移期间可能有新写入），改为挂载备份表分区")
+            if not has_backup:
+                raise RuntimeError(f"备份表{db}.{backup}不存在，无需回滚")
+            # ATTACH PARTITION FROM要求两表存储策略一致：按需在线切换为目标策略（须包含原策略的全部磁盘）
+            target_policy = config.get("rollback_policy") or self.tiering_service.get_table_policy(client, db, table)
+            self.check_rollback_policy(client, db, [table, backup], target_policy, bool(config.get("rollback_policy")))
+            added = self.add_missing_definitions(client, db, table, backup, get_create_sql, logger)
+            if added:
+                result["added_definitions"] = added
+                logger.warning(
+                    f"备份表{db}.{backup}的索引/投影{added}尚未物化，挂载回源表的分区缺少这些索引/投影数据，"
+                    f"可在回滚后执行MATERIALIZE INDEX/PROJECTION补建"
+                )
+            for name in (table, backup):
+                if self.tiering_service.get_table_policy(client, db, name) != target_policy:
+                    client.command(f"ALTER TABLE {db}.{name} MODIFY SETTING storage_policy = '{target_policy}'")
+                    logger.info(f"{db}.{name}已切换到存储策略{target_policy}")
+
+            # 源表仍保留的分区（已复制但尚未删除源分区）以源表为准
+            to_attach = {pid: info for pid, info in stats[backup].items() if pid not in stats[table]}
+            duplicated = len(stats[backup]) - len(to_attach)
+            if duplicated:
+                logger.info(f"{duplicated}个分区源表仍完整保留，不从备份表挂载")
+            self.attach_all(client, db, backup, table, [info["partition"] for info in to_attach.values()])
+
+            expected = dict(stats[table])
+            expected.update(to_attach)
+            after = self.get_rows_by_partition(client, db, [table])[table]
+            mismatched = self.compare(expected, after)
+            if mismatched:
+                raise RuntimeError(f"回滚后分区行数不一致：{mismatched[:10]}，备份表{db}.{backup}已保留")
+            client.command(f"DROP TABLE IF EXISTS {db}.{backup}")
+            if has_snapshot:
+                client.command(f"DROP TABLE IF EXISTS {db}.{snapshot}")
+            result["method"] = "attach_from_backup"
+            result["storage_policy"] = target_policy
+            result["restored_partitions"] = len(to_attach)
+            logger.info(f"{db}.{table}已将备份表的{len(to_attach)}个分区挂载回源表（存储策略{target_policy}）")
+
+        # 清理复制策略使用的中转表
+        client.command(f"DROP TABLE IF EXISTS {db}.{table}{STAGING_SUFFIX}")
+        result["total_partitions"] = len(after)
+        result["total_rows"] = sum(info["rows"] for info in after.values())
+        result["status"] = "rolled_back"
+        result["end_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return result
@@ -0,0 +1,177 @@
+import time
+from typing import Dict, List, Optional
+
+from clickhouse_migrator.utils.progress import format_bytes, format_duration
+
+# 搬迁监控的日志输出间隔（秒）
+MOVE_LOG_INTERVAL = 60
+
+class TieringService:
+    """
+    TTL分层服务：为表切换到包含本地盘与S3的分层存储策略并设置TTL搬迁规则，
+    由ClickHouse后台自行搬迁数据块，通过system.parts.disk_name与system.moves监控搬迁进度
+    """
+
+    def __init__(self, poll_interval: float = 30):
+        """
+        :param poll_interval: 搬迁进度轮询间隔（秒）
+        """
+        self.poll_interval = poll_interval
+
+    def get_policy_disks(self, client, policy: str, volume: Optional[str] = None) -> List[str]:
+        """获取存储策略（或其中某个卷）包含的磁盘列表"""
+        volume_filter = f"AND volume_name = '{volume}'" if volume else ""
+        result = client.query(f"""
+            SELECT arrayJoin(disks)
+            FROM system.storage_policies
+            WHERE policy_name = '{policy}' {volume_filter}
+        """)
+        return [row[0] for row in result.result_rows]
+
+    def get_table_policy(self, client, db: str, table: str) -> str:
+        """获取表当前的存储策略"""
+        result = client.query(
+            f"SELECT storage_policy FROM system.tables WHERE database = '{db}' AND name = '{table}'"
+        )
+        if not result.result_rows:
+            raise RuntimeError(f"表{db}.{table}不存在")
+        return result.result_rows[0][0]
+
+    def check_policy_compatible(self, client, db: str, table: str, tier_policy: str) -> List[str]:
+        """
+        校验分层存储策略包含表当前策略的全部磁盘（MODIFY SETTING storage_policy的前提）
+        :return: 分层存储策略的磁盘列表
+        """
+        current_policy = self.get_table_policy(client, db, table)
+        tier_disks = self.get_policy_disks(client, tier_policy)
+        if not tier_disks:
+            raise RuntimeError(f"分层存储策略{tier_policy}不存在")
+        missing = set(self.get_policy_disks(client, current_policy)) - set(tier_disks)
+        if missing:
+            raise RuntimeError(
+                f"分层存储策略{tier_policy}缺少表{db}.{table}当前策略{current_policy}的磁盘{sorted(missing)}，"
+                f"无法在线切换存储策略"
+            )
+        return tier_disks
+
+    def build_move_ttl(self, config: Dict) -> str:
+        """根据配置生成TTL搬迁规则，如"event_date + INTERVAL 30 DAY TO VOLUME 'cold'" """
+        if not config.get("tier_ttl"):
+            raise RuntimeError("TTL分层模式必须指定--tier-ttl")
+        if config.get("tier_disk"):
+            return f"{config['tier_ttl']} TO DISK '{config['tier_disk']}'"
+        if config.get("tier_volume"):
+            return f"{config['tier_ttl']} TO VOLUME '{config['tier_volume']}'"
+        raise RuntimeError("TTL分层模式必须指定--tier-volume或--tier-disk")
+
+    def get_target_disks(self, client, config: Dict) -> List[str]:
+        """搬迁目标磁盘列表"""
+        if config.get("tier_disk"):
+            return [config["tier_disk"]]
+        disks = self.get_policy_disks(client, config["tier_policy"], config["tier_volume"])
+        if not disks:
+            raise RuntimeError(f"分层存储策略{config['tier_policy']}中不存在卷{config['tier_volume']}")
+        return disks
+
+    def apply_tiering(self, client, db: str, table: str, tier_policy: str, ttl: Optional[str], logger,
+                      materialize_ttl: bool = True):
+        """
+        应用存储策略与TTL变更
+        :param ttl: 合并后的完整表级TTL，None表示TTL无需修改
+        :param materialize_ttl: 是否在MODIFY TTL时立即为已有数据块重算TTL（分批物化时为False）
+        """
+        client.command(f"ALTER TABLE {db}.{table} MODIFY SETTING storage_policy = '{tier_policy}'")
+        logger.info(f"{db}.{table}已切换到分层存储策略{tier_policy}")
+        if ttl is None:
+            return
+        client.command(
+            f"ALTER TABLE {db}.{table} MODIFY TTL {ttl}",
+            settings={"materialize_ttl_after_modify": 1 if materialize_ttl else 0}
+        )
+        logger.info(f"{db}.{table}已设置TTL：{ttl}")
+
+    def materialize_ttl_in_batches(self, client, db: str, table: str, partitions: List[str], batch_size: int,
+                                   materialization_service, logger):
+        """
+        按分区分批执行MATERIALIZE TTL，每批变更完成后再提交下一批，控制重算TTL与搬迁带来的负载
+        :param partitions: 分区表达式列表（同DROP PARTITION格式）
+        """
+        for start in range(0, len(partitions), batch_size):
+            batch = partitions[start:start + batch_size]
+            for partition in batch:
+                client.command(
+                    f"ALTER TABLE {db}.{table} MATERIALIZE TTL IN PARTITION {partition}",
+                    settings={"mutations_sync": 0}
+                )
+            materialization_service.wait_for_mutations(client, db, table, logger)
+            logger.info(f"{db}.{table}已完成{min(start + batch_size, len(partitions))}/{len(partitions)}个分区的TTL物化")
+
+    def get_move_status(self, client, db: str, table: str, target_disks: List[str]) -> Dict:
+        """
+        统计搬迁状态
+        :return: 目标磁盘字节数、待搬迁字节数（搬迁TTL已全部过期但仍在其他磁盘的数据块）、正在搬迁的数据块
+        """
+        disk_list = ", ".join(f"'{d}'" for d in target_disks)
+        result = client.query(f"""
+            SELECT
+                sumIf(bytes_on_disk, disk_name IN ({disk_list})),
+                sumIf(bytes_on_disk, disk_name NOT IN ({disk_list})
+                      AND notEmpty(move_ttl_info.max) AND arrayMax(move_ttl_info.max) <= now())
+            FROM system.parts
+            WHERE active AND database = '{db}' AND table = '{table}'
+        """)
+        target_bytes, pending_bytes = result.result_rows[0]
+        moving_parts, moving_bytes = 0, 0
+        try:
+            moves = client.query(f"""
+                SELECT count(), sum(part_size)
+                FROM system.moves
+                WHERE database = '{db}' AND table = '{table}'
+            """)
+            moving_parts, moving_bytes = moves.result_rows[0]
+        except Exception:
+            # 低版本ClickHouse无system.moves，仅依据system.parts判断
+            pass
+        return {
+            "target_bytes": int(target_bytes or 0),
+            "pending_bytes": int(pending_bytes or 0),
+            "moving_parts": int(moving_parts or 0),
+            "moving_bytes": int(moving_bytes or 0)
+        }
+
+    def monitor_moves(self, client, db: str, table: str, target_disks: List[str], logger, timeout: float = 0) -> Dict:
+        """
+        监控后台搬迁直至没有待搬迁的数据块，输出每小时搬迁字节数与预计剩余时间
+        :param timeout: 监控超时（秒），0表示不限制；超时后停止监控，后台搬迁继续进行
+        :return: 搬迁统计
+        """
+        start_time = time.time()
+        initial = self.get_move_status(client, db, table, target_disks)
+        status = initial
+        last_log = start_time
+        while status["pending_bytes"] > 0 or status["moving_parts"] > 0:
+            if timeout and time.time() - start_time > timeout:
+                logger.warning(f"{db}.{table}搬迁监控超时（{timeout}秒），后台搬迁将继续进行")
+                break
+            time.sleep(self.poll_interval)
+            status = self.get_move_status(client, db, table, target_disks)
+            if time.time() - last_log >= MOVE_LOG_INTERVAL:
+                moved = status["target_bytes"] - initial["target_bytes"]
+                rate = moved / max(time.time() - start_time, 1)
+                eta = (status["pending_bytes"] / rate) if rate > 0 else None
+                logger.info(
+                    f"{db}.{table}搬迁进度：已搬迁{format_bytes(moved)}，速率{format_bytes(rate * 3600)}/小时，"
+                    f"待搬迁{format_bytes(status['pending_bytes'])}，正在搬迁{status['moving_parts']}个数据块，"
+                    f"预计剩余{format_duration(eta)}"
+                )
+                last_log = time.time()
+        elapsed = time.time() - start_time
+        moved = status["target_bytes"] - initial["target_bytes"]
+        return {
+            "moved_bytes": moved,
+            "target_bytes": status["target_bytes"],
+            "pending_bytes": status["pending_bytes"],
+            "elapsed_seconds": round(elapsed, 1),
+            "bytes_per_hour": round(moved / elapsed * 3600, 2) if elapsed > 0 else None,
+            "finished": status["pending_bytes"] == 0 and status["moving_parts"] == 0
+        }
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, Optional
 
 class DataValidator:
     """数据验证器"""
@@ -35,6 +35,34 @@ class DataValidator:
         except Exception as e:
             raise RuntimeError(f"获取{db}.{table}行数失败（分区：{partition_value}）：{str(e)}")
     
+    def get_fingerprint(self,
+            client,
+            db: str,
+            table: str,
+            partition_value: Optional[str] = None,
+            partition_key: Optional[str] = None,
+            settings: Optional[Dict] = None
+    ) -> Dict:
+        """
+        获取表/分区的行数与内容校验和（一次扫描）
+        校验和为每行cityHash64之和（UInt64溢出回绕），与行顺序、数据块划分无关，需读取全部列数据
+        :param settings: 查询设置（如限制读取线程数与读取带宽）
+        :return: {"rows": 行数, "checksum": 校验和}
+        """
+        try:
+            where_clause = "1"
+            if partition_value and partition_key:
+                from clickhouse_migrator.services.partition import PartitionManager
+                where_clause = PartitionManager().generate_partition_where_clause(partition_key, partition_value)
+            result = client.query(
+                f"SELECT count(), sum(cityHash64(*)) FROM {db}.{table} WHERE {where_clause}",
+                settings=settings
+            )
+            rows, checksum = result.result_rows[0]
+            return {"rows": int(rows), "checksum": str(checksum)}
+        except Exception as e:
+            raise RuntimeError(f"获取{db}.{table}校验和失败（分区：{partition_value}）：{str(e)}")
+
     def validate_partition(self, client, db: str, src_table: str, dst_table: str, 
                           partition_value: str, partition_key: str) -> dict:
         """
@@ -0,0 +1,221 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from clickhouse_migrator.services.catalog import match_filters
+from clickhouse_migrator.services.rollback import BACKUP_SUFFIX, SNAPSHOT_SUFFIX, STAGING_SUFFIX
+from clickhouse_migrator.utils.progress import format_bytes
+
+# 默认并发巡检的表数
+DEFAULT_VERIFY_CONCURRENCY = 4
+# 重算校验和时每个查询的读取线程数上限
+DEFAULT_VERIFY_MAX_THREADS = 2
+# 迁移遗留表的后缀（备份表、中转表、迁移前快照表）
+LEFTOVER_SUFFIXES = (BACKUP_SUFFIX, STAGING_SUFFIX, SNAPSHOT_SUFFIX)
+# 单个表的问题描述中最多列出的分区数
+MAX_LISTED_PARTITIONS = 10
+
+class VerifyService:
+    """
+    迁移后巡检：以受控并发检查一批已迁移的表
+    - 全部活跃数据块位于S3存储策略的磁盘上（分布式表经clusterAllReplicas检查各分片的本地表）
+    - 不存在遗留的备份表、中转表或快照表
+    - 各分区行数（system.parts）与运行历史中记录的迁移前指纹一致，可选按分区重算内容校验和
+    """
+
+    def __init__(self, validator, partition_manager, tiering_service):
+        self.validator = validator
+        self.partition_manager = partition_manager
+        self.tiering_service = tiering_service
+        # 连接池与运行历史库由协调器注入（无连接池时顺序巡检，无历史库时跳过指纹核对）
+        self.client_pool = None
+        self.history_service = None
+
+    def get_io_settings(self, config: Dict) -> Dict:
+        """重算校验和的查询设置：限制读取线程数与读取带宽，便于在业务时段巡检"""
+        settings = {"max_threads": config.get("verify_max_threads", DEFAULT_VERIFY_MAX_THREADS)}
+        if config.get("verify_read_bandwidth"):
+            bandwidth = int(config["verify_read_bandwidth"] * 1024 * 1024)
+            settings["max_remote_read_network_bandwidth"] = bandwidth
+            settings["max_local_read_bandwidth"] = bandwidth
+        return settings
+
+    def get_leftover_tables(self, client, databases: List[str]) -> Dict[str, List[str]]:
+        """
+        一次查询找出迁移遗留表
+        :return: {"库.源表名": [遗留表名]}
+        """
+        if not databases:
+            return {}
+        db_list = ", ".join(f"'{db}'" for db in databases)
+        suffix_filter = " OR ".join(f"endsWith(name, '{suffix}')" for suffix in LEFTOVER_SUFFIXES)
+        result = client.query(
+            f"SELECT database, name FROM system.tables WHERE database IN ({db_list}) AND ({suffix_filter})"
+        )
+        leftovers = {}
+        for db, name in result.result_rows:
+            suffix = next(s for s in LEFTOVER_SUFFIXES if name.endswith(s))
+            leftovers.setdefault(f"{db}.{name[:-len(suffix)]}", []).append(name)
+        return leftovers
+
+    def get_off_s3_parts(self, client, db: str, table: str, s3_disks: List[str],
+                         cluster: Optional[str] = None) -> List[Dict]:
+        """
+        不在S3磁盘上的活跃数据块（按主机、磁盘汇总）
+        :param cluster: 分布式表所在集群，指定时检查集群全部副本上的本地表
+        """
+        source = f"clusterAllReplicas('{cluster}', system.parts)" if cluster else "system.parts"
+        disk_list = ", ".join(f"'{disk}'" for disk in s3_disks)
+        result = client.query(f"""
+            SELECT hostName() AS host, disk_name, count(), sum(bytes_on_disk)
+            FROM {source}
+            WHERE database = '{db}' AND table = '{table}' AND active AND disk_name NOT IN ({disk_list})
+            GROUP BY host, disk_name
+        """)
+        return [
+            {"host": row[0], "disk": row[1], "parts": int(row[2]), "bytes": int(row[3])}
+            for row in result.result_rows
+        ]
+
+    def check_fingerprints(self, client, config: Dict, db: str, table: str, current: Dict[str, Dict]) -> Dict:
+        """
+        核对各分区与迁移前指纹（迁移后新写入的分区不参与核对）
+        :param current: 表当前的分区统计（PartitionManager.get_partition_stats）
+        """
+        fingerprints = self.history_service.get_partition_fingerprints(config["host"], db, table) \
+            if self.history_service is not None else {}
+        if not fingerprints:
+            return {"status": "missing"}
+        current_by_partition = {info["partition"]: info for info in current.values()}
+        missing = []
+        mismatched = []
+        checksum_mismatched = []
+        checksums_checked = 0
+        partition_key = None
+        settings = self.get_io_settings(config)
+        for partition, fingerprint in sorted(fingerprints.items()):
+            info = current_by_partition.get(partition)
+            if info is None:
+                missing.append(partition)
+                continue
+            if info["rows"] != fingerprint["rows"]:
+                mismatched.append(f"{partition}（迁移前{fingerprint['rows']}行，当前{info['rows']}行）")
+                continue
+            if config.get("verify_checksums") and fingerprint["checksum"] is not None:
+                if partition_key is None:
+                    partition_key = self.partition_manager.get_table_partition_key(client, db, table)
+                actual = self.validator.get_fingerprint(client, db, table, partition, partition_key, settings)
+                checksums_checked += 1
+                if actual["checksum"] != fingerprint["checksum"]:
+                    checksum_mismatched.append(partition)
+        return {
+            "status": "mismatched" if missing or mismatched or checksum_mismatched else "matched",
+            "partitions": len(fingerprints),
+            "checksums_checked": checksums_checked,
+            "missing_partitions": missing,
+            "row_mismatches": mismatched,
+            "checksum_mismatches": checksum_mismatched
+        }
+
+    def verify_table(self, client, config: Dict, logger, target: Dict, s3_disks: List[str],
+                     leftovers: Dict[str, List[str]]) -> Dict:
+        """
+        巡检单表
+        :param target: {"database", "table"}，分布式表的本地表另含cluster与distributed
+        """
+        db, table = target["database"], target["table"]
+        start_time = time.time()
+        result = {"database": db, "table": table, "status": "failed", "issues": []}
+        if target.get("distributed"):
+            result["distributed"] = target["distributed"]
+        issues = result["issues"]
+        try:
+            policy = self.tiering_service.get_table_policy(client, db, table)
+            if policy != config["s3_policy"]:
+                issues.append(f"存储策略为{policy}")
+
+            off_s3 = self.get_off_s3_parts(client, db, table, s3_disks, target.get("cluster"))
+            if off_s3:
+                result["off_s3_parts"] = off_s3
+                issues.append(
+                    f"{sum(p['parts'] for p in off_s3)}个活跃数据块（{format_bytes(sum(p['bytes'] for p in off_s3))}）"
+                    f"不在S3磁盘上：{sorted({p['host'] + ':' + p['disk'] for p in off_s3})}"
+                )
+
+            leftover_tables = leftovers.get(f"{db}.{table}")
+            if leftover_tables:
+                result["leftover_tables"] = leftover_tables
+                issues.append(f"存在遗留表{leftover_tables}")
+
+            current = self.partition_manager.get_partition_stats(client, db, [table])[table]
+            result["partitions"] = len(current)
+            result["rows"] = sum(info["rows"] for info in current.values())
+            fingerprint = self.check_fingerprints(client, config, db, table, current)
+            result["fingerprint"] = fingerprint
+            if fingerprint.get("missing_partitions"):
+                issues.append(f"迁移前的分区已不存在：{fingerprint['missing_partitions'][:MAX_LISTED_PARTITIONS]}")
+            if fingerprint.get("row_mismatches"):
+                issues.append(f"分区行数与迁移前不一致：{fingerprint['row_mismatches'][:MAX_LISTED_PARTITIONS]}")
+            if fingerprint.get("checksum_mismatches"):
+                issues.append(f"分区校验和与迁移前不一致：{fingerprint['checksum_mismatches'][:MAX_LISTED_PARTITIONS]}")
+            result["status"] = "failed" if issues else "verified"
+        except Exception as e:
+            issues.append(f"巡检异常：{str(e)}")
+        result["cost_time"] = round(time.time() - start_time, 2)
+        if issues:
+            logger.warning(f"{db}.{table}巡检未通过：{'；'.join(issues)}")
+        else:
+            logger.debug(f"{db}.{table}巡检通过（{result['partitions']}个分区，{result['rows']}行）")
+        return result
+
+    def _verify_pooled(self, config: Dict, logger, target: Dict, s3_disks: List[str],
+                       leftovers: Dict[str, List[str]]) -> Dict:
+        with self.client_pool.lease() as client:
+            return self.verify_table(client, config, logger, target, s3_disks, leftovers)
+
+    def verify_tables(self, client, config: Dict, logger, targets: List[Dict]) -> List[Dict]:
+        """
+        并发巡检一批表，并将源表已不存在的遗留表作为失败项列出
+        :return: 每个表的巡检结果
+        """
+        s3_disks = self.tiering_service.get_policy_disks(client, config["s3_policy"])
+        if not s3_disks:
+            raise RuntimeError(f"S3存储策略{config['s3_policy']}不存在")
+        if self.history_service is None:
+            logger.warning("未启用运行历史库，跳过迁移前指纹核对")
+        databases = sorted({target["database"] for target in targets} | ({config["db"]} if config.get("db") else set()))
+        leftovers = self.get_leftover_tables(client, databases)
+
+        concurrency = config.get("verify_concurrency", DEFAULT_VERIFY_CONCURRENCY)
+        logger.info(f"开始巡检{len(targets)}个表（并发{concurrency}），S3磁盘：{s3_disks}")
+        if self.client_pool is None or concurrency <= 1:
+            results = [self.verify_table(client, config, logger, target, s3_disks, leftovers) for target in targets]
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="verify") as executor:
+                futures = [
+                    executor.submit(self._verify_pooled, config, logger, target, s3_disks, leftovers)
+                    for target in targets
+                ]
+                results = [future.result() for future in futures]
+
+        # 未在巡检范围内的表的遗留表（如切换中断导致源表不存在）：单表模式只关注指定表
+        verified = {f"{target['database']}.{target['table']}" for target in targets}
+        orphans = {
+            name: leftover_tables for name, leftover_tables in leftovers.items()
+            if name not in verified and not config.get("table")
+            and match_filters(name.split(".", 1)[1], config.get("include_tables", []), config.get("exclude_tables", []))
+        }
+        existing = set()
+        if orphans:
+            name_list = ", ".join(f"'{name}'" for name in orphans)
+            result = client.query(f"SELECT database || '.' || name FROM system.tables WHERE (database || '.' || name) IN ({name_list})")
+            existing = {row[0] for row in result.result_rows}
+        for name, leftover_tables in sorted(orphans.items()):
+            db, table = name.split(".", 1)
+            issue = f"存在遗留表{leftover_tables}" if name in existing else f"源表不存在，存在遗留表{leftover_tables}"
+            logger.warning(f"{name}巡检未通过：{issue}")
+            results.append({
+                "database": db, "table": table, "status": "failed",
+                "issues": [issue], "leftover_tables": leftover_tables
+            })
+        return results
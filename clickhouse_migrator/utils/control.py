@@ -0,0 +1,202 @@
+import json
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from clickhouse_migrator.clients.pool import get_pool_size
+from clickhouse_migrator.utils.schedule import WindowSchedule
+
+DEFAULT_CONTROL_FILE = "migration_control.json"
+# 暂停或窗口外等待时的检查间隔（秒）
+CONTROL_POLL_INTERVAL = 5
+
+# 控制文件中可在线调整的配置项
+LIVE_CONFIG_KEYS = ("insert_interval", "bandwidth_limit", "workers", "optimize_concurrency")
+# 在线调整配置项的类型与下限
+LIVE_CONFIG_TYPES = {"insert_interval": (float, 0), "bandwidth_limit": (float, 0), "workers": (int, 1),
+                     "optimize_concurrency": (int, 1)}
+
+class MigrationDrained(RuntimeError):
+    """收到排空指令：完成当前分区后停止迁移"""
+
+class ConcurrencyGate:
+    """可在线调整上限的并发闸门"""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, int(limit))
+        self.active = 0
+        self._cond = threading.Condition()
+
+    def set_limit(self, limit: int):
+        with self._cond:
+            self.limit = max(1, int(limit))
+            self._cond.notify_all()
+
+    def acquire(self):
+        """占用一个并发槽位，达到上限时阻塞"""
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+
+    def release(self):
+        """释放并发槽位"""
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """以上下文方式占用并发槽位"""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+class MigrationController:
+    """
+    迁移运行控制器：维护时间窗口、暂停/恢复/排空，以及运行中在线调整配置
+    控制方式：
+    - 信号：SIGUSR1暂停，SIGUSR2恢复，SIGHUP立即重新加载控制文件；
+    - 控制文件（JSON）：{"action": "pause|resume|drain", "workers": 4, "bandwidth_limit": 50, "insert_interval": 0.5}，
+      resume同时解除暂停与排空
+    """
+
+    def __init__(self, config: Dict, control_file: str = DEFAULT_CONTROL_FILE):
+        """
+        :param config: 运行配置字典（在线调整会直接修改该字典）
+        :param control_file: 控制文件路径
+        """
+        self.config = config
+        self.control_file = control_file
+        self.schedule = WindowSchedule(config.get("windows"))
+        self.paused = False
+        self.draining = False
+        self.worker_gate = ConcurrencyGate(config.get("workers", 1))
+        self.bandwidth_governor = None
+        self.merge_scheduler = None
+        self.client_pool = None
+        # 启动时已存在的控制文件视为以往运行遗留，只在之后被修改（或收到SIGHUP）时才应用
+        self._control_mtime = self.get_control_mtime()
+        self._lock = threading.Lock()
+
+    def get_control_mtime(self):
+        """控制文件的修改时间，文件不存在时为None"""
+        if not self.control_file or not os.path.exists(self.control_file):
+            return None
+        return os.path.getmtime(self.control_file)
+
+    def install_signal_handlers(self, logger):
+        """注册控制信号（仅主线程可注册）"""
+        if threading.current_thread() is not threading.main_thread():
+            return
+
+        def handle_pause(signum, frame):
+            self.paused = True
+            logger.warning("收到SIGUSR1，迁移将在当前分区完成后暂停")
+
+        def handle_resume(signum, frame):
+            self.paused = False
+            logger.warning("收到SIGUSR2，迁移恢复执行")
+
+        def handle_reload(signum, frame):
+            self._control_mtime = None
+            logger.warning("收到SIGHUP，将重新加载控制文件")
+
+        signal.signal(signal.SIGUSR1, handle_pause)
+        signal.signal(signal.SIGUSR2, handle_resume)
+        signal.signal(signal.SIGHUP, handle_reload)
+
+    def reload_control_file(self, logger):
+        """控制文件变更时加载并应用其中的指令和配置（解析失败时不记录修改时间，下个检查点重试）"""
+        mtime = self.get_control_mtime()
+        if mtime is None:
+            return
+        with self._lock:
+            if mtime == self._control_mtime:
+                return
+            try:
+                with open(self.control_file, "r", encoding="utf-8") as f:
+                    control = json.load(f)
+            except Exception as e:
+                logger.error(f"读取控制文件{self.control_file}失败：{str(e)}")
+                return
+            self._control_mtime = mtime
+
+        action = control.get("action")
+        if action == "pause":
+            self.paused = True
+        elif action == "resume":
+            # 恢复同时解除排空（守护进程中排空后仍需继续执行新任务）
+            self.paused = False
+            self.draining = False
+        elif action == "drain":
+            self.draining = True
+        if action:
+            logger.warning(f"控制文件指令：{action}")
+        self.apply_live_config(control, logger)
+
+    def apply_live_config(self, overrides: Dict, logger):
+        """在线调整并发、带宽和插入间隔等配置（不重启、不丢失会话状态）"""
+        for key in LIVE_CONFIG_KEYS:
+            if key not in overrides:
+                continue
+            value_type, minimum = LIVE_CONFIG_TYPES[key]
+            try:
+                value = value_type(overrides[key])
+            except (TypeError, ValueError):
+                logger.error(f"在线调整配置{key}的值无效：{overrides[key]!r}，已忽略")
+                continue
+            if value < minimum:
+                logger.error(f"在线调整配置{key}的值不能小于{minimum}：{value}，已忽略")
+                continue
+            if value == self.config.get(key):
+                continue
+            self.config[key] = value
+            logger.warning(f"在线调整配置：{key} = {value}")
+            if key == "workers":
+                self.worker_gate.set_limit(value)
+            elif key == "bandwidth_limit" and self.bandwidth_governor is not None and value > 0:
+                self.bandwidth_governor.set_limit(value * 1024 * 1024)
+            elif key == "optimize_concurrency" and self.merge_scheduler is not None:
+                self.merge_scheduler.set_concurrency(value)
+            if key in ("workers", "optimize_concurrency") and self.client_pool is not None:
+                self.client_pool.resize(get_pool_size(self.config))
+
+    def checkpoint(self, logger, label: str = ""):
+        """
+        分区/表边界的检查点：应用控制指令，暂停或窗口外时等待，排空时抛出MigrationDrained
+        :param label: 日志中展示的当前位置描述
+        """
+        self.reload_control_file(logger)
+        waiting_logged = False
+        while True:
+            if self.draining:
+                raise MigrationDrained(f"收到排空指令，迁移在{label or '当前位置'}停止")
+            if self.paused:
+                reason = "迁移已暂停"
+            elif not self.schedule.is_open():
+                reason = f"当前不在维护窗口内，下次窗口开启时间：{self.schedule.next_open():%Y-%m-%d %H:%M}"
+            else:
+                if waiting_logged:
+                    logger.info(f"继续执行迁移：{label}")
+                return
+            if not waiting_logged:
+                logger.warning(f"{reason}，等待中（{label}）")
+                waiting_logged = True
+            time.sleep(CONTROL_POLL_INTERVAL)
+            self.reload_control_file(logger)
+
+    def status(self) -> Dict:
+        """返回控制器状态"""
+        return {
+            "paused": self.paused,
+            "draining": self.draining,
+            "in_window": self.schedule.is_open(),
+            "next_window": self.schedule.next_open().strftime("%Y-%m-%d %H:%M:%S"),
+            "live_config": {key: self.config.get(key) for key in LIVE_CONFIG_KEYS}
+        }
@@ -0,0 +1,180 @@
+import re
+from typing import List, Optional, Tuple
+
+# 列定义块中的非列元素（索引、投影、约束）
+NON_COLUMN_KEYWORDS = ("INDEX", "PROJECTION", "CONSTRAINT")
+
+def find_matching_paren(text: str, open_pos: int) -> int:
+    """
+    查找与open_pos处左括号匹配的右括号位置（忽略引号、反引号内的括号）
+    :return: 右括号下标，未找到返回-1
+    """
+    depth = 0
+    quote = None
+    i = open_pos
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if ch == "\\":
+                i += 2
+                continue
+            if ch == quote:
+                quote = None
+        elif ch in ("'", "`", '"'):
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return -1
+
+def split_top_level(text: str, sep: str = ",") -> List[str]:
+    """按顶层分隔符切分文本（忽略括号和引号内的分隔符）"""
+    parts = []
+    depth = 0
+    quote = None
+    current = []
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            current.append(ch)
+            if ch == "\\" and i + 1 < len(text):
+                current.append(text[i + 1])
+                i += 2
+                continue
+            if ch == quote:
+                quote = None
+        elif ch in ("'", "`", '"'):
+            quote = ch
+            current.append(ch)
+        elif ch == "(":
+            depth += 1
+            current.append(ch)
+        elif ch == ")":
+            depth -= 1
+            current.append(ch)
+        elif ch == sep and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(ch)
+        i += 1
+    if "".join(current).strip():
+        parts.append("".join(current).strip())
+    return parts
+
+def find_columns_block(create_sql: str) -> Tuple[int, int]:
+    """
+    定位CREATE TABLE语句中列定义块的位置
+    :return: (左括号下标, 右括号下标)
+    """
+    match = re.search(r"CREATE\s+TABLE\s+\S+\s*\(", create_sql, re.IGNORECASE)
+    if not match:
+        raise RuntimeError("无法定位建表语句中的列定义")
+    open_pos = match.end() - 1
+    close_pos = find_matching_paren(create_sql, open_pos)
+    if close_pos < 0:
+        raise RuntimeError("建表语句中的列定义括号不匹配")
+    return open_pos, close_pos
+
+def split_column_definitions(create_sql: str) -> List[str]:
+    """拆分建表语句列定义块中的各个元素（列、索引、投影、约束）"""
+    open_pos, close_pos = find_columns_block(create_sql)
+    return split_top_level(create_sql[open_pos + 1:close_pos])
+
+def replace_column_definitions(create_sql: str, definitions: List[str]) -> str:
+    """用新的元素列表替换建表语句的列定义块"""
+    open_pos, close_pos = find_columns_block(create_sql)
+    return create_sql[:open_pos + 1] + ", ".join(definitions) + create_sql[close_pos:]
+
+def get_definition_kind(definition: str) -> str:
+    """返回列定义块元素的类型：column/index/projection/constraint"""
+    first_word = definition.split(None, 1)[0].upper() if definition.strip() else ""
+    if first_word in NON_COLUMN_KEYWORDS:
+        return first_word.lower()
+    return "column"
+
+def get_column_name(definition: str) -> Optional[str]:
+    """解析列定义中的列名（去除反引号），非列元素返回None"""
+    if get_definition_kind(definition) != "column":
+        return None
+    definition = definition.strip()
+    if definition.startswith("`"):
+        end = definition.index("`", 1)
+        return definition[1:end]
+    return definition.split(None, 1)[0]
+
+def mask_string_literals(text: str) -> str:
+    """将字符串字面量内容替换为占位符（保持长度不变），便于在其外部做关键字匹配"""
+    return re.sub(r"'(?:[^'\\]|\\.)*'", lambda m: "'" + "_" * (len(m.group()) - 2) + "'", text)
+
+def set_column_codec(definition: str, codec: str) -> str:
+    """
+    设置列定义的压缩编码：已有CODEC(...)则替换，否则插入到TTL子句之前（无TTL时追加到末尾）
+    :param codec: 编码表达式，如'ZSTD(3)'、'Delta, ZSTD(3)'
+    """
+    masked = mask_string_literals(definition)
+    codec_match = re.search(r"\bCODEC\s*\(", masked, re.IGNORECASE)
+    if codec_match:
+        close_pos = find_matching_paren(masked, codec_match.end() - 1)
+        return f"{definition[:codec_match.start()]}CODEC({codec}){definition[close_pos + 1:]}"
+    ttl_match = re.search(r"\s+TTL\s+", masked, re.IGNORECASE)
+    if ttl_match:
+        return f"{definition[:ttl_match.start()]} CODEC({codec}){definition[ttl_match.start():]}"
+    return f"{definition} CODEC({codec})"
+
+def get_definition_name(definition: str) -> Optional[str]:
+    """解析索引、投影、约束定义中的名称（去除反引号），列定义返回None"""
+    match = re.match(r"\s*(?:INDEX|PROJECTION|CONSTRAINT)\s+(`[^`]+`|[^\s(]+)", definition, re.IGNORECASE)
+    if not match:
+        return None
+    return match.group(1).strip("`")
+
+def strip_definitions(create_sql: str, kinds: Tuple[str, ...]) -> Tuple[str, List[str]]:
+    """
+    从建表语句的列定义块中移除指定类型的元素
+    :param kinds: 元素类型，如('index', 'projection')
+    :return: (新建表语句, 被移除的元素定义列表)
+    """
+    kept = []
+    removed = []
+    for definition in split_column_definitions(create_sql):
+        if get_definition_kind(definition) in kinds:
+            removed.append(definition)
+        else:
+            kept.append(definition)
+    if not removed:
+        return create_sql, []
+    return replace_column_definitions(create_sql, kept), removed
+
+def find_table_ttl(create_sql: str) -> Tuple[int, int]:
+    """
+    定位建表语句中的表级TTL表达式（列定义块之后、SETTINGS/COMMENT之前）
+    :return: (起始下标, 结束下标)，无TTL时返回(-1, 插入位置)
+    """
+    _, close_pos = find_columns_block(create_sql)
+    offset = close_pos + 1
+    masked = mask_string_literals(create_sql[offset:])
+    match = re.search(r"\bTTL\b\s+(.*?)\s*(?=\bSETTINGS\b|\bCOMMENT\b|$)", masked, re.IGNORECASE | re.DOTALL)
+    if match:
+        return offset + match.start(1), offset + match.end(1)
+    tail_match = re.search(r"\s*(?=\bSETTINGS\b|\bCOMMENT\b|$)", masked, re.IGNORECASE)
+    return -1, offset + tail_match.start()
+
+def get_table_ttl(create_sql: str) -> Optional[str]:
+    """解析建表语句中的表级TTL表达式，无TTL返回None"""
+    start, end = find_table_ttl(create_sql)
+    if start < 0:
+        return None
+    return create_sql[start:end].strip()
+
+def set_table_ttl(create_sql: str, ttl: str) -> str:
+    """设置建表语句的表级TTL：已有则替换，否则插入到SETTINGS/COMMENT之前"""
+    start, end = find_table_ttl(create_sql)
+    if start < 0:
+        return f"{create_sql[:end]} TTL {ttl}{create_sql[end:]}"
+    return f"{create_sql[:start]}{ttl}{create_sql[end:]}"
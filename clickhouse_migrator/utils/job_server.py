@@ -0,0 +1,116 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+DEFAULT_DAEMON_HOST = "127.0.0.1"
+DEFAULT_DAEMON_PORT = 8790
+DEFAULT_JOB_CONCURRENCY = 2
+# 任务请求体大小上限（字节）
+MAX_REQUEST_BYTES = 1024 * 1024
+
+class JobServer:
+    """
+    守护进程的本地任务接口（HTTP/JSON）
+    - POST /jobs            提交迁移任务，请求体为任务配置（JSON对象），返回任务信息
+    - GET  /jobs            任务列表（不含结果明细）
+    - GET  /jobs/<任务编号>  任务状态与结果
+    - POST /jobs/<任务编号>/cancel  取消排队中的任务（执行中的任务通过控制文件排空，resume解除排空）
+    - GET  /status          迁移进度、运行控制与任务队列状态
+    """
+
+    def __init__(self, daemon, port: int = DEFAULT_DAEMON_PORT, host: str = DEFAULT_DAEMON_HOST):
+        """
+        :param daemon: 提供submit/cancel/get_job/list_jobs/status的守护进程对象
+        :param port: 监听端口
+        :param host: 监听地址（默认仅本机）
+        """
+        self.daemon = daemon
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self, logger):
+        """在后台线程中启动任务接口"""
+        daemon = self.daemon
+
+        class Handler(BaseHTTPRequestHandler):
+            def send_json(self, code: int, payload):
+                body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def route(self) -> list:
+                return [part for part in self.path.split("?", 1)[0].split("/") if part]
+
+            def do_GET(self):
+                parts = self.route()
+                if parts == ["status"]:
+                    self.send_json(200, daemon.status())
+                elif parts == ["jobs"]:
+                    self.send_json(200, daemon.list_jobs())
+                elif len(parts) == 2 and parts[0] == "jobs":
+                    job = daemon.get_job(parts[1])
+                    if job is None:
+                        self.send_json(404, {"error": f"任务{parts[1]}不存在"})
+                    else:
+                        self.send_json(200, job)
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                parts = self.route()
+                if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+                    error = daemon.cancel(parts[1])
+                    self.send_json(409 if error else 200, {"error": error} if error else daemon.get_job(parts[1]))
+                    return
+                if parts != ["jobs"]:
+                    self.send_error(404)
+                    return
+                request = self.read_json()
+                if request is None:
+                    return
+                job, error = daemon.submit(request)
+                if error:
+                    self.send_json(400, {"error": error})
+                else:
+                    self.send_json(201, job)
+
+            def read_json(self) -> Optional[Dict]:
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > MAX_REQUEST_BYTES:
+                    self.send_json(413, {"error": "请求体过大"})
+                    return None
+                try:
+                    request = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+                except ValueError as e:
+                    self.send_json(400, {"error": f"请求体不是合法的JSON：{str(e)}"})
+                    return None
+                if not isinstance(request, dict):
+                    self.send_json(400, {"error": "请求体必须是JSON对象"})
+                    return None
+                return request
+
+            def log_message(self, format, *args):
+                # 避免访问日志刷屏
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            raise RuntimeError(f"任务接口启动失败（{self.host}:{self.port}）：{str(e)}")
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="job-server", daemon=True)
+        self.thread.start()
+        logger.info(f"任务接口已启动：http://{self.host}:{self.port}/jobs")
+
+    def stop(self):
+        """停止任务接口"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,228 @@
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional
+
+# tracemalloc保留的调用栈深度
+TRACEMALLOC_FRAMES = 10
+# tracemalloc报告输出的分配点数量
+TRACEMALLOC_TOP = 30
+
+class _Span:
+    """进行中的计时区间"""
+    __slots__ = ("name", "args", "is_phase", "wall_start", "cpu_start", "mem_start", "children_wall")
+
+    def __init__(self, name: str, args: Dict, is_phase: bool, mem_start: int):
+        self.name = name
+        self.args = args
+        self.is_phase = is_phase
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        self.mem_start = mem_start
+        self.children_wall = 0.0
+
+class Profiler:
+    """
+    客户端性能剖析：按阶段记录墙钟时间、线程CPU时间与内存增量（tracemalloc），
+    可选cProfile函数级剖析；输出各阶段汇总与火焰图折叠栈（flamegraph.pl / speedscope可直接读取）
+    配置时间线记录器时，每个结束的区间同时写入时间线
+    未启用剖析且未配置时间线时所有接口均为空操作
+    """
+
+    def __init__(self, enabled: bool = False, use_cprofile: bool = False, use_tracemalloc: bool = False,
+                 tracer=None):
+        """
+        :param enabled: 是否汇总各阶段耗时并在finish时输出剖析结果
+        :param tracer: 时间线记录器（TraceRecorder），None表示不记录时间线
+        """
+        self.collect = enabled
+        self.tracer = tracer
+        self.enabled = enabled or tracer is not None
+        self.use_cprofile = enabled and use_cprofile
+        self.use_tracemalloc = enabled and use_tracemalloc
+        self.phases = {}
+        self.folded = {}
+        self.profiles = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        if self.use_tracemalloc:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def begin(self, name: str, is_phase: bool = False, **args) -> Optional[_Span]:
+        """开始计时区间，返回区间标识（未启用时返回None）"""
+        if not self.enabled:
+            return None
+        mem_start = tracemalloc.get_traced_memory()[0] if self.use_tracemalloc else 0
+        span = _Span(name, args, is_phase, mem_start)
+        self._stack().append(span)
+        return span
+
+    def end(self, span: Optional[_Span]):
+        """结束计时区间（同时结束其内部尚未结束的区间）"""
+        if span is None:
+            return
+        stack = self._stack()
+        if span not in stack:
+            return
+        while stack:
+            current = stack.pop()
+            self._close(current, stack)
+            if current is span:
+                break
+
+    def phase(self, name: str, **args):
+        """切换到新阶段：结束当前层级进行中的阶段并开始新阶段"""
+        if not self.enabled:
+            return
+        self.end_phase()
+        self.begin(name, is_phase=True, **args)
+
+    def end_phase(self):
+        """结束当前层级进行中的阶段"""
+        if not self.enabled:
+            return
+        stack = self._stack()
+        if stack and stack[-1].is_phase:
+            self._close(stack.pop(), stack)
+
+    @contextmanager
+    def span(self, name: str, **args):
+        """计时区间上下文"""
+        token = self.begin(name, **args)
+        try:
+            yield token
+        finally:
+            self.end(token)
+
+    def instant(self, name: str, **args):
+        """记录瞬时事件（仅写入时间线）"""
+        if self.tracer is not None:
+            self.tracer.instant(name, args=args)
+
+    def _close(self, span: _Span, parents):
+        wall = time.perf_counter() - span.wall_start
+        if parents:
+            parents[-1].children_wall += wall
+        if self.tracer is not None:
+            self.tracer.complete(span.name, "phase" if span.is_phase else "span", span.wall_start, wall, span.args)
+        if not self.collect:
+            return
+        cpu = time.thread_time() - span.cpu_start
+        mem = tracemalloc.get_traced_memory()[0] - span.mem_start if self.use_tracemalloc else 0
+        folded_key = ";".join([p.name for p in parents] + [span.name])
+        with self._lock:
+            stats = self.phases.setdefault(span.name, {"count": 0, "wall": 0.0, "cpu": 0.0, "mem_delta_max": 0})
+            stats["count"] += 1
+            stats["wall"] += wall
+            stats["cpu"] += cpu
+            stats["mem_delta_max"] = max(stats["mem_delta_max"], mem)
+            # 折叠栈按自身耗时（微秒）计数，子区间耗时计入子栈
+            self.folded[folded_key] = self.folded.get(folded_key, 0) + int(max(wall - span.children_wall, 0) * 1000000)
+
+    def start_thread_profile(self) -> bool:
+        """
+        在当前线程启用cProfile，结果在finish时合并
+        :return: 是否新启用（同一线程已启用或未开启cProfile时返回False）
+        """
+        if not self.use_cprofile or getattr(self._local, "profile", None) is not None:
+            return False
+        self._local.profile = cProfile.Profile()
+        self._local.profile.enable()
+        return True
+
+    def stop_thread_profile(self):
+        """停止当前线程的cProfile"""
+        profile = getattr(self._local, "profile", None)
+        if profile is None:
+            return
+        profile.disable()
+        self._local.profile = None
+        with self._lock:
+            self.profiles.append(profile)
+
+    @contextmanager
+    def profile_thread(self):
+        """在当前线程启用cProfile的上下文（同一线程已启用时为空操作）"""
+        started = self.start_thread_profile()
+        try:
+            yield
+        finally:
+            if started:
+                self.stop_thread_profile()
+
+    def summary(self) -> Dict:
+        """各阶段汇总（墙钟秒数、CPU秒数、调用次数、最大内存增量）"""
+        with self._lock:
+            return {
+                name: {
+                    "count": stats["count"],
+                    "wall_seconds": round(stats["wall"], 4),
+                    "cpu_seconds": round(stats["cpu"], 4),
+                    "avg_wall_seconds": round(stats["wall"] / stats["count"], 6),
+                    "mem_delta_max_bytes": stats["mem_delta_max"]
+                }
+                for name, stats in sorted(self.phases.items(), key=lambda item: -item[1]["wall"])
+            }
+
+    def finish(self, output_dir: str, logger) -> Optional[Dict]:
+        """
+        输出剖析结果到报告目录，并关闭时间线记录器
+        :return: 输出文件路径字典（未启用剖析时返回None）
+        """
+        if self.tracer is not None:
+            self.tracer.close()
+            logger.info(f"时间线已输出：{self.tracer.path}（{self.tracer.events}个事件），可使用Perfetto打开")
+        if not self.collect:
+            return None
+        prefix = os.path.join(output_dir, f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        files = {"summary": f"{prefix}_phases.json", "folded": f"{prefix}.folded"}
+        summary = self.summary()
+        with open(files["summary"], "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        with self._lock:
+            folded = dict(self.folded)
+            profiles = list(self.profiles)
+        with open(files["folded"], "w", encoding="utf-8") as f:
+            for stack, micros in sorted(folded.items()):
+                if micros > 0:
+                    f.write(f"{stack} {micros}\n")
+        if profiles:
+            files["cprofile"] = f"{prefix}.prof"
+            files["cprofile_text"] = f"{prefix}_cprofile.txt"
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(files["cprofile"])
+            with open(files["cprofile_text"], "w", encoding="utf-8") as f:
+                pstats.Stats(files["cprofile"], stream=f).sort_stats("cumulative").print_stats(50)
+        if self.use_tracemalloc:
+            files["tracemalloc"] = f"{prefix}_tracemalloc.txt"
+            current, peak = tracemalloc.get_traced_memory()
+            top_stats = tracemalloc.take_snapshot().statistics("traceback")[:TRACEMALLOC_TOP]
+            with open(files["tracemalloc"], "w", encoding="utf-8") as f:
+                f.write(f"current={current} peak={peak}\n\n")
+                for stat in top_stats:
+                    f.write(f"{stat.size} bytes in {stat.count} blocks\n")
+                    f.write("\n".join(stat.traceback.format()) + "\n\n")
+            tracemalloc.stop()
+
+        logger.info("客户端剖析（按墙钟时间排序）：")
+        for name, stats in list(summary.items())[:15]:
+            logger.info(
+                f"  {name}：{stats['count']}次，墙钟{stats['wall_seconds']}秒，CPU {stats['cpu_seconds']}秒，"
+                f"最大内存增量{stats['mem_delta_max_bytes']}字节"
+            )
+        logger.info(f"剖析结果已输出：{files}")
+        return files
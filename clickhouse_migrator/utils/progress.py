@@ -1,8 +1,15 @@
 import json
 import os
-from typing import Dict
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
 
 PROGRESS_FILE = "migration_progress.json"
+# 全局吞吐滑动窗口大小（最近N个分区完成事件）
+RATE_WINDOW_SIZE = 50
+# 表级吞吐指数移动平均系数
+EWMA_ALPHA = 0.3
 
 def load_progress() -> Dict:
     """加载迁移进度文件"""
@@ -19,3 +26,239 @@ def save_progress(progress: Dict):
 def get_progress_file_path() -> str:
     """获取进度文件路径"""
     return os.path.abspath(PROGRESS_FILE)
+
+def format_bytes(num_bytes: float) -> str:
+    """将字节数格式化为易读的字符串（如1.50 GiB）"""
+    value = float(num_bytes)
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if abs(value) < 1024 or unit == "TiB":
+            return f"{value:.2f} {unit}"
+        value /= 1024
+
+def format_duration(seconds: Optional[float]) -> str:
+    """将秒数格式化为易读的时长（如2h05m），未知时返回'--'"""
+    if seconds is None:
+        return "--"
+    seconds = int(seconds)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    if minutes:
+        return f"{minutes}m{secs:02d}s"
+    return f"{secs}s"
+
+class ProgressTracker:
+    """
+    按字节加权的迁移进度跟踪器（线程安全）
+    每次更新为O(1)，不保存分区明细，分区数达到十万级时开销仍可忽略
+    字节总量按运行（守护进程中为任务编号，单次运行为空字符串）分别统计，并发任务互不覆盖；
+    运行结束后调用finish_run移除其表，长期运行的守护进程只保留执行中任务的表
+    """
+
+    def __init__(self, window: int = RATE_WINDOW_SIZE, alpha: float = EWMA_ALPHA):
+        """
+        :param window: 全局吞吐滑动窗口的分区完成事件数
+        :param alpha: 表级吞吐指数移动平均系数
+        """
+        self.alpha = alpha
+        self.started_at = time.time()
+        # 历史吞吐（字节/秒），本次运行尚无完成事件时用于估算剩余时间
+        self.prior_rate = None
+        # {运行标识: {"total_bytes": 待迁移总字节数, "done_bytes": 已完成字节数, "started_at": 开始时间}}
+        self.runs = {}
+        self.tables = {}
+        self.workers = {}
+        self._events = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def _run(self, run_id: str) -> Dict:
+        """获取运行的统计（调用方持有锁），不存在时创建"""
+        run = self.runs.get(run_id)
+        if run is None:
+            run = self.runs[run_id] = {"total_bytes": 0, "done_bytes": 0, "started_at": time.time()}
+        return run
+
+    def register_run(self, total_bytes: int, run_id: str = ""):
+        """
+        登记一次运行的待迁移总字节数（整库迁移开始前一次性登记）
+        :param run_id: 运行标识（守护进程中为任务编号）
+        """
+        with self._lock:
+            self._run(run_id)["total_bytes"] = total_bytes
+
+    def finish_run(self, run_id: str = ""):
+        """运行结束：移除该运行及其表的进度（守护进程中每个任务结束后调用）"""
+        with self._lock:
+            self.runs.pop(run_id, None)
+            for name in [name for name, state in self.tables.items() if state["run_id"] == run_id]:
+                del self.tables[name]
+
+    def set_prior_rate(self, rate: Optional[float]):
+        """设置历史吞吐（字节/秒）"""
+        with self._lock:
+            self.prior_rate = rate
+
+    def register_table(self, db: str, table: str, total_bytes: int, total_partitions: int, planned: bool = False,
+                       prior_rate: Optional[float] = None, run_id: str = ""):
+        """
+        登记表的待迁移字节数和分区数
+        :param planned: 运行总字节数已包含该表（register_run时已计入）
+        :param prior_rate: 该表的历史吞吐（字节/秒），作为指数移动平均的初值
+        :param run_id: 表所属的运行标识
+        """
+        with self._lock:
+            self.tables[f"{db}.{table}"] = {
+                "total_bytes": total_bytes,
+                "done_bytes": 0,
+                "total_partitions": total_partitions,
+                "done_partitions": 0,
+                "rate": prior_rate,
+                "status": "running",
+                "started_at": time.time(),
+                "run_id": run_id
+            }
+            run = self._run(run_id)
+            if not planned:
+                run["total_bytes"] += total_bytes
+
+    def start_partition(self, db: str, table: str, partition: str, partition_bytes: int):
+        """记录当前工作线程开始处理的分区"""
+        with self._lock:
+            self.workers[threading.current_thread().name] = {
+                "table": f"{db}.{table}",
+                "partition": partition,
+                "bytes": partition_bytes,
+                "phase": "copy",
+                "started_at": time.time()
+            }
+
+    def set_phase(self, phase: str):
+        """更新当前工作线程所处阶段（copy/validate/drop等）"""
+        with self._lock:
+            state = self.workers.get(threading.current_thread().name)
+            if state is not None:
+                state["phase"] = phase
+
+    def finish_partition(self, db: str, table: str, partition_bytes: int):
+        """记录分区完成，更新表级、所属运行和全局吞吐"""
+        now = time.time()
+        with self._lock:
+            worker = self.workers.pop(threading.current_thread().name, None)
+            elapsed = max(now - worker["started_at"], 0.001) if worker else None
+            table_state = self.tables.get(f"{db}.{table}")
+            if table_state is not None:
+                table_state["done_bytes"] += partition_bytes
+                table_state["done_partitions"] += 1
+                if elapsed:
+                    rate = partition_bytes / elapsed
+                    previous = table_state["rate"]
+                    table_state["rate"] = rate if previous is None else self.alpha * rate + (1 - self.alpha) * previous
+                run = self.runs.get(table_state["run_id"])
+                if run is not None:
+                    run["done_bytes"] += partition_bytes
+            self._events.append((now, partition_bytes))
+
+    def finish_table(self, db: str, table: str, status: str):
+        """记录表迁移结束"""
+        with self._lock:
+            table_state = self.tables.get(f"{db}.{table}")
+            if table_state is not None:
+                table_state["status"] = status
+            self.workers.pop(threading.current_thread().name, None)
+
+    def _global_rate(self, now: float) -> Optional[float]:
+        """全局吞吐：最近若干次分区完成事件的字节数 / 时间跨度"""
+        if not self._events:
+            return None
+        oldest = self._events[0][0] if len(self._events) > 1 else self.started_at
+        span = now - oldest
+        if span <= 0:
+            return None
+        window_bytes = sum(b for _, b in self._events) if len(self._events) == 1 \
+            else sum(b for _, b in list(self._events)[1:])
+        return window_bytes / span
+
+    def _describe_table(self, state: Dict, global_rate: Optional[float]) -> Dict:
+        """表的进度描述（调用方持有锁）"""
+        table_remaining = max(state["total_bytes"] - state["done_bytes"], 0)
+        rate = state["rate"] or global_rate
+        return {
+            "status": state["status"],
+            "done_bytes": state["done_bytes"],
+            "total_bytes": state["total_bytes"],
+            "done_partitions": state["done_partitions"],
+            "total_partitions": state["total_partitions"],
+            "percent": round(100.0 * state["done_bytes"] / state["total_bytes"], 2) if state["total_bytes"] else 100.0,
+            "rate_bytes_per_second": round(rate, 2) if rate else None,
+            "eta_seconds": round(table_remaining / rate, 1) if rate and state["status"] == "running" else None
+        }
+
+    def _describe_run(self, run: Dict, rate: Optional[float]) -> Dict:
+        """运行的进度描述（调用方持有锁）"""
+        remaining = max(run["total_bytes"] - run["done_bytes"], 0)
+        return {
+            "done_bytes": run["done_bytes"],
+            "total_bytes": run["total_bytes"],
+            "percent": round(100.0 * run["done_bytes"] / run["total_bytes"], 2) if run["total_bytes"] else 0.0,
+            "rate_bytes_per_second": round(rate, 2) if rate else None,
+            "eta_seconds": round(remaining / rate, 1) if rate else None
+        }
+
+    def snapshot(self) -> Dict:
+        """返回进度快照（用于JSON状态接口），总量为所有执行中运行之和，runs为各任务的进度"""
+        now = time.time()
+        with self._lock:
+            global_rate = self._global_rate(now) or self.prior_rate
+            total = {
+                "total_bytes": sum(run["total_bytes"] for run in self.runs.values()),
+                "done_bytes": sum(run["done_bytes"] for run in self.runs.values())
+            }
+            snapshot = {"elapsed_seconds": round(now - self.started_at, 1)}
+            snapshot.update(self._describe_run(total, global_rate))
+            if any(self.runs):
+                snapshot["runs"] = {
+                    run_id: self._describe_run(run, self._run_rate(run_id, global_rate))
+                    for run_id, run in self.runs.items()
+                }
+            snapshot["tables"] = {name: self._describe_table(state, global_rate) for name, state in self.tables.items()}
+            snapshot["workers"] = {
+                name: dict(state, elapsed=round(now - state["started_at"], 1))
+                for name, state in self.workers.items()
+            }
+            return snapshot
+
+    def _run_rate(self, run_id: str, global_rate: Optional[float]) -> Optional[float]:
+        """
+        运行的吞吐：只有一个运行时为全局吞吐，多个任务并发时为该任务执行中各表吞吐之和（调用方持有锁）
+        """
+        if len(self.runs) <= 1:
+            return global_rate
+        rates = [state["rate"] for state in self.tables.values()
+                 if state["run_id"] == run_id and state["status"] == "running" and state["rate"]]
+        return sum(rates) if rates else None
+
+    def status_line(self, db: str = None, table: str = None) -> str:
+        """返回紧凑的单行进度描述，指定表时同时包含该表及其所属运行的进度（不遍历其他表）"""
+        now = time.time()
+        with self._lock:
+            global_rate = self._global_rate(now) or self.prior_rate
+            table_state = self.tables.get(f"{db}.{table}") if table else None
+            run_id = table_state["run_id"] if table_state else ""
+            run = self.runs.get(run_id) or {"total_bytes": 0, "done_bytes": 0}
+            progress = self._describe_run(run, self._run_rate(run_id, global_rate))
+            table_progress = self._describe_table(table_state, global_rate) if table_state else None
+            worker_count = len(self.workers)
+        line = (
+            f"{'任务' + run_id if run_id else '总'}进度{progress['percent']:.1f}%"
+            f"（{format_bytes(progress['done_bytes'])}/{format_bytes(progress['total_bytes'])}），"
+            f"吞吐{format_bytes(progress['rate_bytes_per_second'] or 0)}/s，剩余{format_duration(progress['eta_seconds'])}，"
+            f"工作线程{worker_count}"
+        )
+        if table_progress:
+            line = (
+                f"{db}.{table}：{table_progress['percent']:.1f}%"
+                f"（{table_progress['done_partitions']}/{table_progress['total_partitions']}分区），"
+                f"剩余{format_duration(table_progress['eta_seconds'])}；" + line
+            )
+        return line
@@ -0,0 +1,105 @@
+import random
+import re
+import time
+from typing import Callable, Dict, Optional
+
+# 可重试的ClickHouse错误码（网络抖动、S3临时错误、服务端繁忙等瞬时故障）
+RETRYABLE_ERROR_CODES = {
+    3,     # UNEXPECTED_END_OF_FILE
+    32,    # ATTEMPT_TO_READ_AFTER_EOF
+    159,   # TIMEOUT_EXCEEDED
+    202,   # TOO_MANY_SIMULTANEOUS_QUERIES
+    209,   # SOCKET_TIMEOUT
+    210,   # NETWORK_ERROR
+    241,   # MEMORY_LIMIT_EXCEEDED
+    242,   # TABLE_IS_READ_ONLY
+    252,   # TOO_MANY_PARTS
+    319,   # UNKNOWN_STATUS_OF_INSERT
+    425,   # SYSTEM_ERROR
+    499,   # S3_ERROR
+    999,   # KEEPER_EXCEPTION
+    1000,  # POCO_EXCEPTION
+}
+
+# 无错误码时按错误信息识别的瞬时故障
+RETRYABLE_MESSAGE_PATTERNS = [
+    r"connection (reset|refused|aborted)",
+    r"broken pipe",
+    r"timed? ?out",
+    r"remote end closed connection",
+    r"\b50[234]\b",
+    r"slow ?down",
+    r"service unavailable",
+]
+
+# 可重试的Python异常类型名（避免直接依赖驱动的异常类）
+RETRYABLE_EXCEPTION_TYPES = {"OperationalError", "ConnectionError", "TimeoutError",
+                             "ConnectionResetError", "BrokenPipeError", "timeout"}
+
+ERROR_CODE_PATTERN = re.compile(r"Code:\s*(\d+)")
+
+class RetryPolicy:
+    """重试策略：指数退避+随机抖动，按ClickHouse错误码区分可重试错误"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 2.0, max_delay: float = 60.0, jitter: float = 0.5):
+        """
+        :param max_attempts: 最大尝试次数（含首次执行）
+        :param base_delay: 首次重试的基础等待时间（秒）
+        :param max_delay: 单次等待时间上限（秒）
+        :param jitter: 抖动比例（0~1），实际等待时间在[delay*(1-jitter), delay]之间随机
+        """
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = min(max(jitter, 0.0), 1.0)
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "RetryPolicy":
+        """根据配置字典创建重试策略"""
+        return cls(
+            max_attempts=config.get("max_retries", 3),
+            base_delay=config.get("retry_base_delay", 2.0),
+            max_delay=config.get("retry_max_delay", 60.0)
+        )
+
+    @staticmethod
+    def get_error_code(error: Exception) -> Optional[int]:
+        """从异常信息中解析ClickHouse错误码（如'Code: 499'）"""
+        match = ERROR_CODE_PATTERN.search(str(error))
+        return int(match.group(1)) if match else None
+
+    def is_retryable(self, error: Exception) -> bool:
+        """判断异常是否为可重试的瞬时故障"""
+        code = self.get_error_code(error)
+        if code is not None:
+            return code in RETRYABLE_ERROR_CODES
+        if type(error).__name__ in RETRYABLE_EXCEPTION_TYPES:
+            return True
+        message = str(error).lower()
+        return any(re.search(pattern, message) for pattern in RETRYABLE_MESSAGE_PATTERNS)
+
+    def get_delay(self, attempt: int) -> float:
+        """计算第attempt次失败后的等待时间（秒）"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return delay * (1 - self.jitter * random.random())
+
+    def call(self, func: Callable[[int], object], logger, label: str = ""):
+        """
+        按重试策略执行操作
+        :param func: 待执行的操作，参数为当前尝试次数（从1开始），便于重试前做状态核对
+        :param label: 日志中展示的操作描述
+        :return: 操作返回值
+        """
+        attempt = 1
+        while True:
+            try:
+                return func(attempt)
+            except Exception as e:
+                if attempt >= self.max_attempts or not self.is_retryable(e):
+                    raise
+                delay = self.get_delay(attempt)
+                logger.warning(
+                    f"{label}失败（第{attempt}/{self.max_attempts}次）：{str(e)}，{delay:.1f}秒后重试"
+                )
+                time.sleep(delay)
+                attempt += 1
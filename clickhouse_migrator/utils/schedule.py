@@ -0,0 +1,83 @@
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+class MaintenanceWindow:
+    """
+    维护时间窗口（类cron写法：[星期] HH:MM-HH:MM）
+    示例：'22:00-06:00'（每天）、'mon-fri 01:00-05:00'、'sat,sun 00:00-23:59'、'* 23:00-04:00'
+    结束时间早于开始时间表示跨天窗口，窗口归属于开始时间所在的那一天
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression.strip()
+        match = re.match(r"^(?:(\S+)\s+)?(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})$", self.expression)
+        if not match:
+            raise RuntimeError(f"维护窗口格式错误：{expression}（示例：mon-fri 22:00-06:00）")
+        self.days = self._parse_days(match.group(1) or "*")
+        self.start_minute = int(match.group(2)) * 60 + int(match.group(3))
+        self.end_minute = int(match.group(4)) * 60 + int(match.group(5))
+        if self.start_minute >= 24 * 60 or self.end_minute > 24 * 60:
+            raise RuntimeError(f"维护窗口时间超出范围：{expression}")
+
+    @staticmethod
+    def _parse_days(field: str) -> List[int]:
+        """解析星期字段（*、mon-fri、sat,sun、0-6，0表示周一）"""
+        if field == "*":
+            return list(range(7))
+        days = set()
+        for item in field.lower().split(","):
+            bounds = item.split("-")
+            indexes = [WEEKDAYS.index(b) if b in WEEKDAYS else int(b) for b in bounds]
+            if len(indexes) == 1:
+                days.add(indexes[0] % 7)
+            else:
+                day = indexes[0]
+                while True:
+                    days.add(day % 7)
+                    if day % 7 == indexes[1] % 7:
+                        break
+                    day += 1
+        return sorted(days)
+
+    def is_open(self, now: datetime) -> bool:
+        """判断给定时间是否处于窗口内"""
+        minute = now.hour * 60 + now.minute
+        weekday = now.weekday()
+        if self.start_minute <= self.end_minute:
+            return weekday in self.days and self.start_minute <= minute < self.end_minute
+        # 跨天窗口：当天开始部分，或前一天开始、延续到今天的部分
+        if weekday in self.days and minute >= self.start_minute:
+            return True
+        return (weekday - 1) % 7 in self.days and minute < self.end_minute
+
+    def next_open(self, now: datetime) -> datetime:
+        """返回下一次窗口开启的时间（当前已在窗口内时返回now）"""
+        if self.is_open(now):
+            return now
+        day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        for offset in range(8):
+            candidate = day_start + timedelta(days=offset, minutes=self.start_minute)
+            if candidate > now and candidate.weekday() in self.days:
+                return candidate
+        raise RuntimeError(f"维护窗口{self.expression}无可用时间")
+
+class WindowSchedule:
+    """多个维护窗口的组合（任一窗口开启即可执行），未配置窗口时始终开启"""
+
+    def __init__(self, expressions: Optional[List[str]] = None):
+        self.windows = [MaintenanceWindow(e) for e in (expressions or [])]
+
+    def is_open(self, now: Optional[datetime] = None) -> bool:
+        if not self.windows:
+            return True
+        now = now or datetime.now()
+        return any(w.is_open(now) for w in self.windows)
+
+    def next_open(self, now: Optional[datetime] = None) -> datetime:
+        now = now or datetime.now()
+        if not self.windows:
+            return now
+        return min(w.next_open(now) for w in self.windows)
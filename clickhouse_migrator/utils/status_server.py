@@ -0,0 +1,62 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict
+
+class StatusServer:
+    """
+    本地只读进度状态接口（GET /status 返回JSON）
+    仅用于观察运行状态，不提供任何控制能力
+    """
+
+    def __init__(self, snapshot_func: Callable[[], Dict], port: int, host: str = "127.0.0.1"):
+        """
+        :param snapshot_func: 返回状态字典的函数
+        :param port: 监听端口
+        :param host: 监听地址（默认仅本机）
+        """
+        self.snapshot_func = snapshot_func
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self, logger):
+        """在后台线程中启动状态接口"""
+        snapshot_func = self.snapshot_func
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/status"):
+                    self.send_error(404)
+                    return
+                try:
+                    body = json.dumps(snapshot_func(), ensure_ascii=False, default=str).encode("utf-8")
+                except Exception as e:
+                    self.send_error(500, str(e))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # 避免访问日志刷屏
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            raise RuntimeError(f"进度状态接口启动失败（{self.host}:{self.port}）：{str(e)}")
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="status-server", daemon=True)
+        self.thread.start()
+        logger.info(f"进度状态接口已启动：http://{self.host}:{self.port}/status")
+
+    def stop(self):
+        """停止状态接口"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
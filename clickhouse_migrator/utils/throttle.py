@@ -0,0 +1,200 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+# 服务端按查询限速的设置项（是否生效取决于服务端版本，启用前检查system.settings）
+SERVER_BANDWIDTH_SETTINGS = ("max_network_bandwidth", "max_remote_write_network_bandwidth")
+# 待修正记录的保留时长（秒），query_log未启用或刷新延迟过长时到期丢弃
+PENDING_TTL = 600
+# 按复制开始时间限定query_log查找范围时预留的时钟偏差（秒）
+QUERY_LOG_CLOCK_SKEW = 300
+
+class TokenBucket:
+    """线程安全的令牌桶（按字节计费，允许透支，透支部分通过等待偿还）"""
+
+    def __init__(self, rate: float, burst_seconds: float = 1.0):
+        """
+        :param rate: 令牌补充速率（字节/秒）
+        :param burst_seconds: 桶容量对应的秒数，容量 = rate * burst_seconds
+        """
+        self.rate = float(rate)
+        self.burst_seconds = burst_seconds
+        self.tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> float:
+        return self.rate * self.burst_seconds
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def set_rate(self, rate: float):
+        """调整令牌补充速率（字节/秒）"""
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def charge(self, amount: float):
+        """扣除amount个令牌（不等待，允许透支）"""
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+
+    def wait_for_credit(self) -> float:
+        """
+        阻塞至透支偿还完毕（令牌不为负）
+        :return: 实际等待时间（秒）
+        """
+        with self._lock:
+            self._refill()
+            wait_time = -self.tokens / self.rate if self.tokens < 0 and self.rate > 0 else 0.0
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
+
+    def acquire(self, amount: float) -> float:
+        """
+        扣除amount个令牌，令牌不足时阻塞至透支偿还完毕
+        :return: 实际等待时间（秒）
+        """
+        self.charge(amount)
+        return self.wait_for_credit()
+
+    def adjust(self, delta: float):
+        """按实测值修正令牌（delta>0表示实际用量多于预扣，额外扣除；<0则返还）"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+class CopyLease:
+    """
+    单次分区复制的带宽租约：携带服务端限速设置，按复制进度（已写入行数占分区行数的比例折算磁盘字节数）
+    逐步扣除令牌，复制成功后扣足分区字节数
+    """
+
+    def __init__(self, bucket: TokenBucket, amount: int, rows: int, settings: Dict[str, int]):
+        self.bucket = bucket
+        self.amount = amount
+        self.rows = rows
+        self.settings = settings
+        self.charged = 0
+
+    def _charge_to(self, target: int):
+        if target > self.charged:
+            self.bucket.charge(target - self.charged)
+            self.charged = target
+
+    def report(self, status: Dict):
+        """复制查询的进度回调（AsyncQueryRunner轮询system.processes时调用）"""
+        if self.rows > 0:
+            self._charge_to(int(self.amount * min(status.get("written_rows", 0) / self.rows, 1.0)))
+
+    def finish(self):
+        """复制成功：扣足分区字节数"""
+        self._charge_to(self.amount)
+
+class BandwidthGovernor:
+    """
+    带宽调控器：进程内所有工作线程共享同一字节预算
+    - 服务端支持时由max_network_bandwidth/max_remote_write_network_bandwidth在查询执行中限速，
+      每次复制开始时按当前并发复制数重新均分预算；
+    - 令牌桶按实际写入进度扣费（不预先扣除整个分区），只在累计用量超出预算（如服务端不支持限速，
+      或已运行的复制仍持有均分前的较大份额）时让后续复制等待
+    """
+
+    def __init__(self, limit_bytes_per_second: float, burst_seconds: float = 1.0):
+        self.limit = float(limit_bytes_per_second)
+        self.bucket = TokenBucket(self.limit, burst_seconds)
+        self.active_copies = 0
+        # 已成功完成、待按query_log实测值修正的复制：{query_id: (扣除字节数, 完成时间, 开始时的时间戳)}
+        self._pending = {}
+        self._server_settings = None
+        self._lock = threading.Lock()
+
+    def set_limit(self, limit_bytes_per_second: float):
+        """调整带宽预算（字节/秒）"""
+        self.limit = float(limit_bytes_per_second)
+        self.bucket.set_rate(self.limit)
+
+    def get_supported_settings(self, client) -> List[str]:
+        """检查服务端支持的限速设置（仅首次查询）"""
+        if self._server_settings is None:
+            names = ", ".join(f"'{name}'" for name in SERVER_BANDWIDTH_SETTINGS)
+            result = client.query(f"SELECT name FROM system.settings WHERE name IN ({names})")
+            self._server_settings = [row[0] for row in result.result_rows]
+        return self._server_settings
+
+    def apply_feedback(self, client, logger):
+        """
+        根据system.query_log中S3实际写入字节数（WriteBufferFromS3Bytes，与bytes_on_disk同为压缩后字节）修正令牌桶
+        服务端未记录该指标的查询不做修正；超过PENDING_TTL仍未查到的记录直接丢弃
+        复制的query_id是确定性的，query_log中可能有以往运行或重试的同名记录：按最早开始时间限定扫描范围，
+        每个query_id只取最新一条
+        """
+        now = time.monotonic()
+        with self._lock:
+            for query_id in [q for q, (_, finished_at, _) in self._pending.items() if now - finished_at > PENDING_TTL]:
+                del self._pending[query_id]
+            pending = dict(self._pending)
+        if not pending:
+            return
+        id_list = ", ".join(f"'{query_id}'" for query_id in pending)
+        since = int(min(started_at for _, _, started_at in pending.values()) - QUERY_LOG_CLOCK_SKEW)
+        result = client.query(f"""
+            SELECT query_id, argMax(ProfileEvents['WriteBufferFromS3Bytes'], event_time_microseconds)
+            FROM system.query_log
+            WHERE event_date >= toDate(toDateTime({since})) AND event_time >= toDateTime({since})
+              AND query_id IN ({id_list}) AND type = 'QueryFinish'
+            GROUP BY query_id
+        """)
+        for query_id, actual in result.result_rows:
+            with self._lock:
+                charged = self._pending.pop(query_id, None)
+            if charged is None or not actual:
+                continue
+            self.bucket.adjust(int(actual) - charged[0])
+            logger.debug(f"带宽修正：查询{query_id}按磁盘字节数扣除{charged[0]}字节，S3实测写入{int(actual)}字节")
+
+    @contextmanager
+    def throttle(self, client, amount: int, rows: int, query_id: str, logger):
+        """
+        在预算内执行一次分区复制：等待累计透支偿还后开始，返回带服务端限速设置的租约
+        :param amount: 分区字节数（system.parts.bytes_on_disk）
+        :param rows: 分区行数，用于把复制进度折算为字节数
+        :param query_id: 复制查询的query_id，用于复制成功后按实测值修正
+        """
+        try:
+            self.apply_feedback(client, logger)
+        except Exception as e:
+            logger.debug(f"读取带宽实测值失败：{str(e)}")
+        waited = self.bucket.wait_for_credit()
+        if waited > 0:
+            logger.info(f"带宽限制：等待{waited:.1f}秒后开始复制")
+        with self._lock:
+            self.active_copies += 1
+            per_query = int(self.limit / self.active_copies)
+        settings: Dict[str, int] = {}
+        try:
+            for name in self.get_supported_settings(client):
+                settings[name] = per_query
+        except Exception as e:
+            logger.debug(f"检查服务端限速设置失败：{str(e)}")
+        lease = CopyLease(self.bucket, amount, rows, settings)
+        started_at = time.time()
+        succeeded = False
+        try:
+            yield lease
+            succeeded = True
+        finally:
+            if succeeded:
+                lease.finish()
+            with self._lock:
+                self.active_copies -= 1
+                if succeeded:
+                    self._pending[query_id] = (lease.charged, time.monotonic(), started_at)
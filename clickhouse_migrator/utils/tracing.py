@@ -0,0 +1,107 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+# 距上次刷盘超过该间隔（秒）时刷新文件缓冲，进程异常退出时也能保留大部分事件
+TRACE_FLUSH_INTERVAL = 5
+
+class TraceRecorder:
+    """
+    时间线记录：将计时区间以Chrome Trace Event格式（JSON数组）流式写入文件，
+    可直接用Perfetto（ui.perfetto.dev）或chrome://tracing打开
+    事件逐条追加，内存占用与运行时长无关；未正常结束时文件缺少结尾的"]"，Perfetto仍可读取
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.pid = os.getpid()
+        self.events = 0
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write("[\n")
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._last_flush = time.time()
+        # perf_counter与纪元时间的差值，用于将区间起点换算为绝对时间戳
+        self._epoch_offset = time.time() - time.perf_counter()
+        self.metadata("process_name", {"name": "clickhouse-migrator"})
+
+    def _tid(self) -> int:
+        """当前线程的短编号（首次出现时写入线程名元数据，Perfetto中每个工作线程一行）"""
+        ident = threading.get_ident()
+        tid = self._threads.get(ident)
+        if tid is None:
+            tid = self._threads[ident] = len(self._threads) + 1
+            self._write({
+                "name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid,
+                "args": {"name": threading.current_thread().name}
+            })
+        return tid
+
+    def _write(self, event: Dict):
+        self._file.write(json.dumps(event, ensure_ascii=False, default=str))
+        self._file.write(",\n")
+        self.events += 1
+        if time.time() - self._last_flush >= TRACE_FLUSH_INTERVAL:
+            self._file.flush()
+            self._last_flush = time.time()
+
+    def metadata(self, name: str, args: Dict):
+        """写入进程级元数据事件"""
+        with self._lock:
+            if self._file is not None:
+                self._write({"name": name, "ph": "M", "pid": self.pid, "tid": 0, "args": args})
+
+    def complete(self, name: str, category: str, start: float, duration: float, args: Optional[Dict] = None):
+        """
+        写入完整区间事件（ph=X）
+        :param start: 区间起点（time.perf_counter()）
+        :param duration: 区间时长（秒）
+        """
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((start + self._epoch_offset) * 1000000),
+            "dur": round(duration * 1000000),
+            "pid": self.pid
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            if self._file is not None:
+                event["tid"] = self._tid()
+                self._write(event)
+
+    def instant(self, name: str, category: str = "event", args: Optional[Dict] = None):
+        """写入瞬时事件（ph=i），如暂停、排空等控制指令"""
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "i",
+            "s": "t",
+            "ts": round(time.time() * 1000000),
+            "pid": self.pid
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            if self._file is not None:
+                event["tid"] = self._tid()
+                self._write(event)
+
+    def close(self):
+        """结束JSON数组并关闭文件"""
+        with self._lock:
+            if self._file is None:
+                return
+            # 以进程元数据收尾，避免最后一个事件后的逗号
+            self._file.write(json.dumps({"name": "process_labels", "ph": "M", "pid": self.pid, "tid": 0,
+                                         "args": {"labels": f"{self.events} events"}}))
+            self._file.write("\n]\n")
+            self._file.close()
+            self._file = None